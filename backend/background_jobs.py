@@ -0,0 +1,279 @@
+"""
+Process pool for CPU-heavy jobs (FSRS parameter optimization, workload simulation).
+
+Fitting parameters on a large review history takes seconds to minutes of
+pure computation. Run in the API process it would hold the GIL and stall
+every request, so jobs run in worker processes started with "spawn" (a
+forked child could inherit locks held by the stores' background threads).
+Workers open the stores themselves with the server's database settings
+and read what they need, so large inputs are never pickled across.
+
+Workers report progress through a queue shared by the pool; JobRunner
+applies it to the Job objects whenever they are looked up. A job's
+on_done callback runs in the API process once the job finished, e.g. to
+store the fitted weights.
+
+Short computations that a request waits for (the workload simulation)
+use JobRunner.run instead: a plain future without a Job record or
+progress reports. A job that farms its work out to several workers
+itself (rescheduling) is tracked with JobRunner.start, which runs its
+coordinating function in a thread of the API process.
+"""
+
+import itertools
+import multiprocessing
+import os
+import time
+import traceback
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from queue import Empty
+from threading import Lock
+from typing import Dict, Any, Callable, Optional
+
+import database
+
+# Worker processes; jobs beyond this many wait in the pool's queue
+MAX_WORKERS = min(4, os.cpu_count() or 1)
+
+# Finished jobs remembered for status lookups
+MAX_FINISHED_JOBS = 100
+
+# Set in worker processes by _init_worker
+_progress_queue = None
+
+
+def _init_worker(settings: Dict[str, Any], progress_queue):
+    global _progress_queue
+    database.apply_settings(settings)
+    _progress_queue = progress_queue
+
+
+def report_progress(job_id: int, phase: str, fraction: float):
+    """
+    Reports how far a job got; call from the job function (in the worker
+    process, or in the API process for jobs started with JobRunner.start)
+
+    Args:
+        job_id: The job_id the job function was called with
+        phase: Short name of the current step, e.g. "reading" or "fitting"
+        fraction: Progress of the whole job between 0 and 1
+    """
+    fraction = min(max(fraction, 0.0), 1.0)
+    if _progress_queue is not None:
+        _progress_queue.put((job_id, phase, fraction))
+    else:
+        jobs.set_progress(job_id, phase, fraction)
+
+
+def _run(function: Callable, job_id: int, args: tuple):
+    report_progress(job_id, "started", 0.0)
+    return function(job_id, *args)
+
+
+class Job:
+    """
+    A job submitted to the pool and what is known about it
+    """
+
+    def __init__(self, job_id: int, kind: str, shard: Optional[str]):
+        self.id = job_id
+        self.kind = kind
+        self.shard = shard
+        self.status = "queued"  # "queued", "running", "completed" or "failed"
+        self.phase = None
+        self.progress = 0.0
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "phase": self.phase,
+            "progress": round(self.progress, 4),
+            "result": self.result,
+            "error": self.error,
+            "elapsed_seconds": round((self.finished_at or time.time()) - self.created_at, 3)
+        }
+
+
+class JobRunner:
+    """
+    Submits jobs to a spawn-based process pool and tracks their status
+    """
+
+    def __init__(self, max_workers: int = MAX_WORKERS):
+        self._max_workers = max_workers
+        self._context = multiprocessing.get_context("spawn")
+        self._lock = Lock()
+        self._pool = None
+        self._progress_queue = None
+        # Threads running the coordinating functions of jobs started with start()
+        self._coordinators = None
+        self._ids = itertools.count(1)
+        self._jobs = {}
+        # (kind, shard) -> latest job
+        self._latest = {}
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        """
+        Starts the pool on first use. Caller must hold the lock.
+        """
+        if self._pool is None:
+            self._progress_queue = self._context.Queue()
+            self._pool = ProcessPoolExecutor(
+                max_workers=self._max_workers,
+                mp_context=self._context,
+                initializer=_init_worker,
+                initargs=(database.get_settings(), self._progress_queue)
+            )
+        return self._pool
+
+    def submit(self, kind: str, shard: Optional[str], function: Callable, *args,
+               on_done: Optional[Callable[[Job], None]] = None) -> Job:
+        """
+        Runs function(job_id, *args) in a worker process, unless a job of the
+        same kind is already queued or running for the shard
+
+        Args:
+            kind: Job type, e.g. "optimize"
+            shard: Shard the job works on
+            function: Module-level function (it is pickled by name)
+            on_done: Called with the finished job in this process, after its
+                result or error is set and before it is marked done; may update job.result
+
+        Returns:
+            The new job, or the unfinished one for the same kind and shard
+        """
+        with self._lock:
+            current = self._latest.get((kind, shard))
+            if current is not None and not current.done:
+                return current
+
+            job = Job(next(self._ids), kind, shard)
+            future = self._get_pool().submit(_run, function, job.id, args)
+            self._jobs[job.id] = job
+            self._latest[(kind, shard)] = job
+            self._forget_old_jobs()
+
+        future.add_done_callback(lambda future: self._finish(job, future, on_done))
+        return job
+
+    def start(self, kind: str, shard: Optional[str], function: Callable, *args,
+              on_done: Optional[Callable[[Job], None]] = None) -> Job:
+        """
+        Runs function(job_id, *args) in a thread of this process and tracks it
+        like submit, for jobs that split their work across the pool with run
+
+        Returns:
+            The new job, or the unfinished one for the same kind and shard
+        """
+        with self._lock:
+            current = self._latest.get((kind, shard))
+            if current is not None and not current.done:
+                return current
+
+            job = Job(next(self._ids), kind, shard)
+            self._jobs[job.id] = job
+            self._latest[(kind, shard)] = job
+            self._forget_old_jobs()
+            if self._coordinators is None:
+                self._coordinators = ThreadPoolExecutor(thread_name_prefix="job")
+            future = self._coordinators.submit(_run, function, job.id, args)
+
+        future.add_done_callback(lambda future: self._finish(job, future, on_done))
+        return job
+
+    def run(self, function: Callable, *args) -> Future:
+        """
+        Runs function(*args) in a worker process without tracking it as a job
+
+        Args:
+            function: Module-level function (it is pickled by name); args are pickled too
+
+        Returns:
+            Future of the function's result
+        """
+        with self._lock:
+            return self._get_pool().submit(function, *args)
+
+    def _finish(self, job: Job, future: Future, on_done: Optional[Callable[[Job], None]]):
+        try:
+            job.result = future.result()
+            if on_done is not None:
+                on_done(job)
+            job.progress = 1.0
+            job.status = "completed"
+        except Exception as e:
+            job.error = f"{type(e).__name__}: {e}"
+            job.status = "failed"
+            traceback.print_exc()
+        job.finished_at = time.time()
+
+    def _forget_old_jobs(self):
+        """
+        Drops the oldest finished jobs beyond MAX_FINISHED_JOBS. Caller must hold the lock.
+        """
+        finished = [job_id for job_id, job in self._jobs.items() if job.done]
+        latest = {job.id for job in self._latest.values()}
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            if job_id not in latest:
+                del self._jobs[job_id]
+
+    def _apply_progress(self):
+        """
+        Applies the progress reports that arrived from the workers
+        """
+        if self._progress_queue is None:
+            return
+        while True:
+            try:
+                job_id, phase, fraction = self._progress_queue.get_nowait()
+            except Empty:
+                return
+            self.set_progress(job_id, phase, fraction)
+
+    def set_progress(self, job_id: int, phase: str, fraction: float):
+        """
+        Records a progress report (see report_progress)
+        """
+        job = self._jobs.get(job_id)
+        if job is None or job.done:
+            return
+        job.status = "running"
+        job.phase = phase
+        job.progress = max(job.progress, fraction)
+
+    def get(self, job_id: int) -> Optional[Job]:
+        self._apply_progress()
+        return self._jobs.get(job_id)
+
+    def latest(self, kind: str, shard: Optional[str]) -> Optional[Job]:
+        """
+        Returns the most recent job of a kind for a shard
+        """
+        self._apply_progress()
+        return self._latest.get((kind, shard))
+
+    def shutdown(self):
+        """
+        Stops the pool; queued jobs are cancelled and running ones finish first
+        (a started job fails once its queued work is cancelled)
+        """
+        with self._lock:
+            pool, self._pool = self._pool, None
+            coordinators, self._coordinators = self._coordinators, None
+        if coordinators is not None:
+            coordinators.shutdown(wait=False, cancel_futures=True)
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+
+jobs = JobRunner()
@@ -0,0 +1,97 @@
+"""
+Benchmark: columnar in-memory model
+
+Compares the memory footprint of cards and review logs held as lists of
+dictionaries (what json.load returns) with the columnar tables the JSON
+storage engine keeps resident (see columnar.py), plus the cost of a full
+"which cards are due" scan over each representation.
+
+Usage: python bench_columnar_memory.py [review log counts, default 10000 100000 1000000]
+"""
+
+import gc
+import json
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from bench_data import synthetic_database, START_DATE
+from columnar import CardTable, ReviewLogTable, NULL_INT
+from timestamps import datetime_to_us
+
+def allocated(build):
+    """
+    Returns (result, bytes allocated by build()) measured with tracemalloc
+    """
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+def best_time(function, repeat=3):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def scan_dicts(cards, now):
+    due = []
+    for card in cards:
+        due_date = datetime.fromisoformat(card["fsrs_card"]["due"])
+        if due_date <= now:
+            due.append((due_date, card["id"]))
+    due.sort()
+    return [card_id for _, card_id in due]
+
+def scan_table(table, now):
+    now_us = datetime_to_us(now)
+    due = table.fsrs.due
+    rows = sorted((due_us, row) for row, due_us in enumerate(due) if NULL_INT < due_us <= now_us)
+    return [table.id[row] for _, row in rows]
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+
+    print("📊 Columnar memory benchmark")
+    print("=" * 84)
+    print(f"{'review logs':>12} {'cards':>9} {'model':>8} {'cards MB':>10} {'logs MB':>10} {'total MB':>10} {'due scan ms':>12}")
+    print("-" * 84)
+
+    for size in sizes:
+        # Serialize once so the dict model is measured exactly as json.load builds it
+        raw = json.dumps(synthetic_database(size))
+        now = START_DATE + timedelta(days=size / 1000)
+
+        document, _ = allocated(lambda: json.loads(raw))
+        cards, cards_bytes = allocated(lambda: json.loads(json.dumps(document["cards"])))
+        logs, logs_bytes = allocated(lambda: json.loads(json.dumps(document["review_logs"])))
+        dict_scan = best_time(lambda: scan_dicts(cards, now))
+
+        card_table, table_cards_bytes = allocated(lambda: CardTable.from_dicts(document["cards"]))
+        log_table, table_logs_bytes = allocated(lambda: ReviewLogTable.from_dicts(document["review_logs"]))
+        table_scan = best_time(lambda: scan_table(card_table, now))
+
+        assert card_table.to_dicts() == cards, "card table does not round-trip"
+        assert log_table.to_dicts() == logs, "review log table does not round-trip"
+        assert scan_table(card_table, now) == scan_dicts(cards, now), "due scans disagree"
+
+        dict_total = cards_bytes + logs_bytes
+        table_total = table_cards_bytes + table_logs_bytes
+        print(
+            f"{size:>12,} {len(cards):>9,} {'dicts':>8} {cards_bytes / 1e6:>10.2f} {logs_bytes / 1e6:>10.2f} "
+            f"{dict_total / 1e6:>10.2f} {dict_scan * 1000:>12.1f}"
+        )
+        print(
+            f"{'':>12} {'':>9} {'columns':>8} {table_cards_bytes / 1e6:>10.2f} {table_logs_bytes / 1e6:>10.2f} "
+            f"{table_total / 1e6:>10.2f} {table_scan * 1000:>12.1f}"
+        )
+        print(f"{'':>12} columns use {table_total / dict_total * 100:.0f}% of the dict memory, due scan {dict_scan / table_scan:.1f}x faster")
+        print("-" * 84)
+
+if __name__ == "__main__":
+    main()
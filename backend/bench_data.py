@@ -0,0 +1,83 @@
+"""
+Synthetic collections for the bench_*.py benchmark scripts.
+
+Builds databases shaped like the real one (notes with sentences and audio
+file names, forward/reverse cards with FSRS state, review logs with the card
+snapshot before each review) at any size, without calling external APIs.
+"""
+
+import random
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Any
+
+START_DATE = datetime(2025, 9, 3, 8, 0, 0, tzinfo=timezone.utc)
+
+
+def _fsrs_card(card_id: int, when: datetime, rng: random.Random) -> Dict[str, Any]:
+    state = rng.choice([1, 2, 2, 2, 3])
+    return {
+        "card_id": 1759627575124 + card_id,
+        "state": state,
+        "step": None if state == 2 else rng.randint(0, 1),
+        "stability": rng.uniform(0.1, 40.0),
+        "difficulty": rng.uniform(1.0, 10.0),
+        "due": (when + timedelta(days=rng.uniform(-10, 20))).isoformat(),
+        "last_review": (when - timedelta(days=rng.uniform(0, 10))).isoformat()
+    }
+
+
+def synthetic_database(review_log_count: int, cards_per_log: float = 0.1, seed: int = 42) -> Dict[str, Any]:
+    """
+    Returns a database document with review_log_count review logs
+
+    Args:
+        review_log_count: Number of review logs to generate
+        cards_per_log: Cards generated per review log (two cards per note)
+        seed: Random seed, so runs are comparable
+    """
+    rng = random.Random(seed)
+    card_count = max(2, int(review_log_count * cards_per_log) // 2 * 2)
+
+    notes = []
+    cards = []
+    for note_id in range(1, card_count // 2 + 1):
+        created_at = START_DATE + timedelta(minutes=note_id)
+        notes.append({
+            "id": note_id,
+            "word": f"palabra{note_id}",
+            "translation": f"word{note_id}",
+            "sentence": f"Esta es la *palabra{note_id}* en una frase de ejemplo bastante corta.",
+            "sentence_translation": f"This is word{note_id} in a fairly short example sentence.",
+            "word_audio": f"word_{note_id}.mp3",
+            "translation_audio": f"translation_{note_id}.mp3",
+            "sentence_audio": f"sentence_{note_id}.mp3",
+            "sentence_translation_audio": f"sentence_translation_{note_id}.mp3",
+            "created_at": created_at.isoformat()
+        })
+        for direction in ("forward", "reverse"):
+            card_id = len(cards) + 1
+            cards.append({
+                "id": card_id,
+                "note_id": note_id,
+                "direction": direction,
+                "fsrs_card": _fsrs_card(card_id, created_at + timedelta(days=30), rng)
+            })
+
+    review_logs = []
+    for log_id in range(1, review_log_count + 1):
+        card_id = rng.randint(1, card_count)
+        review_datetime = START_DATE + timedelta(seconds=rng.uniform(0, 30 * 86400))
+        review_logs.append({
+            "id": log_id,
+            "card_id": card_id,
+            "card": _fsrs_card(card_id, review_datetime, rng),
+            "rating": rng.choice([1, 2, 3, 3, 3, 4]),
+            "review_datetime": review_datetime.isoformat(),
+            "review_duration": None
+        })
+
+    return {
+        "learning_notes": notes,
+        "cards": cards,
+        "review_logs": review_logs
+    }
@@ -0,0 +1,137 @@
+"""
+Benchmark: review forecast (/forecast) from the due histogram vs a scan
+
+1. On both storage engines, reviews random cards, adds notes and reopens
+   the store, checking after every step that get_due_forecast gives the
+   same counts as bucketing every card's due date by timestamps.study_day.
+   For SQLite it also drops the due_days table, as in a database created
+   before the forecast, and checks that reopening counts the cards again.
+2. Times get_due_forecast(today, 30) against that scan over
+   get_card_columns() for larger collections.
+
+Usage: python bench_forecast.py [card counts, default 10000 100000]
+"""
+
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+import numpy as np
+from fsrs import Scheduler
+
+import fsrs_controller
+import fsrs_kernel
+from bench_data import synthetic_database, START_DATE
+from columnar import NULL_INT
+from json_store import JSONStore
+from sqlite_store import SQLiteStore
+from timestamps import datetime_to_us, study_day
+
+DAYS = 30
+TODAY = study_day(datetime_to_us(START_DATE))
+
+def scan_forecast(store, first_day, days):
+    """
+    The forecast counted from every card's due date
+    """
+    due_us = np.asarray(store.get_card_columns()["due_us"], dtype=np.int64)
+    days_of_cards = study_day(due_us[due_us != NULL_INT])
+    counts = [int(np.count_nonzero(days_of_cards == day)) for day in range(first_day, first_day + days)]
+    return int(np.count_nonzero(days_of_cards < first_day)), counts
+
+def same_forecast(store, label):
+    for first_day in (TODAY - 15, TODAY, TODAY + 3, TODAY + 40, TODAY):
+        expected = scan_forecast(store, first_day, DAYS)
+        assert store.get_due_forecast(first_day, DAYS) == expected, f"{label}: forecast from day {first_day} differs"
+
+def review_some(store, rng, settings, count):
+    cards = store.get_cards()
+    for card in rng.sample(cards, min(count, len(cards))):
+        before = fsrs_kernel.card_from_dict(card["fsrs_card"])
+        now_us = datetime_to_us(START_DATE + timedelta(days=rng.uniform(-5, 10)))
+        rating = rng.randint(1, 4)
+        after = fsrs_kernel.review(settings, before, rating, now_us)
+        store.record_review(card["id"], fsrs_kernel.card_to_dict(after),
+                            fsrs_kernel.review_log_to_dict(before, rating, now_us))
+
+def add_notes(store, rng, count):
+    for _ in range(count):
+        note_id = store.allocate_id("learning_notes")
+        cards = []
+        for direction in ("forward", "reverse"):
+            fsrs_card = fsrs_controller.create_new_card()
+            fsrs_card["due"] = (START_DATE + timedelta(days=rng.uniform(-3, 3))).isoformat()
+            cards.append({"id": store.allocate_id("cards"), "note_id": note_id, "direction": direction, "fsrs_card": fsrs_card})
+        store.insert_note({"id": note_id, "word": f"nueva{note_id}", "translation": f"new{note_id}"}, cards)
+
+def check(engine, directory):
+    rng = random.Random(5)
+    # bench_data puts relearning cards on step 0 or 1, so give them two steps
+    scheduler = Scheduler.from_dict({**fsrs_controller.scheduler.to_dict(), "relearning_steps": [600, 1800]})
+    settings = fsrs_kernel.SchedulerSettings.from_scheduler(scheduler)
+    if engine == "json":
+        open_store = lambda: JSONStore(os.path.join(directory, "check.json"), durability="none")
+    else:
+        open_store = lambda: SQLiteStore(os.path.join(directory, "check.sqlite"), durability="none")
+
+    store = open_store()
+    store.initialize()
+    store.write_data(synthetic_database(2000, cards_per_log=0.5))
+    same_forecast(store, f"{engine} after import")
+    for _ in range(5):
+        review_some(store, rng, settings, 100)
+        same_forecast(store, f"{engine} after reviews")
+        add_notes(store, rng, 20)
+        same_forecast(store, f"{engine} after new notes")
+    store.close()
+
+    if engine == "sqlite":
+        with sqlite3.connect(store.path) as conn:
+            conn.executescript("DROP TABLE due_days; DROP TRIGGER due_days_insert; "
+                               "DROP TRIGGER due_days_delete; DROP TRIGGER due_days_update;")
+    store = open_store()
+    same_forecast(store, f"{engine} after reopening")
+    store.close()
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000]
+
+    with tempfile.TemporaryDirectory() as directory:
+        for engine in ("json", "sqlite"):
+            check(engine, directory)
+        print("✅ Due histogram matches a scan of every card (json and sqlite)")
+
+        print("📊 Forecast benchmark (30 days)")
+        print("=" * 64)
+        print(f"{'cards':>9} {'engine':>7} {'scan ms':>9} {'histogram ms':>13} {'speedup':>8}")
+        print("-" * 64)
+
+        for size in sizes:
+            data = synthetic_database(size, cards_per_log=1.0)
+            for engine, store in (("json", JSONStore(os.path.join(directory, f"{size}.json"), durability="none")),
+                                  ("sqlite", SQLiteStore(os.path.join(directory, f"{size}.sqlite"), durability="none"))):
+                store.initialize()
+                store.write_data(data)
+                assert store.get_due_forecast(TODAY, DAYS) == scan_forecast(store, TODAY, DAYS)
+
+                start = time.perf_counter()
+                scan_forecast(store, TODAY, DAYS)
+                scan_time = time.perf_counter() - start
+
+                start = time.perf_counter()
+                for _ in range(100):
+                    store.get_due_forecast(TODAY, DAYS)
+                histogram_time = (time.perf_counter() - start) / 100
+
+                print(f"{size:>9,} {engine:>7} {scan_time * 1000:>9.1f} {histogram_time * 1000:>13.3f} "
+                      f"{scan_time / histogram_time:>7.0f}x")
+                store.close()
+
+        print("-" * 64)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+Benchmark: FSRS scheduling kernel (fsrs_kernel.py) vs fsrs.Scheduler
+
+Before timing, runs property checks on random review histories. They cover
+new, learning, review and relearning cards, ratings 1-4, reviews minutes
+to months apart, early and late reviews, and fuzzing.
+1. fsrs_kernel.review gives the same state, step, stability, difficulty,
+   due and last review as Scheduler.review_card. This is checked for the
+   scheduler in fsrs_controller.py and for variants with zero, one or
+   three learning steps, no relearning steps and other retentions and
+   maximum intervals. Both draw their fuzz from the same seeded random
+   module.
+2. fsrs_kernel.review_batch agrees with review card by card, given the
+   same fuzz draws.
+3. fsrs_controller.review_card returns the same card and review log dicts
+   as Card.from_dict -> scheduler.review_card -> to_dict, with the default
+   shard's scheduler (fsrs_controller.get_scheduler).
+
+Then times replaying the same reviews card by card with fsrs Card objects
+(what gen_dummy_logs.py did), with fsrs_kernel.review, and with
+review_batch (all cards advance one review at a time).
+
+Usage: python bench_kernel.py [review counts, default 100000]
+"""
+
+import math
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from fsrs import Scheduler, Card, Rating, State
+
+import fsrs_controller
+import fsrs_kernel
+from columnar import NULL_INT, NULL_STEP
+from timestamps import datetime_to_us
+
+START = datetime(2025, 9, 3, 8, 0, 0, tzinfo=timezone.utc)
+REVIEWS_PER_CARD = 10
+
+def schedulers():
+    app = fsrs_controller.scheduler
+    variants = [app, Scheduler(parameters=app.parameters, enable_fuzzing=True)]
+    for learning_steps, relearning_steps in (((), ()), ((timedelta(minutes=5),), ()),
+                                             ((timedelta(minutes=1), timedelta(minutes=10), timedelta(hours=1)),
+                                              (timedelta(minutes=10), timedelta(hours=2)))):
+        settings = app.to_dict()
+        settings.update(
+            learning_steps=[int(step.total_seconds()) for step in learning_steps],
+            relearning_steps=[int(step.total_seconds()) for step in relearning_steps],
+            desired_retention=random.Random(len(learning_steps)).choice([0.8, 0.9, 0.97]),
+            maximum_interval=random.Random(len(relearning_steps)).choice([15, 100, 36500])
+        )
+        variants.append(Scheduler.from_dict(settings))
+    variants.append(Scheduler.from_dict({**app.to_dict(), "enable_fuzzing": False}))
+    return variants
+
+def random_gap(rng):
+    return rng.choice([
+        timedelta(minutes=rng.randint(1, 30)),
+        timedelta(hours=rng.uniform(1, 23)),
+        timedelta(days=rng.uniform(1, 5)),
+        timedelta(days=rng.uniform(5, 120))
+    ])
+
+def same_card(kernel_card, card):
+    expected = fsrs_kernel.card_from_dict(card.to_dict())
+    assert kernel_card.state == expected.state and kernel_card.step == expected.step, "state or step differs"
+    assert kernel_card.due_us == expected.due_us and kernel_card.last_review_us == expected.last_review_us, "due differs"
+    for value, expected_value in ((kernel_card.stability, expected.stability), (kernel_card.difficulty, expected.difficulty)):
+        assert math.isclose(value, expected_value, rel_tol=1e-12), "memory state differs"
+
+def check_review(cards=300, seed=1):
+    rng = random.Random(seed)
+    for scheduler in schedulers():
+        settings = fsrs_kernel.SchedulerSettings.from_scheduler(scheduler)
+        for card_index in range(cards):
+            card = Card(card_id=card_index, due=START)
+            kernel_card = fsrs_kernel.card_from_dict(card.to_dict())
+            now = START
+            for _ in range(REVIEWS_PER_CARD):
+                # Early or late, relative to the due date
+                now = max(now, card.due + rng.choice([-1, 1]) * random_gap(rng) * rng.random())
+                rating = rng.choice([1, 2, 3, 3, 3, 4])
+                random.seed(card_index)
+                card, _ = scheduler.review_card(card, Rating(rating), now)
+                card.difficulty = float(card.difficulty)
+                random.seed(card_index)
+                kernel_card = fsrs_kernel.review(settings, kernel_card, rating, datetime_to_us(now))
+                same_card(kernel_card, card)
+
+def as_arrays(cards):
+    return fsrs_kernel.CardState(
+        np.array([card.card_id for card in cards]),
+        np.array([card.state for card in cards]),
+        np.array([NULL_STEP if card.step is None else card.step for card in cards]),
+        np.array([math.nan if card.stability is None else card.stability for card in cards]),
+        np.array([math.nan if card.difficulty is None else card.difficulty for card in cards]),
+        np.array([card.due_us for card in cards]),
+        np.array([NULL_INT if card.last_review_us is None else card.last_review_us for card in cards])
+    )
+
+def check_batch(cards=2000, seed=2):
+    rng = np.random.default_rng(seed)
+    for scheduler in schedulers():
+        settings = fsrs_kernel.SchedulerSettings.from_scheduler(scheduler)
+        singles = [fsrs_kernel.card_from_dict(Card(card_id=index, due=START).to_dict()) for index in range(cards)]
+        batch = as_arrays(singles)
+        now_us = np.full(cards, datetime_to_us(START))
+        for _ in range(REVIEWS_PER_CARD):
+            now_us = np.maximum(now_us, batch.due_us + (rng.uniform(-0.5, 1.5, cards) * (batch.due_us - now_us)).astype(np.int64))
+            ratings = rng.choice([1, 2, 3, 3, 3, 4], cards)
+            draws = rng.random(cards)
+            batch = fsrs_kernel.review_batch(settings, batch, ratings, now_us, draws)
+            singles = [fsrs_kernel.review(settings, card, int(rating), int(now), float(draw))
+                       for card, rating, now, draw in zip(singles, ratings, now_us, draws)]
+            expected = as_arrays(singles)
+            for field in ("card_id", "state", "step", "due_us", "last_review_us"):
+                assert np.array_equal(getattr(batch, field), getattr(expected, field)), f"batch {field} differs"
+            for field in ("stability", "difficulty"):
+                assert np.allclose(getattr(batch, field), getattr(expected, field), rtol=1e-12, atol=0), f"batch {field} differs"
+
+def check_controller(cards=300, seed=3):
+    rng = random.Random(seed)
+    # review_card uses the default shard's scheduler
+    scheduler = fsrs_controller.get_scheduler()
+    for card_index in range(cards):
+        card_dict = Card(card_id=card_index, due=START).to_dict()
+        now = START
+        for _ in range(REVIEWS_PER_CARD):
+            now = now + random_gap(rng)
+            rating = rng.choice([1, 2, 3, 4])
+            random.seed(card_index)
+            card, log = scheduler.review_card(Card.from_dict(card_dict), Rating(rating), now)
+            expected_card, expected_log = card.to_dict(), log.to_dict()
+            random.seed(card_index)
+            card_dict, log_dict = fsrs_controller.review_card(card_dict, rating, now)
+            assert log_dict == expected_log, "review log differs"
+            assert {key: card_dict[key] for key in ("card_id", "state", "step", "due", "last_review")} == \
+                   {key: expected_card[key] for key in ("card_id", "state", "step", "due", "last_review")}, "card differs"
+            assert math.isclose(card_dict["stability"], expected_card["stability"], rel_tol=1e-12)
+            assert math.isclose(card_dict["difficulty"], expected_card["difficulty"], rel_tol=1e-12)
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [100_000]
+
+    check_review()
+    print("✅ fsrs_kernel.review matches Scheduler.review_card")
+    check_batch()
+    print("✅ fsrs_kernel.review_batch matches fsrs_kernel.review")
+    check_controller()
+    print("✅ fsrs_controller.review_card returns the same dicts as the fsrs objects")
+
+    # The default shard's scheduler, which review_fsrs_card uses below
+    settings = fsrs_controller.get_kernel_settings()
+
+    print("📊 FSRS review replay benchmark")
+    print("=" * 76)
+    print(f"{'reviews':>9} {'fsrs Card ms':>13} {'kernel ms':>10} {'batch ms':>9} {'vs Card':>8} {'batch vs Card':>14}")
+    print("-" * 76)
+
+    for size in sizes:
+        cards = size // REVIEWS_PER_CARD
+        rng = np.random.default_rng(size)
+        ratings = rng.choice([1, 2, 3, 3, 3, 4], (REVIEWS_PER_CARD, cards)).tolist()
+        gaps_us = (rng.uniform(0.01, 20, (REVIEWS_PER_CARD, cards)) * 86_400_000_000).astype(np.int64).tolist()
+        start_us = datetime_to_us(START)
+
+        start = time.perf_counter()
+        for index in range(cards):
+            card = Card(card_id=index, due=START)
+            now = START
+            for review in range(REVIEWS_PER_CARD):
+                now += timedelta(microseconds=gaps_us[review][index])
+                card, log = fsrs_controller.review_fsrs_card(card, ratings[review][index], now)
+        card_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for index in range(cards):
+            card = fsrs_kernel.CardState(index, fsrs_kernel.LEARNING, 0, None, None, start_us, None)
+            now_us = start_us
+            for review in range(REVIEWS_PER_CARD):
+                now_us += gaps_us[review][index]
+                card = fsrs_kernel.review(settings, card, ratings[review][index], now_us)
+        kernel_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        batch = fsrs_kernel.CardState(
+            np.arange(cards), np.full(cards, fsrs_kernel.LEARNING), np.zeros(cards, dtype=np.int64),
+            np.full(cards, math.nan), np.full(cards, math.nan), np.full(cards, start_us), np.full(cards, NULL_INT)
+        )
+        now_us = np.full(cards, start_us)
+        for review in range(REVIEWS_PER_CARD):
+            now_us = now_us + np.asarray(gaps_us[review])
+            batch = fsrs_kernel.review_batch(settings, batch, ratings[review], now_us)
+        batch_time = time.perf_counter() - start
+
+        print(f"{size:>9,} {card_time * 1000:>13.0f} {kernel_time * 1000:>10.0f} {batch_time * 1000:>9.1f} "
+              f"{card_time / kernel_time:>7.0f}x {card_time / batch_time:>13.0f}x")
+
+    print("-" * 76)
+
+if __name__ == "__main__":
+    main()
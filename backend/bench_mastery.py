@@ -0,0 +1,139 @@
+"""
+Benchmark: per-card vs vectorized retrievability and mastery
+
+create_note ranks every card by mastery (retrievability x stability) to pick
+well-known words. Compares two ways of scoring all cards:
+- per card: fsrs Card.from_dict + Card.get_retrievability for every card
+- numpy: fsrs_controller.elapsed_days_batch + mastery_batch over the stored
+  columns as arrays (what create_note uses)
+
+Before timing, checks that both agree to within floating-point tolerance,
+that never-reviewed cards come out as None / NaN in the same places, and
+that the top 10% ranking create_note takes is the same. Also checks that
+the one-card calculate_mastery_score / get_card_retrievability, which call
+the batch functions, give what fsrs gives.
+
+Usage: python bench_mastery.py [card counts, default 100000]
+"""
+
+import math
+import sys
+import time
+from datetime import timedelta
+
+import numpy as np
+from fsrs import Card
+
+import fsrs_controller
+from bench_data import synthetic_database, START_DATE
+from columnar import CardTable, NULL_INT
+from timestamps import datetime_to_us
+
+def best_time(function, repeat=5):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def per_card(cards, now):
+    scores = []
+    for card in cards:
+        fsrs_card = Card.from_dict(card["fsrs_card"])
+        if fsrs_card.last_review is None or not fsrs_card.stability:
+            scores.append(None)
+        else:
+            scores.append(fsrs_card.get_retrievability(now) * fsrs_card.stability)
+    return scores
+
+def vectorized(columns, now_us):
+    elapsed_days = fsrs_controller.elapsed_days_batch(columns["last_review_us"], now_us)
+    return fsrs_controller.mastery_batch(columns["stability"], elapsed_days)
+
+def top_rows_loop(scores):
+    card_scores = [(row, score) for row, score in enumerate(scores) if score is not None]
+    card_scores.sort(key=lambda x: x[1], reverse=True)
+    return [row for row, score in card_scores[:max(1, len(card_scores) // 10)]]
+
+def top_rows_vectorized(scores):
+    reviewed_rows = np.flatnonzero(~np.isnan(scores))
+    ranked_rows = reviewed_rows[np.argsort(-scores[reviewed_rows], kind="stable")]
+    return ranked_rows[:max(1, len(ranked_rows) // 10)].tolist()
+
+def check_equivalence(cards, columns, now):
+    now_us = datetime_to_us(now)
+    expected = per_card(cards, now)
+    batch = vectorized(columns, now_us)
+
+    assert len(expected) == len(batch)
+    for a, b in zip(expected, batch):
+        if a is None:
+            assert math.isnan(b), "never-reviewed cards disagree"
+        else:
+            assert math.isclose(a, b, rel_tol=1e-12), "mastery scores disagree"
+
+    # Retrievability on its own, including cards reviewed "in the future"
+    elapsed_days = fsrs_controller.elapsed_days_batch(columns["last_review_us"], now_us)
+    retrievability = fsrs_controller.retrievability_batch(columns["stability"], elapsed_days)
+    for card, value in zip(cards, retrievability):
+        fsrs_card = Card.from_dict(card["fsrs_card"])
+        if fsrs_card.last_review is not None and fsrs_card.stability:
+            assert math.isclose(fsrs_card.get_retrievability(now), value, rel_tol=1e-12), "retrievability disagrees"
+
+    assert top_rows_loop(expected) == top_rows_vectorized(batch), "top 10% rankings disagree"
+
+def check_single_cards(cards):
+    """
+    calculate_mastery_score and get_card_retrievability (scored now) against fsrs
+    """
+    for card in cards[::97]:
+        fsrs_card = Card.from_dict(card["fsrs_card"])
+        retrievability = fsrs_card.get_retrievability()
+        assert math.isclose(fsrs_controller.get_card_retrievability(card["fsrs_card"]), retrievability, rel_tol=1e-12)
+        if fsrs_card.last_review is None or not fsrs_card.stability:
+            try:
+                fsrs_controller.calculate_mastery_score(card["fsrs_card"])
+                raise AssertionError("never-reviewed card got a mastery score")
+            except ValueError:
+                pass
+        else:
+            assert math.isclose(fsrs_controller.calculate_mastery_score(card["fsrs_card"]),
+                                retrievability * fsrs_card.stability, rel_tol=1e-12), "calculate_mastery_score disagrees"
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [100_000]
+
+    print("📊 Mastery scoring benchmark")
+    print("=" * 48)
+    print(f"{'cards':>9} {'per card ms':>13} {'numpy ms':>10} {'speedup':>12}")
+    print("-" * 48)
+
+    for size in sizes:
+        # One card per review log, so the collection has size cards
+        cards = synthetic_database(size, cards_per_log=1.0)["cards"]
+        # A few never-reviewed cards, as create_note sees after new notes
+        for card in cards[::50]:
+            card["fsrs_card"].update(last_review=None, stability=None, difficulty=None, state=1)
+        table = CardTable.from_dicts(cards)
+        columns = {
+            "stability": table.fsrs.stability,
+            "last_review_us": table.fsrs.last_review
+        }
+
+        for days in (-1, 0, 30, 400):
+            check_equivalence(cards, columns, START_DATE + timedelta(days=days))
+        assert NULL_INT in columns["last_review_us"]
+        check_single_cards(cards)
+
+        now = START_DATE + timedelta(days=30)
+        now_us = datetime_to_us(now)
+        per_card_time = best_time(lambda: per_card(cards, now), repeat=3)
+        numpy_time = best_time(lambda: vectorized(columns, now_us))
+        print(f"{size:>9,} {per_card_time * 1000:>13.1f} {numpy_time * 1000:>10.2f} {per_card_time / numpy_time:>11.0f}x")
+
+    print("-" * 48)
+    print("✅ Both agree")
+
+if __name__ == "__main__":
+    main()
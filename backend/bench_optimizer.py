@@ -0,0 +1,124 @@
+"""
+Benchmark: FSRS parameter optimizer (fsrs_optimizer.py)
+
+1. Checks that the optimizer's replay of the memory model gives the same
+   stability and difficulty as fsrs.Scheduler.review_card, for random
+   rating sequences with same-day and later reviews.
+2. Simulates review histories from known weights (the fsrs 4.x defaults):
+   each review is recalled with the probability the model predicts, and
+   the next one comes roughly when retrievability reaches 90%.
+3. Fits the app's weights to the simulated history and reports the time
+   and the log loss of the starting, fitted and true weights; the fit must
+   come close to the true weights' loss.
+
+Usage: python bench_optimizer.py [review log counts, default 1000000]
+"""
+
+import math
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from fsrs import Scheduler, Card, Rating
+
+import fsrs_controller
+import fsrs_optimizer
+from timestamps import US_PER_DAY
+
+TRUE_PARAMETERS = Scheduler().parameters
+
+def check_replay(cards=200, reviews=12, seed=7):
+    rng = random.Random(seed)
+    parameters = list(fsrs_controller.scheduler.parameters)
+    scheduler = Scheduler(parameters=parameters, enable_fuzzing=False)
+    for _ in range(cards):
+        card = Card()
+        now = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        ratings, elapsed_days, expected = [], [], []
+        last = None
+        for _ in range(reviews):
+            now += rng.choice([timedelta(minutes=10), timedelta(hours=5), timedelta(days=rng.randint(1, 40))])
+            rating = rng.choice([1, 2, 3, 3, 3, 4])
+            card, _ = scheduler.review_card(card, Rating(rating), now)
+            card.difficulty = float(card.difficulty)
+            ratings.append(rating)
+            elapsed_days.append((now - last).days if last else 0)
+            expected.append((card.stability, card.difficulty))
+            last = now
+        for (stability, difficulty), (expected_stability, expected_difficulty) in zip(
+                fsrs_optimizer.replay(parameters, ratings, elapsed_days), expected):
+            assert math.isclose(stability, max(expected_stability, fsrs_optimizer.MIN_STABILITY), rel_tol=1e-9), "stability differs"
+            assert math.isclose(difficulty, expected_difficulty, rel_tol=1e-9), "difficulty differs"
+
+def simulate(review_count, reviews_per_card=10, seed=42):
+    """
+    Returns card_ids, ratings, review_us and first_reviews of a simulated history
+    """
+    rng = np.random.default_rng(seed)
+    cards = review_count // reviews_per_card
+    weights = np.asarray(TRUE_PARAMETERS, dtype=np.float64)[None, :]
+
+    card_ids = np.repeat(np.arange(cards), reviews_per_card)
+    ratings = np.empty((reviews_per_card, cards), dtype=np.int64)
+    review_us = np.empty((reviews_per_card, cards), dtype=np.int64)
+
+    ratings[0] = rng.choice([1, 2, 3, 4], size=cards, p=[0.25, 0.1, 0.55, 0.1])
+    review_us[0] = rng.integers(0, 60, cards) * US_PER_DAY + rng.integers(0, US_PER_DAY // 2, cards)
+    stability, difficulty = fsrs_optimizer.initial_states(weights, ratings[0])
+
+    for step in range(1, reviews_per_card):
+        # Next review about when retrievability drops to 90% (interval = stability),
+        # sometimes the same day as in learning steps
+        interval_days = np.maximum(1, np.round(stability[0] * rng.uniform(0.5, 1.6, cards)))
+        interval_days[rng.random(cards) < 0.15] = 0
+        review_us[step] = review_us[step - 1] + interval_days.astype(np.int64) * US_PER_DAY + rng.integers(60_000_000, 3_600_000_000, cards)
+        elapsed_days = ((review_us[step] - review_us[step - 1]) // US_PER_DAY).astype(np.float64)
+
+        retrievability = (1 + fsrs_controller.FACTOR * elapsed_days / stability[0]) ** fsrs_controller.DECAY
+        recalled = rng.random(cards) < retrievability
+        ratings[step] = np.where(recalled, rng.choice([2, 3, 4], size=cards, p=[0.15, 0.75, 0.1]), 1)
+        _, stability, difficulty = fsrs_optimizer.next_states(weights, stability, difficulty, ratings[step], elapsed_days)
+
+    first_reviews = np.zeros((reviews_per_card, cards), dtype=bool)
+    first_reviews[0] = True
+    # Stored logs are ordered by time, not by card
+    order = np.argsort(review_us.T.ravel(), kind="stable")
+    return card_ids[order], ratings.T.ravel()[order], review_us.T.ravel()[order], first_reviews.T.ravel()[order]
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1_000_000]
+
+    check_replay()
+    print("✅ Replay matches fsrs.Scheduler.review_card")
+
+    print("📊 FSRS optimizer benchmark")
+    print("=" * 86)
+    print(f"{'reviews':>10} {'build s':>8} {'fit s':>7} {'loss start':>11} {'loss fitted':>12} {'loss true':>10}")
+    print("-" * 86)
+
+    for size in sizes:
+        logs = simulate(size)
+
+        start = time.perf_counter()
+        history = fsrs_optimizer.build_history(*logs)
+        build_time = time.perf_counter() - start
+        assert history.reviews == size
+
+        initial = list(fsrs_controller.scheduler.parameters)
+        start = time.perf_counter()
+        fitted = fsrs_optimizer.fit_parameters(history, initial)
+        fit_time = time.perf_counter() - start
+
+        loss_start = fsrs_optimizer.log_loss(initial, history)
+        loss_fitted = fsrs_optimizer.log_loss(fitted, history)
+        loss_true = fsrs_optimizer.log_loss(TRUE_PARAMETERS, history)
+        print(f"{size:>10,} {build_time:>8.2f} {fit_time:>7.2f} {loss_start:>11.4f} {loss_fitted:>12.4f} {loss_true:>10.4f}")
+        assert loss_fitted < loss_start, "fit did not improve the loss"
+        assert loss_fitted - loss_true < 0.25 * (loss_start - loss_true), "fit is far from the true weights"
+
+    print("-" * 86)
+
+if __name__ == "__main__":
+    main()
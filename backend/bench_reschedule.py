@@ -0,0 +1,193 @@
+"""
+Benchmark: rescheduling cards from their review history (rescheduler.py)
+
+1. rescheduler.replay_cards gives each card the state that replaying its
+   reviews one by one with fsrs_kernel.review gives (same fuzz draws), for
+   the app's scheduler, a fuzzed one and one with more learning steps.
+2. On both storage engines, rescheduler.reschedule (reading and replaying
+   in worker processes) stores those states for every reviewed card under
+   its own fsrs card_id, leaves cards without reviews alone, skips cards
+   whose stored last review is later than their logs (reviewed meanwhile),
+   and gives the same due dates when run again.
+3. Times reschedule against replaying every card serially with
+   fsrs_kernel.review and writing it back with record_review-sized writes.
+
+Usage: python bench_reschedule.py [review log counts, default 100000 1000000]
+"""
+
+import math
+import os
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+import numpy as np
+from fsrs import Scheduler
+
+import background_jobs
+import database
+import fsrs_controller
+import fsrs_kernel
+import rescheduler
+from bench_data import synthetic_database, START_DATE
+from timestamps import datetime_to_us, iso_to_us
+
+def settings_variants():
+    app = fsrs_controller.scheduler
+    return [fsrs_kernel.SchedulerSettings.from_scheduler(scheduler) for scheduler in (
+        app,
+        Scheduler.from_dict({**app.to_dict(), "enable_fuzzing": True}),
+        Scheduler.from_dict({**app.to_dict(), "enable_fuzzing": True, "learning_steps": [60, 600, 3600],
+                             "relearning_steps": [600, 7200], "maximum_interval": 100})
+    )]
+
+def random_history(cards, seed):
+    """
+    Log ids, card ids, ratings and times of random reviews, sorted by card and time
+    """
+    rng = np.random.default_rng(seed)
+    counts = rng.integers(1, 25, cards)
+    card_ids = np.repeat(np.arange(1, cards + 1), counts)
+    gaps = rng.choice([60, 3600, 86_400, 20 * 86_400], len(card_ids)) * rng.uniform(0.1, 2, len(card_ids))
+    review_us = datetime_to_us(START_DATE) + (np.cumsum(gaps) * 1_000_000).astype(np.int64)
+    order = np.lexsort((review_us, card_ids))
+    log_ids = rng.permutation(len(card_ids)) + 1
+    ratings = rng.choice([1, 2, 3, 3, 3, 4], len(card_ids)).astype(np.int8)
+    return log_ids, card_ids[order], ratings, review_us[order]
+
+def serial_replay(settings, card_ids, ratings, review_us, draws):
+    """
+    Each card's state after replaying its reviews one at a time
+    """
+    cards = {}
+    for card_id, rating, now_us, draw in zip(card_ids.tolist(), ratings.tolist(), review_us.tolist(), draws.tolist()):
+        card = cards.get(card_id) or fsrs_kernel.CardState(card_id, fsrs_kernel.LEARNING, 0, None, None, now_us, None)
+        cards[card_id] = fsrs_kernel.review(settings, card, rating, now_us, draw)
+    return cards
+
+def same_state(card, expected, label):
+    assert (card.state, card.step, card.due_us, card.last_review_us) == \
+           (expected.state, expected.step, expected.due_us, expected.last_review_us), f"{label}: card {expected.card_id} differs"
+    assert math.isclose(card.stability, expected.stability, rel_tol=1e-12), f"{label}: stability differs"
+    assert math.isclose(card.difficulty, expected.difficulty, rel_tol=1e-12), f"{label}: difficulty differs"
+
+def check_replay(cards=1000, seed=11):
+    for number, settings in enumerate(settings_variants()):
+        log_ids, card_ids, ratings, review_us = random_history(cards, seed + number)
+        draws = rescheduler.review_draws(log_ids)
+        expected = serial_replay(settings, card_ids, ratings, review_us, draws)
+        replayed = rescheduler.replay_cards(settings, card_ids, ratings, review_us, draws)
+        assert len(replayed.card_id) == len(expected)
+        for index in range(len(replayed.card_id)):
+            card = fsrs_kernel.card_from_batch(replayed, index)
+            same_state(card, expected[card.card_id], f"settings {number}")
+
+def use_engine(engine, directory):
+    background_jobs.jobs.shutdown()
+    database.close_database()
+    database.apply_settings({
+        "DATABASE_BACKEND": engine,
+        "DATABASE_FILE": os.path.join(directory, f"{engine}.json"),
+        "SQLITE_FILE": os.path.join(directory, f"{engine}.sqlite3"),
+        "SHARDS_DIR": os.path.join(directory, f"{engine}_shards"),
+        "DATABASE_DURABILITY": "none"
+    })
+
+def fresh_data(review_log_count):
+    """
+    synthetic_database with every card new, so its state only comes from the replay
+    """
+    data = synthetic_database(review_log_count, cards_per_log=0.2)
+    for card in data["cards"]:
+        card["fsrs_card"] = {**fsrs_controller.create_new_card(), "card_id": 1000 + card["id"]}
+    return data
+
+def expected_states(data, settings):
+    logs = sorted(data["review_logs"], key=lambda log: (log["card_id"], log["review_datetime"], log["id"]))
+    return serial_replay(
+        settings, np.array([log["card_id"] for log in logs]), np.array([log["rating"] for log in logs]),
+        np.array([iso_to_us(log["review_datetime"]) for log in logs]),
+        rescheduler.review_draws(np.array([log["id"] for log in logs]))
+    )
+
+def check_store(engine, directory):
+    use_engine(engine, directory)
+    settings = settings_variants()[1]
+    data = fresh_data(20_000)
+    expected = expected_states(data, settings)
+    # Two reviewed cards look reviewed after their logs were read
+    later = sorted(expected)[:2]
+    for card in data["cards"]:
+        if card["id"] in later:
+            card["fsrs_card"]["last_review"] = (START_DATE + timedelta(days=400)).isoformat()
+    database.initialize_database()
+    database.write_data(data)
+    untouched = {card["id"]: card["fsrs_card"] for card in data["cards"] if card["id"] not in expected or card["id"] in later}
+
+    result = rescheduler.reschedule(None, settings)
+    assert result["review_count"] == len(data["review_logs"]), f"{engine}: not every log was read"
+    assert (result["cards"], result["skipped"]) == (len(expected) - len(later), len(later)), f"{engine}: {result}"
+
+    stored = {card["id"]: card["fsrs_card"] for card in database.get_cards()}
+    for card_id, fsrs_card in stored.items():
+        if card_id in untouched:
+            assert fsrs_card == untouched[card_id], f"{engine}: card {card_id} should be left alone"
+            continue
+        assert fsrs_card["card_id"] == 1000 + card_id, f"{engine}: fsrs card_id changed"
+        same_state(fsrs_kernel.card_from_dict(fsrs_card), expected[card_id], engine)
+
+    assert rescheduler.reschedule(None, settings)["cards"] == result["cards"]
+    assert {card["id"]: card["fsrs_card"] for card in database.get_cards()} == stored, f"{engine}: not deterministic"
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [100_000, 1_000_000]
+
+    check_replay()
+    print("✅ rescheduler.replay_cards matches replaying with fsrs_kernel.review")
+
+    with tempfile.TemporaryDirectory() as directory:
+        for engine in ("json", "sqlite"):
+            check_store(engine, directory)
+        print("✅ reschedule stores the replayed states and skips cards reviewed meanwhile (json and sqlite)")
+
+        settings = fsrs_controller.get_kernel_settings()
+        print(f"📊 Reschedule benchmark ({background_jobs.MAX_WORKERS} workers)")
+        print("=" * 70)
+        print(f"{'reviews':>9} {'engine':>7} {'cards':>8} {'serial s':>9} {'reschedule s':>13} {'speedup':>8}")
+        print("-" * 70)
+
+        for size in sizes:
+            data = fresh_data(size)
+            for engine in ("json", "sqlite"):
+                use_engine(engine, os.path.join(directory))
+                database.initialize_database(f"bench{size}")
+                database.write_data(data, shard=f"bench{size}")
+
+                start = time.perf_counter()
+                logs = list(database.iter_review_logs(shard=f"bench{size}"))
+                logs.sort(key=lambda log: (log["card_id"], log["review_datetime"]))
+                cards = {}
+                for log in logs:
+                    now_us = iso_to_us(log["review_datetime"])
+                    card = cards.get(log["card_id"]) or fsrs_kernel.CardState(
+                        log["card_id"], fsrs_kernel.LEARNING, 0, None, None, now_us, None)
+                    cards[log["card_id"]] = fsrs_kernel.review(settings, card, log["rating"], now_us)
+                for card_id, card in cards.items():
+                    database.submit_card_states([(card_id, card)], rescheduler._replayed_card,
+                                                shard=f"bench{size}")[1].result()
+                serial_time = time.perf_counter() - start
+
+                start = time.perf_counter()
+                result = rescheduler.reschedule(f"bench{size}", settings)
+                reschedule_time = time.perf_counter() - start
+
+                print(f"{size:>9,} {engine:>7} {result['cards']:>8,} {serial_time:>9.2f} {reschedule_time:>13.2f} "
+                      f"{serial_time / reschedule_time:>7.1f}x")
+
+        print("-" * 70)
+        background_jobs.jobs.shutdown()
+        database.close_database()
+
+if __name__ == "__main__":
+    main()
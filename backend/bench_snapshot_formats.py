@@ -0,0 +1,96 @@
+"""
+Benchmark: snapshot formats
+
+Compares dump time, load time and file size of the JSON and MessagePack
+snapshot formats (see snapshot_formats.py) on synthetic collections, after
+checking that a converted snapshot (convert_snapshot.py) and its source can
+both be written and compacted without touching each other's files.
+
+Usage: python bench_snapshot_formats.py [review log counts, default 10000 100000]
+       python bench_snapshot_formats.py 10000 100000 1000000   # 1M takes several minutes
+"""
+
+import gc
+import os
+import sys
+import tempfile
+import time
+import snapshot_formats
+from bench_data import synthetic_database
+from convert_snapshot import convert
+from json_store import JSONStore
+
+def measure(data, fmt, repeat=3):
+    """
+    Returns (best dump seconds, best load seconds, size in bytes) for one format
+    """
+    dump_times = []
+    load_times = []
+    raw = b""
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        raw = snapshot_formats.dumps(data, fmt)
+        dump_times.append(time.perf_counter() - start)
+
+        gc.collect()
+        start = time.perf_counter()
+        loaded = snapshot_formats.loads(raw, fmt)
+        load_times.append(time.perf_counter() - start)
+
+    assert loaded == data, f"{fmt} snapshot does not round-trip"
+    return min(dump_times), min(load_times), len(raw)
+
+def check_conversion():
+    """
+    Converts a JSON store to msgpack, adds a different note through each, compacts
+    both and checks that each still has its own notes and nothing of the other's
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        json_path = os.path.join(directory, "database.json")
+        msgpack_path = os.path.join(directory, "database.msgpack")
+        data = synthetic_database(1000)
+        JSONStore(json_path).write_data(data)
+        convert(json_path, msgpack_path)
+
+        stores = {"json": JSONStore(json_path), "msgpack": JSONStore(msgpack_path, snapshot_format="msgpack")}
+        for fmt, store in stores.items():
+            note_id = store.allocate_id("learning_notes")
+            store.insert_note({**data["learning_notes"][0], "id": note_id, "word": f"{fmt} note"}, [])
+        for store in (stores["msgpack"], stores["json"]):
+            store.compact()
+            store.close()
+
+        for fmt in stores:
+            notes = JSONStore(stores[fmt].path, snapshot_format=fmt).get_notes()
+            words = [note["word"] for note in notes]
+            assert words[:-1] == [note["word"] for note in data["learning_notes"]], f"{fmt} lost notes"
+            assert words[-1] == f"{fmt} note", f"{fmt} has {words[-1]!r} as its new note"
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000]
+
+    check_conversion()
+    print("✅ A converted snapshot and its source keep separate journals, notes and segments")
+
+    print("📊 Snapshot format benchmark (best of 3)")
+    print("=" * 78)
+    print(f"{'review logs':>12} {'format':>8} {'dump ms':>10} {'load ms':>10} {'size MB':>10} {'load speedup':>13}")
+    print("-" * 78)
+
+    for size in sizes:
+        data = synthetic_database(size)
+        results = {fmt: measure(data, fmt) for fmt in snapshot_formats.FORMATS}
+        json_load = results["json"][1]
+        json_size = results["json"][2]
+
+        for fmt, (dump_time, load_time, file_size) in results.items():
+            print(
+                f"{size:>12,} {fmt:>8} {dump_time * 1000:>10.1f} {load_time * 1000:>10.1f} "
+                f"{file_size / 1e6:>10.2f} {json_load / load_time:>12.2f}x"
+            )
+        print(f"{'':>12} msgpack is {results['msgpack'][2] / json_size * 100:.0f}% of the JSON size")
+        print("-" * 78)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Benchmark: ISO timestamp parsing vs integer epoch timestamps
+
+Measures what parsing ISO date strings costs on the paths that touch every
+card:
+- due scan: find and sort the due cards (what /study/next used to do over
+  card dicts, parsing fsrs_card["due"] per card)
+- mastery: retrievability x stability for every card (create_note), through
+  fsrs Card.from_dict vs fsrs_controller.mastery_batch over the stored columns
+- load: building the card table from snapshot records with ISO strings vs
+  epoch microseconds (what the JSON engine now writes)
+
+Usage: python bench_timestamps.py [card counts, default 50000]
+"""
+
+import json
+import sys
+import time
+from datetime import datetime, timedelta
+
+from fsrs import Card
+
+import fsrs_controller
+from bench_data import synthetic_database, START_DATE
+from columnar import CardTable, NULL_INT
+from timestamps import datetime_to_us
+
+def best_time(function, repeat=5):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def scan_iso(cards, now):
+    due = []
+    for card in cards:
+        due_date = datetime.fromisoformat(card["fsrs_card"]["due"].replace('Z', '+00:00'))
+        if due_date <= now:
+            due.append((due_date, card["id"]))
+    due.sort()
+    return [card_id for _, card_id in due]
+
+def scan_us(columns, now):
+    now_us = datetime_to_us(now)
+    card_ids = columns["id"]
+    rows = sorted((due_us, row) for row, due_us in enumerate(columns["due_us"]) if NULL_INT < due_us <= now_us)
+    return [card_ids[row] for _, row in rows]
+
+def mastery_iso(cards, now):
+    scores = []
+    for card in cards:
+        fsrs_card = Card.from_dict(card["fsrs_card"])
+        scores.append(fsrs_card.get_retrievability(now) * fsrs_card.stability)
+    return scores
+
+def mastery_us(columns, now):
+    elapsed_days = fsrs_controller.elapsed_days_batch(columns["last_review_us"], datetime_to_us(now))
+    return fsrs_controller.mastery_batch(columns["stability"], elapsed_days)
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [50_000]
+
+    print("📊 Timestamp parsing benchmark")
+    print("=" * 72)
+    print(f"{'cards':>9} {'operation':>12} {'ISO strings ms':>16} {'epoch ints ms':>15} {'speedup':>9}")
+    print("-" * 72)
+
+    for size in sizes:
+        # One card per review log, so the collection has size cards
+        cards = synthetic_database(size, cards_per_log=1.0)["cards"]
+        now = START_DATE + timedelta(days=30)
+
+        table = CardTable.from_dicts(cards)
+        columns = {
+            "id": table.id,
+            "stability": table.fsrs.stability,
+            "due_us": table.fsrs.due,
+            "last_review_us": table.fsrs.last_review
+        }
+        iso_records = json.loads(json.dumps(table.to_dicts()))
+        us_records = json.loads(json.dumps(table.to_dicts(iso=False)))
+
+        assert scan_iso(cards, now) == scan_us(columns, now), "due scans disagree"
+        for expected, actual in zip(mastery_iso(cards, now), mastery_us(columns, now)):
+            assert abs(expected - actual) <= 1e-9 * max(1.0, abs(expected)), "mastery scores disagree"
+        assert CardTable.from_dicts(us_records).to_dicts() == cards, "epoch records do not round-trip"
+
+        results = [
+            ("due scan", best_time(lambda: scan_iso(cards, now)), best_time(lambda: scan_us(columns, now))),
+            ("mastery", best_time(lambda: mastery_iso(cards, now)), best_time(lambda: mastery_us(columns, now))),
+            ("load", best_time(lambda: CardTable.from_dicts(iso_records)), best_time(lambda: CardTable.from_dicts(us_records)))
+        ]
+        for name, iso_time, us_time in results:
+            print(f"{size:>9,} {name:>12} {iso_time * 1000:>16.1f} {us_time * 1000:>15.1f} {iso_time / us_time:>8.1f}x")
+        print("-" * 72)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Benchmark: Monte Carlo workload vs retention simulation (workload_simulator.py)
+
+1. Checks the vectorized simulation against a per-card reference that
+   reviews fsrs Card objects with fsrs.Scheduler.review_card (fuzzing off)
+   at each retention. The reference uses the same random draws and walks
+   through the learning and relearning steps one review at a time. The
+   review counts must be identical.
+2. Times the simulation of the whole retention grid (SIMULATION_DAYS days)
+   for larger collections.
+
+Usage: python bench_workload.py [card counts, default 10000 100000]
+"""
+
+import sys
+import time
+from datetime import timedelta
+
+import numpy as np
+from fsrs import Scheduler, Card, Rating, State
+
+import fsrs_controller
+import workload_simulator
+from bench_data import synthetic_database, START_DATE
+from columnar import CardTable
+from study_session import study_day_end
+from timestamps import datetime_to_us
+
+NOW = START_DATE + timedelta(days=30)
+
+def collection(size):
+    """
+    Returns card dicts with review cards and, every tenth card, new ones
+    """
+    cards = synthetic_database(size, cards_per_log=1.0)["cards"][:size]
+    for index, card in enumerate(cards):
+        if index % 10 == 0:
+            card["fsrs_card"].update(state=1, step=0, last_review=None, stability=None, difficulty=None)
+        else:
+            card["fsrs_card"].update(state=2, step=None)
+    return cards
+
+def simulator_settings():
+    scheduler = fsrs_controller.scheduler
+    return (
+        scheduler.parameters, len(scheduler.learning_steps),
+        len(scheduler.relearning_steps), scheduler.maximum_interval
+    )
+
+def simulate(cards, retentions, days):
+    day_start = study_day_end(NOW) - timedelta(days=1)
+    table = CardTable.from_dicts(cards)
+    columns = {
+        "id": table.id,
+        "stability": table.fsrs.stability,
+        "difficulty": table.fsrs.difficulty,
+        "due_us": table.fsrs.due,
+        "last_review_us": table.fsrs.last_review
+    }
+    inputs = workload_simulator.card_days(columns, datetime_to_us(day_start))
+    return workload_simulator.simulate_workload(*simulator_settings(), *inputs.values(), retentions, days)
+
+def reference(cards, retention, days):
+    """
+    Reviews per day of the same simulation, card by card with fsrs.Scheduler
+    """
+    day_start = study_day_end(NOW) - timedelta(days=1)
+    scheduler = fsrs_controller.scheduler
+    scheduler = Scheduler(
+        parameters=scheduler.parameters, desired_retention=retention,
+        learning_steps=scheduler.learning_steps, relearning_steps=scheduler.relearning_steps,
+        maximum_interval=scheduler.maximum_interval, enable_fuzzing=False
+    )
+    draws = [workload_simulator.random_draws(workload_simulator.SEED, day, len(cards)) for day in range(days)]
+    reviews = 0
+    for index, card_dict in enumerate(cards):
+        card = Card.from_dict(card_dict["fsrs_card"])
+        day = max((card.due - day_start) // timedelta(days=1), 0)
+        while day < days:
+            review_datetime = day_start + timedelta(days=day + workload_simulator.REVIEW_TIME)
+            recall_draws, rating_draws = draws[day]
+            if card.stability is None:
+                rating = workload_simulator.first_ratings(rating_draws[index])
+            else:
+                recalled = recall_draws[index] < card.get_retrievability(review_datetime)
+                rating = workload_simulator.review_ratings(recalled, rating_draws[index])
+            card, _ = scheduler.review_card(card, Rating(int(rating)), review_datetime)
+            # fsrs 4.1 returns difficulty as a NumPy float, which its own checks reject
+            card.difficulty = float(card.difficulty)
+            reviews += 1
+            # Learning and relearning steps, rated Good (at the same time, like the
+            # simulation, so the next review is a whole number of days later)
+            while card.state != State.Review:
+                card, _ = scheduler.review_card(card, Rating.Good, review_datetime)
+                card.difficulty = float(card.difficulty)
+                reviews += 1
+            day = (card.due - day_start) // timedelta(days=1)
+    return reviews / days
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000]
+
+    cards = collection(300)
+    retentions = [0.7, 0.85, 0.92, 0.99]
+    simulated = simulate(cards, retentions, 60)
+    for retention, workload in zip(retentions, simulated):
+        expected = reference(cards, retention, 60)
+        assert abs(workload - expected) < 1e-9, f"workload at {retention} differs: {workload} vs {expected}"
+    assert simulated == sorted(simulated), "workload should grow with retention"
+    print("✅ Simulation matches fsrs.Scheduler card by card")
+
+    print("📊 Workload simulation benchmark")
+    print("=" * 72)
+    print(f"{'cards':>9} {'days':>5} {'grid s':>8}  workload at 70% / 90% / 99%")
+    print("-" * 72)
+
+    for size in sizes:
+        cards = collection(size)
+        start = time.perf_counter()
+        workloads = simulate(cards, workload_simulator.RETENTION_LEVELS, workload_simulator.SIMULATION_DAYS)
+        elapsed = time.perf_counter() - start
+        by_retention = dict(zip(workload_simulator.RETENTION_LEVELS, workloads))
+        print(f"{size:>9,} {workload_simulator.SIMULATION_DAYS:>5} {elapsed:>8.2f}  "
+              f"{by_retention[0.70]:.1f} / {by_retention[0.90]:.1f} / {by_retention[0.99]:.1f} reviews/day")
+
+    print("-" * 72)
+
+if __name__ == "__main__":
+    main()
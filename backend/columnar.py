@@ -0,0 +1,452 @@
+"""
+Columnar in-memory tables for cards and review logs.
+
+Instead of one dict per card (plus a nested fsrs_card dict with ISO date
+strings), each field lives in a typed `array` column: timestamps as integer
+epoch microseconds, stability/difficulty as doubles, state/step/rating as
+bytes. Row i of every column belongs to the same record. This takes a small
+fraction of the memory of the dict representation and lets scans such as
+"which cards are due" run over plain numbers.
+
+The familiar dictionaries are only materialized at the API boundary, with
+get() / to_dicts(). Values the columns can't represent (unknown keys, a
+missing fsrs_card) are kept verbatim in a sparse `extras` map, so nothing is
+lost on a round trip.
+
+Timestamps are accepted as ISO strings or integer epoch microseconds, and
+get(row, iso=False) returns them as integers. The JSON engine writes its
+snapshot and log segments that way, so loading them needs no date parsing;
+iso_fsrs_card() / iso_review_log() turn such stored records back into the
+ISO form the API returns.
+"""
+
+import math
+from array import array
+from typing import Dict, Any, List, Optional, Iterable
+
+from timestamps import iso_to_us, us_to_iso
+
+# Stored in integer columns for None
+NULL_INT = -(2 ** 63)
+NULL_STEP = -1
+
+DIRECTIONS = ("forward", "reverse")
+
+FSRS_KEYS = ("card_id", "state", "step", "stability", "difficulty", "due", "last_review")
+CARD_KEYS = ("id", "note_id", "direction", "fsrs_card")
+REVIEW_LOG_KEYS = ("id", "card_id", "card", "rating", "review_datetime", "review_duration")
+
+_FSRS_KEY_SET = frozenset(FSRS_KEYS)
+
+# Keys of the column copies returned by the stores' get_card_columns()
+SCHEDULING_COLUMNS = ("id", "note_id", "state", "stability", "difficulty", "due_us", "last_review_us")
+
+# Placeholder column values (never due) for a state kept in extras
+_NULL_FSRS = (0, 0, NULL_STEP, math.nan, math.nan, NULL_INT, NULL_INT)
+
+# Raised by encoders for values that have to go to extras instead
+_UNREPRESENTABLE = (AttributeError, KeyError, TypeError, ValueError, OverflowError)
+
+
+def _nullable_float(value: Optional[float]) -> float:
+    return math.nan if value is None else float(value)
+
+
+def _float_or_none(value: float) -> Optional[float]:
+    return None if math.isnan(value) else value
+
+
+def _timestamp_us(value: Any) -> Optional[int]:
+    """
+    Converts a stored timestamp (epoch microseconds or ISO string) to epoch microseconds
+    """
+    if type(value) is int:
+        return value
+    return iso_to_us(value)
+
+
+def _iso(value: Any) -> Any:
+    return us_to_iso(value) if type(value) is int else value
+
+
+def iso_fsrs_card(fsrs_card: Any) -> Any:
+    """
+    Returns an FSRS card dict with integer timestamps converted to ISO strings
+    """
+    if not isinstance(fsrs_card, dict):
+        return fsrs_card
+    if type(fsrs_card.get("due")) is not int and type(fsrs_card.get("last_review")) is not int:
+        return fsrs_card
+    return {
+        **fsrs_card,
+        "due": _iso(fsrs_card.get("due")),
+        "last_review": _iso(fsrs_card.get("last_review"))
+    }
+
+
+def iso_review_log(review_log: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Returns a stored review log dict with integer timestamps converted to ISO strings
+    """
+    return {
+        **review_log,
+        "card": iso_fsrs_card(review_log.get("card")),
+        "review_datetime": _iso(review_log.get("review_datetime"))
+    }
+
+
+class FsrsColumns:
+    """
+    Columns holding one FSRS card state (fsrs.Card.to_dict()) per row
+    """
+
+    __slots__ = ("card_id", "state", "step", "stability", "difficulty", "due", "last_review")
+
+    def __init__(self):
+        self.card_id = array('q')
+        self.state = array('b')
+        self.step = array('b')
+        self.stability = array('d')
+        self.difficulty = array('d')
+        self.due = array('q')
+        self.last_review = array('q')
+
+    def __len__(self) -> int:
+        return len(self.due)
+
+    @staticmethod
+    def encode(fsrs_card: Dict[str, Any]) -> tuple:
+        """
+        Converts an FSRS card dict to column values
+
+        Raises:
+            KeyError, TypeError, ValueError: If the dict can't be represented exactly
+        """
+        if fsrs_card.keys() != _FSRS_KEY_SET:
+            raise KeyError("unexpected fsrs_card keys")
+        state = fsrs_card["state"]
+        step = fsrs_card["step"]
+        due = fsrs_card["due"]
+        last_review = fsrs_card["last_review"]
+        if not isinstance(state, int) or not 0 <= state < 128:
+            raise ValueError("state out of range")
+        if step is not None and (not isinstance(step, int) or not 0 <= step < 128):
+            raise ValueError("step out of range")
+        if due is None:
+            raise ValueError("missing due date")
+        return (
+            fsrs_card["card_id"],
+            state,
+            NULL_STEP if step is None else step,
+            _nullable_float(fsrs_card["stability"]),
+            _nullable_float(fsrs_card["difficulty"]),
+            _timestamp_us(due),
+            NULL_INT if last_review is None else _timestamp_us(last_review)
+        )
+
+    def truncate(self, length: int):
+        for name in self.__slots__:
+            del getattr(self, name)[length:]
+
+    def append(self, values: tuple):
+        card_id, state, step, stability, difficulty, due, last_review = values
+        self.card_id.append(card_id)
+        self.state.append(state)
+        self.step.append(step)
+        self.stability.append(stability)
+        self.difficulty.append(difficulty)
+        self.due.append(due)
+        self.last_review.append(last_review)
+
+    def set(self, row: int, values: tuple):
+        card_id, state, step, stability, difficulty, due, last_review = values
+        self.card_id[row] = card_id
+        self.state[row] = state
+        self.step[row] = step
+        self.stability[row] = stability
+        self.difficulty[row] = difficulty
+        self.due[row] = due
+        self.last_review[row] = last_review
+
+    def get(self, row: int, iso: bool = True) -> Dict[str, Any]:
+        """
+        Materializes the FSRS card dict of a row (timestamps as epoch microseconds unless iso)
+        """
+        step = self.step[row]
+        due = self.due[row]
+        last_review = self.last_review[row]
+        if iso:
+            due = None if due == NULL_INT else us_to_iso(due)
+            last_review = None if last_review == NULL_INT else us_to_iso(last_review)
+        else:
+            due = None if due == NULL_INT else due
+            last_review = None if last_review == NULL_INT else last_review
+        return {
+            "card_id": self.card_id[row],
+            "state": self.state[row],
+            "step": None if step == NULL_STEP else step,
+            "stability": _float_or_none(self.stability[row]),
+            "difficulty": _float_or_none(self.difficulty[row]),
+            "due": due,
+            "last_review": last_review
+        }
+
+
+class CardTable:
+    """
+    Cards stored column by column, with id -> row and note_id -> rows indexes
+    """
+
+    __slots__ = ("id", "note_id", "direction", "fsrs", "row_of", "rows_of_note", "extras")
+
+    def __init__(self):
+        self.id = array('q')
+        self.note_id = array('q')
+        # Index into DIRECTIONS, -1 if the direction is kept in extras
+        self.direction = array('b')
+        self.fsrs = FsrsColumns()
+        self.row_of = {}
+        # note_id -> rows of that note's cards, in row order
+        self.rows_of_note = {}
+        # Sparse row -> {key: value} for anything the columns can't hold
+        self.extras = {}
+
+    def __len__(self) -> int:
+        return len(self.id)
+
+    @classmethod
+    def from_dicts(cls, cards: Iterable[Dict[str, Any]]) -> "CardTable":
+        table = cls()
+        for card in cards:
+            table.append(card)
+        return table
+
+    def append(self, card: Dict[str, Any]) -> int:
+        """
+        Adds a card dict and returns its row
+        """
+        row = len(self.id)
+        card_id = card["id"]
+        note_id = card.get("note_id")
+        extra = {key: value for key, value in card.items() if key not in CARD_KEYS}
+
+        direction = card.get("direction")
+        if direction in DIRECTIONS:
+            direction = DIRECTIONS.index(direction)
+        else:
+            extra["direction"] = direction
+            direction = -1
+
+        try:
+            fsrs_values = FsrsColumns.encode(card["fsrs_card"])
+        except _UNREPRESENTABLE:
+            fsrs_values = _NULL_FSRS
+            extra["fsrs_card"] = card.get("fsrs_card")
+
+        try:
+            self.id.append(card_id)
+            self.note_id.append(NULL_INT if note_id is None else note_id)
+            self.direction.append(direction)
+            self.fsrs.append(fsrs_values)
+        except (TypeError, OverflowError):
+            # Keep every column the same length
+            self.truncate(row)
+            raise
+        self.row_of[card_id] = row
+        if note_id is not None:
+            self.rows_of_note.setdefault(note_id, []).append(row)
+        if extra:
+            self.extras[row] = extra
+
+        return row
+
+    def truncate(self, length: int):
+        """
+        Drops every row from length on
+        """
+        for column in (self.id, self.note_id, self.direction):
+            del column[length:]
+        self.fsrs.truncate(length)
+        for row in [row for row in self.extras if row >= length]:
+            del self.extras[row]
+        for card_id in [card_id for card_id, row in self.row_of.items() if row >= length]:
+            del self.row_of[card_id]
+        for note_id in [note_id for note_id, rows in self.rows_of_note.items() if rows[-1] >= length]:
+            rows = [row for row in self.rows_of_note[note_id] if row < length]
+            if rows:
+                self.rows_of_note[note_id] = rows
+            else:
+                del self.rows_of_note[note_id]
+
+    def set_fsrs(self, row: int, fsrs_card: Dict[str, Any]):
+        """
+        Replaces the FSRS state of a row
+        """
+        extra = self.extras.get(row)
+        try:
+            self.fsrs.set(row, FsrsColumns.encode(fsrs_card))
+        except _UNREPRESENTABLE:
+            self.fsrs.set(row, _NULL_FSRS)
+            self.extras.setdefault(row, {})["fsrs_card"] = fsrs_card
+            return
+
+        if extra is not None and "fsrs_card" in extra:
+            del extra["fsrs_card"]
+            if not extra:
+                del self.extras[row]
+
+    def due_us(self, row: int) -> Optional[int]:
+        """
+        Returns the due date of a row in epoch microseconds, or None if it has none
+        """
+        due = self.fsrs.due[row]
+        if due != NULL_INT:
+            return due
+        extra = self.extras.get(row)
+        if extra is None or "fsrs_card" not in extra:
+            return None
+        try:
+            return _timestamp_us(extra["fsrs_card"].get("due"))
+        except (AttributeError, TypeError, ValueError):
+            return None
+
+    def get(self, row: int, iso: bool = True) -> Dict[str, Any]:
+        """
+        Materializes the card dict of a row (timestamps as epoch microseconds unless iso)
+        """
+        direction = self.direction[row]
+        card = {
+            "id": self.id[row],
+            "note_id": None if self.note_id[row] == NULL_INT else self.note_id[row],
+            "direction": DIRECTIONS[direction] if direction >= 0 else None,
+            "fsrs_card": self.fsrs.get(row, iso)
+        }
+        extra = self.extras.get(row)
+        if extra:
+            card.update(extra)
+        return card
+
+    def to_dicts(self, iso: bool = True) -> List[Dict[str, Any]]:
+        return [self.get(row, iso) for row in range(len(self.id))]
+
+
+class ReviewLogTable:
+    """
+    Review logs stored column by column, including the card state before each review
+    """
+
+    __slots__ = ("id", "card_id", "rating", "review_datetime", "review_duration", "card", "extras")
+
+    def __init__(self):
+        self.id = array('q')
+        self.card_id = array('q')
+        self.rating = array('b')
+        self.review_datetime = array('q')
+        self.review_duration = array('q')
+        self.card = FsrsColumns()
+        # Sparse row -> {key: value} for anything the columns can't hold
+        self.extras = {}
+
+    def __len__(self) -> int:
+        return len(self.id)
+
+    @classmethod
+    def from_dicts(cls, review_logs: Iterable[Dict[str, Any]]) -> "ReviewLogTable":
+        table = cls()
+        for review_log in review_logs:
+            table.append(review_log)
+        return table
+
+    def append(self, review_log: Dict[str, Any]) -> int:
+        """
+        Adds a review log dict and returns its row
+        """
+        row = len(self.id)
+        log_id = review_log["id"]
+        card_id = review_log["card_id"]
+        rating = review_log["rating"]
+        extra = {key: value for key, value in review_log.items() if key not in REVIEW_LOG_KEYS}
+
+        try:
+            card_values = FsrsColumns.encode(review_log["card"])
+        except _UNREPRESENTABLE:
+            card_values = _NULL_FSRS
+            extra["card"] = review_log.get("card")
+
+        try:
+            review_datetime = _timestamp_us(review_log["review_datetime"])
+        except _UNREPRESENTABLE:
+            review_datetime = None
+        if review_datetime is None:
+            review_datetime = NULL_INT
+            extra["review_datetime"] = review_log.get("review_datetime")
+
+        review_duration = review_log.get("review_duration")
+
+        try:
+            self.id.append(log_id)
+            self.card_id.append(card_id)
+            self.rating.append(rating)
+            self.review_datetime.append(review_datetime)
+            self.review_duration.append(NULL_INT if review_duration is None else review_duration)
+            self.card.append(card_values)
+        except (TypeError, OverflowError):
+            # Keep every column the same length
+            self.truncate(row)
+            raise
+        if extra:
+            self.extras[row] = extra
+
+        return row
+
+    def truncate(self, length: int):
+        """
+        Drops every row from length on
+        """
+        for column in (self.id, self.card_id, self.rating, self.review_datetime, self.review_duration):
+            del column[length:]
+        self.card.truncate(length)
+        for row in [row for row in self.extras if row >= length]:
+            del self.extras[row]
+
+    def take(self, rows: List[int]) -> "ReviewLogTable":
+        """
+        Returns a new table holding the given rows, in that order
+        """
+        table = ReviewLogTable()
+        for name in ("id", "card_id", "rating", "review_datetime", "review_duration"):
+            column = getattr(self, name)
+            setattr(table, name, array(column.typecode, [column[row] for row in rows]))
+        for name in FsrsColumns.__slots__:
+            column = getattr(self.card, name)
+            setattr(table.card, name, array(column.typecode, [column[row] for row in rows]))
+        table.extras = {
+            new_row: self.extras[row] for new_row, row in enumerate(rows) if row in self.extras
+        }
+        return table
+
+    def get(self, row: int, iso: bool = True) -> Dict[str, Any]:
+        """
+        Materializes the review log dict of a row (timestamps as epoch microseconds unless iso)
+        """
+        review_datetime = self.review_datetime[row]
+        review_duration = self.review_duration[row]
+        if review_datetime == NULL_INT:
+            review_datetime = None
+        elif iso:
+            review_datetime = us_to_iso(review_datetime)
+        review_log = {
+            "id": self.id[row],
+            "card_id": self.card_id[row],
+            "card": self.card.get(row, iso),
+            "rating": self.rating[row],
+            "review_datetime": review_datetime,
+            "review_duration": None if review_duration == NULL_INT else review_duration
+        }
+        extra = self.extras.get(row)
+        if extra:
+            review_log.update(extra)
+        return review_log
+
+    def to_dicts(self, iso: bool = True) -> List[Dict[str, Any]]:
+        return [self.get(row, iso) for row in range(len(self.id))]
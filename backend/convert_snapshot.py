@@ -0,0 +1,74 @@
+"""
+Convert the database snapshot between JSON and MessagePack
+
+This script:
+1. Folds any pending journal entries into the source snapshot
+2. Writes the same data to the destination snapshot in the other format
+
+The format of each file is taken from its extension (.json or .msgpack).
+The source is left as it was. Each snapshot has its own journal, notes file
+and log segments, so the two are independent copies from then on.
+Stop the server before converting, then set DATABASE_FORMAT in .env to the
+format you converted to.
+
+Usage:
+    python convert_snapshot.py                                   # database.json -> database.msgpack
+    python convert_snapshot.py database.msgpack database.json    # and back
+"""
+
+import os
+import sys
+from typing import Dict, Tuple
+
+import database
+import snapshot_formats
+from json_store import JSONStore
+
+def convert(source: str, destination: str) -> Tuple[bool, Dict[str, int]]:
+    """
+    Writes the collection in the source snapshot to the destination snapshot
+
+    Returns:
+        Whether journal entries were folded into the source, and the number
+        of notes, cards and review logs written
+    """
+    source_store = JSONStore(source, snapshot_format=snapshot_formats.format_for_path(source))
+    folded = source_store.compact()
+    destination_store = JSONStore(destination, snapshot_format=snapshot_formats.format_for_path(destination))
+    return folded, destination_store.import_items(source_store.iter_items())
+
+def main():
+    """Main function to convert the snapshot"""
+    if len(sys.argv) == 3:
+        source, destination = sys.argv[1], sys.argv[2]
+    elif len(sys.argv) == 1:
+        source, destination = database.DATABASE_FILE, database.MSGPACK_FILE
+    else:
+        print(__doc__)
+        return
+
+    source_format = snapshot_formats.format_for_path(source)
+    destination_format = snapshot_formats.format_for_path(destination)
+
+    print(f"🚀 Converting {source} ({source_format}) to {destination} ({destination_format})...")
+    print("=" * 60)
+
+    if not os.path.exists(source):
+        print(f"❌ Error: {source} not found!")
+        return
+
+    folded, counts = convert(source, destination)
+    if folded:
+        print("📥 Folded pending journal entries into the source snapshot")
+
+    print("=" * 60)
+    print("✅ Conversion complete!")
+    print(f"📊 Summary:")
+    print(f"   - {counts['learning_notes']} learning notes, {counts['cards']} cards, {counts['review_logs']} review logs")
+    print(f"   - {source}: {os.path.getsize(source):,} bytes")
+    print(f"   - {destination}: {os.path.getsize(destination):,} bytes")
+    print()
+    print(f"💡 Set DATABASE_FORMAT={destination_format} in .env to use it")
+
+if __name__ == "__main__":
+    main()
@@ -1,80 +1,428 @@
-import json
 import os
-from typing import Dict, Any
-from threading import Lock
+import re
+from collections import OrderedDict
+from datetime import datetime
+from concurrent.futures import Future
+from threading import Lock, Event
+from typing import Dict, Any, List, Optional, Tuple, Iterator, Iterable, Callable
+from dotenv import load_dotenv
 
-# File path for the database
+import snapshot_formats
+from group_commit import DURABILITY_MODES
+from json_store import JSONStore
+from sqlite_store import SQLiteStore
+
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
+
+# File paths for the database
 DATABASE_FILE = os.path.join(os.path.dirname(__file__), 'database.json')
+MSGPACK_FILE = os.path.join(os.path.dirname(__file__), 'database.msgpack')
+SQLITE_FILE = os.path.join(os.path.dirname(__file__), 'database.sqlite3')
+
+# Storage engine: "json" (snapshot file + journal) or "sqlite" (database.sqlite3)
+# On first start with "sqlite", an existing database.json is imported once
+DATABASE_BACKEND = os.getenv("DATABASE_BACKEND", "json").lower()
+
+# Snapshot format of the "json" engine: "json" (database.json) or "msgpack" (database.msgpack)
+# Use convert_snapshot.py to convert an existing snapshot between formats
+DATABASE_FORMAT = os.getenv("DATABASE_FORMAT", "json").lower()
+
+# When a write counts as done: "fsync" (on disk), "batched" (handed to the OS,
+# fsync'd with the next compaction/checkpoint) or "none" (queued in memory)
+DATABASE_DURABILITY = os.getenv("DATABASE_DURABILITY", "fsync").lower()
+
+# How long the JSON engine collects journal writes before appending them together
+DATABASE_COMMIT_WINDOW_MS = float(os.getenv("DATABASE_COMMIT_WINDOW_MS", "10"))
+
+# Per-user shards live in shards/<shard>/ with the same file names; the
+# default shard (no user) uses the files above
+SHARDS_DIR = os.path.join(os.path.dirname(__file__), 'shards')
+DEFAULT_SHARD = "default"
+
+# Most shards kept open at once; opening another one closes the least
+# recently used (never the default shard)
+MAX_OPEN_SHARDS = int(os.getenv("MAX_OPEN_SHARDS", "32"))
+
+# Shard names end up in file paths
+_SHARD_NAME = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+# One store per shard, each with its own files, lock and background tasks,
+# least recently used first
+_stores = OrderedDict()
+_stores_lock = Lock()
+_background_tasks_started = False
+# Shards whose evicted store is being closed: shard -> Event set once it is closed
+_closing = {}
+# Called with the shard name after a shard's store was closed (see on_shard_closed)
+_closed_listeners = []
+
+# Module settings a worker process needs to open the same stores (see background_jobs.py)
+_SETTINGS = (
+    "DATABASE_FILE", "MSGPACK_FILE", "SQLITE_FILE", "SHARDS_DIR",
+    "DATABASE_BACKEND", "DATABASE_FORMAT", "DATABASE_DURABILITY", "DATABASE_COMMIT_WINDOW_MS"
+)
+
+def get_settings() -> Dict[str, Any]:
+    """
+    Returns the file locations and engine settings in effect, for apply_settings in another process
+    """
+    return {name: globals()[name] for name in _SETTINGS}
+
+def apply_settings(settings: Dict[str, Any]):
+    """
+    Uses the settings of another process (from get_settings); call before opening any store
+    """
+    globals().update({name: settings[name] for name in _SETTINGS if name in settings})
+
+def is_valid_shard(shard: Optional[str]) -> bool:
+    """
+    Returns True if shard is None (default shard) or a usable shard name
+    """
+    return shard is None or bool(_SHARD_NAME.match(shard))
+
+def _create_store(shard: str):
+    """
+    Creates the storage engine selected by DATABASE_BACKEND for one shard
+    """
+    if DATABASE_DURABILITY not in DURABILITY_MODES:
+        raise ValueError(f"Unknown DATABASE_DURABILITY: {DATABASE_DURABILITY}. Must be 'fsync', 'batched' or 'none'.")
+
+    if shard == DEFAULT_SHARD:
+        json_file, msgpack_file, sqlite_file = DATABASE_FILE, MSGPACK_FILE, SQLITE_FILE
+    else:
+        directory = os.path.join(SHARDS_DIR, shard)
+        os.makedirs(directory, exist_ok=True)
+        json_file, msgpack_file, sqlite_file = (
+            os.path.join(directory, os.path.basename(path))
+            for path in (DATABASE_FILE, MSGPACK_FILE, SQLITE_FILE)
+        )
+
+    if DATABASE_BACKEND == "sqlite":
+        return SQLiteStore(sqlite_file, legacy_json_file=json_file, durability=DATABASE_DURABILITY)
+    if DATABASE_BACKEND == "json":
+        if DATABASE_FORMAT not in snapshot_formats.FORMATS:
+            raise ValueError(f"Unknown DATABASE_FORMAT: {DATABASE_FORMAT}. Must be 'json' or 'msgpack'.")
+        return JSONStore(
+            msgpack_file if DATABASE_FORMAT == "msgpack" else json_file,
+            snapshot_format=DATABASE_FORMAT,
+            durability=DATABASE_DURABILITY,
+            commit_window=DATABASE_COMMIT_WINDOW_MS / 1000
+        )
+    raise ValueError(f"Unknown DATABASE_BACKEND: {DATABASE_BACKEND}. Must be 'json' or 'sqlite'.")
+
+def get_store(shard: Optional[str] = None):
+    """
+    Returns the storage engine of a shard, opening it on first use
+
+    Opening a shard beyond MAX_OPEN_SHARDS closes the least recently used
+    one. A caller still holding that store can keep using it (it reopens its
+    files); its next get_store call opens the shard again.
+
+    Args:
+        shard: User/deck shard name, or None for the default shard
+    """
+    shard = shard or DEFAULT_SHARD
+    if not is_valid_shard(shard):
+        raise ValueError(f"Invalid shard name: {shard!r}. Use letters, digits, '-' and '_' (at most 64).")
 
-# Lock for thread-safe file operations
-_file_lock = Lock()
+    while True:
+        with _stores_lock:
+            store = _stores.get(shard)
+            if store is not None:
+                _stores.move_to_end(shard)
+                return store
+            closing = _closing.get(shard)
+            if closing is None:
+                store = _create_store(shard)
+                if _background_tasks_started:
+                    store.start_background_tasks()
+                _stores[shard] = store
+                evicted = _evict_stores()
+                break
+        # Never two stores on the same files: wait until the evicted one is closed
+        closing.wait()
 
-def initialize_database():
+    for name, old_store in evicted:
+        _close_evicted(name, old_store)
+    return store
+
+def _evict_stores() -> List[Tuple[str, Any]]:
+    """
+    Takes the least recently used stores beyond MAX_OPEN_SHARDS out of _stores. Caller must hold _stores_lock.
+
+    Returns:
+        (shard, store) pairs to close with _close_evicted
+    """
+    evicted = []
+    for name in list(_stores):
+        if len(_stores) <= max(MAX_OPEN_SHARDS, 1):
+            break
+        if name != DEFAULT_SHARD:
+            evicted.append((name, _stores.pop(name)))
+            _closing[name] = Event()
+    return evicted
+
+def _close_evicted(shard: str, store):
+    """
+    Closes an evicted store, stopping its background tasks, and tells the
+    on_shard_closed listeners to drop what they keep for the shard
+    """
+    try:
+        store.close()
+        for listener in _closed_listeners:
+            listener(shard)
+    finally:
+        with _stores_lock:
+            _closing.pop(shard).set()
+
+def on_shard_closed(listener: Callable[[str], None]):
+    """
+    Registers a function called with a shard's name when its store is closed
+    to make room for another shard, so per-shard caches can drop its entry
+    """
+    _closed_listeners.append(listener)
+
+def shard_exists(shard: Optional[str]) -> bool:
+    """
+    Returns True for the default shard and for shards that are open or on disk
+    (a shard is created by the first get_store call for it)
+    """
+    shard = shard or DEFAULT_SHARD
+    return shard == DEFAULT_SHARD or shard in _stores or os.path.isdir(os.path.join(SHARDS_DIR, shard))
+
+def list_shards() -> List[str]:
+    """
+    Returns the names of all shards on disk (the default shard first)
     """
-    Creates database.json if it doesn't exist with empty lists
+    shards = [DEFAULT_SHARD]
+    if os.path.isdir(SHARDS_DIR):
+        shards += sorted(
+            name for name in os.listdir(SHARDS_DIR)
+            if name != DEFAULT_SHARD and is_valid_shard(name) and os.path.isdir(os.path.join(SHARDS_DIR, name))
+        )
+    return shards
+
+def initialize_database(shard: Optional[str] = None):
+    """
+    Creates the database if it doesn't exist with empty collections
+    """
+    get_store(shard).initialize()
+
+def start_background_tasks():
+    """
+    Recovers pending writes and starts background maintenance (journal compaction)
+    for the default shard and every shard opened later
+    """
+    global _background_tasks_started
+    get_store()
+    with _stores_lock:
+        _background_tasks_started = True
+        stores = list(_stores.values())
+    for store in stores:
+        store.start_background_tasks()
+
+def close_database():
+    """
+    Stops background maintenance and flushes pending writes of every open shard
     """
-    if not os.path.exists(DATABASE_FILE):
-        initial_data = {
-            "learning_notes": [],
-            "cards": [],
-            "review_logs": []
-        }
-        with _file_lock:
-            with open(DATABASE_FILE, 'w', encoding='utf-8') as f:
-                json.dump(initial_data, f, indent=2, ensure_ascii=False)
+    global _background_tasks_started
+    with _stores_lock:
+        _background_tasks_started = False
+        stores = list(_stores.values())
+        _stores.clear()
+    for store in stores:
+        store.close()
 
-def read_data() -> Dict[str, Any]:
+def read_data(shard: Optional[str] = None) -> Dict[str, Any]:
     """
-    Reads data from database.json
+    Reads the whole database
     Returns a dictionary with learning_notes, cards, and review_logs
     """
-    initialize_database()
-    
-    with _file_lock:
-        try:
-            with open(DATABASE_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            # Ensure all required keys exist
-            if "learning_notes" not in data:
-                data["learning_notes"] = []
-            if "cards" not in data:
-                data["cards"] = []
-            if "review_logs" not in data:
-                data["review_logs"] = []
-            
-            return data
-        except json.JSONDecodeError:
-            # If file is corrupted, reinitialize
-            return {
-                "learning_notes": [],
-                "cards": [],
-                "review_logs": []
-            }
-
-def write_data(data: Dict[str, Any]):
-    """
-    Writes data to database.json atomically
-    """
-    with _file_lock:
-        # Write to a temporary file first
-        temp_file = DATABASE_FILE + '.tmp'
-        with open(temp_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
-        
-        # Replace the original file
-        if os.path.exists(DATABASE_FILE):
-            os.replace(temp_file, DATABASE_FILE)
-        else:
-            os.rename(temp_file, DATABASE_FILE)
-
-def get_next_id(data: Dict[str, Any], key: str) -> int:
-    """
-    Gets the next available ID for a given list (learning_notes, cards, or review_logs)
-    """
-    if not data[key]:
-        return 1
-    
-    max_id = max(item.get('id', 0) for item in data[key])
-    return max_id + 1
+    return get_store(shard).read_data()
 
+def write_data(data: Dict[str, Any], shard: Optional[str] = None):
+    """
+    Replaces the whole database atomically
+    Settings data doesn't set (the scheduler configuration) are kept; call
+    fsrs_controller.invalidate_scheduler(shard) afterwards in case data set them
+    """
+    get_store(shard).write_data(data)
+
+def allocate_id(key: str, shard: Optional[str] = None) -> int:
+    """
+    Reserves the next ID for a collection from its persisted sequence counter
+    """
+    return get_store(shard).allocate_id(key)
+
+def get_version(shard: Optional[str] = None) -> int:
+    """
+    Returns the collection version of a shard: it goes up by one with every
+    write made through this process, and changes whenever another process
+    changed the shard, so cached results can be checked against it
+    """
+    return get_store(shard).get_version()
+
+def get_notes(shard: Optional[str] = None) -> List[Dict[str, Any]]:
+    return get_store(shard).get_notes()
+
+def get_note(note_id: int, shard: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    return get_store(shard).get_note(note_id)
+
+def get_notes_by_id(note_ids: Iterable[int], shard: Optional[str] = None) -> Dict[int, Dict[str, Any]]:
+    """
+    Looks up several notes at once
+
+    Returns:
+        {note_id: note} for the IDs that exist
+    """
+    return get_store(shard).get_notes_by_id(note_ids)
+
+def get_cards(shard: Optional[str] = None) -> List[Dict[str, Any]]:
+    return get_store(shard).get_cards()
+
+def get_card_columns(shard: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Returns the scheduling columns of every card as typed arrays
+
+    Returns:
+        {name: array} for the names in columnar.SCHEDULING_COLUMNS; timestamps
+        are epoch microseconds, missing values NULL_INT (NaN for stability and difficulty)
+    """
+    return get_store(shard).get_card_columns()
+
+def get_card(card_id: int, shard: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    return get_store(shard).get_card(card_id)
+
+def get_cards_for_note(note_id: int, shard: Optional[str] = None) -> List[Dict[str, Any]]:
+    return get_store(shard).get_cards_for_note(note_id)
+
+def get_due_cards(now: datetime, limit: Optional[int] = None, shard: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Returns cards due at or before now, earliest due first
+    """
+    return get_store(shard).get_due_cards(now, limit)
+
+def get_due_forecast(first_day: int, days: int, shard: Optional[str] = None) -> Tuple[int, List[int]]:
+    """
+    Returns (cards due before first_day, [cards due on each of the days from first_day]),
+    days counted by timestamps.study_day; from a histogram the store keeps up
+    to date with every write, so it costs O(days), not O(cards)
+    """
+    return get_store(shard).get_due_forecast(first_day, days)
+
+def get_review_logs(shard: Optional[str] = None) -> List[Dict[str, Any]]:
+    return get_store(shard).get_review_logs()
+
+def iter_review_logs(shard: Optional[str] = None, iso: bool = True,
+                     part: Optional[Tuple[int, int]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Streams every review log without loading the whole history
+    (archived months are read segment by segment with the json engine)
+
+    Args:
+        iso: False to get timestamps as stored (epoch microseconds; logs archived
+            by older versions may still hold ISO strings), skipping the conversion
+            to ISO strings and back for whole-history number crunching
+        part: (index, count) to read only one of count disjoint parts of the
+            history (months with the json engine, id ranges with sqlite), so
+            count processes can read it in parallel
+    """
+    return get_store(shard).iter_review_logs(iso=iso, part=part)
+
+def count_review_logs(shard: Optional[str] = None) -> int:
+    return get_store(shard).count_review_logs()
+
+def insert_note(note: Dict[str, Any], cards: List[Dict[str, Any]], shard: Optional[str] = None):
+    """
+    Adds a note and its cards in one write and waits until it is durable
+    """
+    get_store(shard).insert_note(note, cards)
+
+def submit_note(note: Dict[str, Any], cards: List[Dict[str, Any]], shard: Optional[str] = None) -> Future:
+    """
+    Adds a note and its cards in one write without waiting for it to be durable
+    Returns a future that resolves according to DATABASE_DURABILITY
+    (await it from async code with asyncio.wrap_future)
+    """
+    return get_store(shard).submit_note(note, cards)
+
+def get_scheduler_config(shard: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Returns the scheduler configuration stored for the shard
+    (Scheduler.to_dict() format), or None if it uses the default one
+    """
+    return get_store(shard).get_setting("scheduler")
+
+def submit_scheduler_config(config: Optional[Dict[str, Any]], shard: Optional[str] = None) -> Future:
+    """
+    Stores the shard's scheduler configuration (None goes back to the default)
+    Returns a future that resolves once it is durable
+    """
+    return get_store(shard).submit_setting("scheduler", config)
+
+def record_review(card_id: int, fsrs_card: Dict[str, Any], review_log: Dict[str, Any], shard: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Updates a card's FSRS state and appends its review log in one write
+    Returns the stored review log entry, or None if the card does not exist
+    """
+    return get_store(shard).record_review(card_id, fsrs_card, review_log)
+
+def submit_reviews(answers: List[Tuple[int, Any]],
+                   review: Callable[[Dict[str, Any], Any], Optional[Tuple[Dict[str, Any], Dict[str, Any]]]],
+                   shard: Optional[str] = None) -> Tuple[List[Optional[Dict[str, Any]]], Future]:
+    """
+    Reviews a batch of cards in the given order and stores them in one write
+
+    Args:
+        answers: (card_id, payload) pairs; a card answered several times sees
+            the state left by its earlier answers
+        review: Called with a card's current FSRS state and the payload,
+            returns (new FSRS state, review log) or None to skip the answer
+
+    Returns:
+        The stored review log entry per answer (None for missing cards and
+        skipped answers) and a future that resolves once the batch is durable
+    """
+    return get_store(shard).submit_reviews(answers, review)
+
+def submit_card_states(updates: List[Tuple[int, Any]],
+                       update: Callable[[Dict[str, Any], Any], Optional[Dict[str, Any]]],
+                       shard: Optional[str] = None) -> Tuple[int, Future]:
+    """
+    Replaces the FSRS state of a batch of cards in one write, without review logs
+
+    Args:
+        updates: (card_id, payload) pairs
+        update: Called with a card's current FSRS state and the payload,
+            returns the new FSRS state or None to leave the card as it is
+
+    Returns:
+        The number of cards changed and a future that resolves once they are durable
+    """
+    return get_store(shard).submit_card_states(updates, update)
+
+def submit_answer(card_id: int, review: Callable[[Dict[str, Any]], Tuple[Dict[str, Any], Dict[str, Any]]],
+                  pick: Optional[Callable[[Dict[str, Any]], Any]] = None,
+                  shard: Optional[str] = None) -> Tuple[Optional[Dict[str, Any]], Any, Future]:
+    """
+    Reviews a card and picks what to show next in one locked operation
+
+    Args:
+        card_id: Card being answered
+        review: Called with the card's current FSRS state, returns (new FSRS state, review log)
+        pick: Called with the new FSRS state after the review is stored and
+            before any other write; may read the store
+
+    Returns:
+        The stored review log entry (None if the card does not exist), what
+        pick returned and a future that resolves once the review is durable
+    """
+    return get_store(shard).submit_answer(card_id, review, pick)
+
+def submit_review(card_id: int, fsrs_card: Dict[str, Any], review_log: Dict[str, Any], shard: Optional[str] = None) -> Tuple[Optional[Dict[str, Any]], Future]:
+    """
+    Same as record_review without waiting for the write to be durable
+    Returns the stored review log entry (or None) and a future that resolves
+    according to DATABASE_DURABILITY (await it with asyncio.wrap_future)
+    """
+    return get_store(shard).submit_review(card_id, fsrs_card, review_log)
@@ -0,0 +1,159 @@
+"""
+Due-date index for the JSON engine's card table.
+
+A min-heap of (due, row) pairs kept up to date as cards are reviewed or
+added, so the next due card is found in O(log n) instead of scanning and
+sorting every card. Reviews don't remove a card's old heap entry; instead
+each row's current due date is kept in an array and entries that no longer
+match it are dropped when they reach the top of the heap (lazy deletion).
+The heap is rebuilt once stale entries outnumber the live ones.
+
+Next to the heap, a DueHistogram counts the scheduled rows per study day,
+updated with the same due date changes, for the review forecast.
+"""
+
+import heapq
+from array import array
+from typing import Dict, List, Optional, Iterable, Tuple
+
+from columnar import NULL_INT
+from timestamps import study_day
+
+# Due value of rows that are not scheduled (no FSRS state)
+UNSCHEDULED = NULL_INT
+
+
+class DueHistogram:
+    """
+    Number of scheduled rows per study day (timestamps.study_day)
+
+    Also keeps the number of rows due before the day last asked for, so a
+    forecast costs O(days) instead of summing every earlier day again: a
+    later day only adds the days in between.
+    """
+
+    __slots__ = ("_counts", "_before_day", "_before")
+
+    def __init__(self):
+        # Study day -> rows due that day (days without rows are left out)
+        self._counts: Dict[int, int] = {}
+        # Rows due before _before_day; None until the first forecast
+        self._before_day = None
+        self._before = 0
+
+    def add(self, due: int, count: int = 1):
+        """
+        Counts a row due at an epoch microsecond time (a negative count removes it)
+        """
+        if due == UNSCHEDULED:
+            return
+        day = study_day(due)
+        total = self._counts.get(day, 0) + count
+        if total:
+            self._counts[day] = total
+        else:
+            del self._counts[day]
+        if self._before_day is not None and day < self._before_day:
+            self._before += count
+
+    def forecast(self, first_day: int, days: int) -> Tuple[int, List[int]]:
+        """
+        Returns (rows due before first_day, [rows due on each of the days from first_day])
+        """
+        if self._before_day is None or first_day < self._before_day or first_day - self._before_day > len(self._counts):
+            self._before = sum(count for day, count in self._counts.items() if day < first_day)
+        else:
+            self._before += sum(self._counts.get(day, 0) for day in range(self._before_day, first_day))
+        self._before_day = first_day
+        return self._before, [self._counts.get(day, 0) for day in range(first_day, first_day + days)]
+
+
+class DueIndex:
+    """
+    Min-heap of card rows ordered by due date (epoch microseconds), then row
+    """
+
+    __slots__ = ("_heap", "_due", "_histogram")
+
+    def __init__(self):
+        self._heap = []
+        # Current due date of every row
+        self._due = array('q')
+        self._histogram = DueHistogram()
+
+    @classmethod
+    def build(cls, dues: Iterable[Optional[int]]) -> "DueIndex":
+        """
+        Builds the index in O(n) from the due date of every row, in row order
+        """
+        index = cls()
+        for due in dues:
+            index._due.append(UNSCHEDULED if due is None else due)
+        index._heap = [(due, row) for row, due in enumerate(index._due) if due != UNSCHEDULED]
+        heapq.heapify(index._heap)
+        for due, _ in index._heap:
+            index._histogram.add(due)
+        return index
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+    def set(self, row: int, due: Optional[int]):
+        """
+        Records the due date of a row; rows past the end are added
+        """
+        due = UNSCHEDULED if due is None else due
+        while len(self._due) <= row:
+            self._due.append(UNSCHEDULED)
+        if self._due[row] == due:
+            return
+        self._histogram.add(self._due[row], -1)
+        self._histogram.add(due)
+        self._due[row] = due
+
+        if due != UNSCHEDULED:
+            heapq.heappush(self._heap, (due, row))
+            if len(self._heap) > 2 * len(self._due) + 64:
+                self._rebuild()
+
+    def _rebuild(self):
+        self._heap = [(due, row) for row, due in enumerate(self._due) if due != UNSCHEDULED]
+        heapq.heapify(self._heap)
+
+    def _is_live(self, entry: tuple) -> bool:
+        due, row = entry
+        return self._due[row] == due
+
+    def due(self, now: int, limit: Optional[int] = None) -> List[int]:
+        """
+        Returns the rows due at or before now, earliest first (at most limit rows)
+
+        Costs O((k + s) log n) for k returned rows and s stale entries dropped.
+        """
+        heap = self._heap
+        rows = []
+        live = []
+        seen = set()
+        while heap and (limit is None or len(rows) < limit):
+            entry = heap[0]
+            if not self._is_live(entry) or entry[1] in seen:
+                # Stale, or a duplicate left by a row whose due date changed and changed back
+                heapq.heappop(heap)
+                continue
+            if entry[0] > now:
+                break
+            live.append(heapq.heappop(heap))
+            rows.append(entry[1])
+            seen.add(entry[1])
+
+        # Put the returned rows back; they stay scheduled until reviewed
+        for entry in live:
+            heapq.heappush(heap, entry)
+        return rows
+
+    def forecast(self, first_day: int, days: int) -> Tuple[int, List[int]]:
+        """
+        Returns (rows due before first_day, [rows due on each of the days from
+        first_day]), days counted by timestamps.study_day; costs O(days)
+        """
+        return self._histogram.forecast(first_day, days)
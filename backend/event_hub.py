@@ -0,0 +1,92 @@
+"""
+Push channel for hardware events.
+
+The frontend used to learn about hardware input by polling /hardware/poll
+every 200 ms, and the sensor script fetched /hardware/card-state before
+every gesture. EventHub instead hands each subscriber (a WebSocket or
+Server-Sent Events connection, see main.py) its own queue, and publish()
+puts every event into each of them as it happens.
+
+Events are dicts with a "type": "action" (a hardware action for the study
+page to perform), "card_state" or "page". Subscribers that don't take
+actions (the sensor script only follows the card state) don't receive
+action events, so an action counts as delivered only when a subscriber
+that performs actions got it; otherwise the caller keeps it for
+/hardware/poll.
+
+All methods must be called from the event loop thread.
+"""
+
+import asyncio
+from typing import Dict, Any, Optional
+
+# Events buffered per subscriber before it is considered gone
+MAX_PENDING_EVENTS = 100
+
+
+class EventHub:
+    """
+    Fans events out to subscriber queues
+    """
+
+    def __init__(self, max_pending: int = MAX_PENDING_EVENTS):
+        self._max_pending = max_pending
+        # queue -> whether the subscriber performs hardware actions
+        self._subscribers = {}
+
+    def subscribe(self, actions: bool) -> asyncio.Queue:
+        """
+        Registers a subscriber
+
+        Args:
+            actions: True if the subscriber performs hardware actions (the study page)
+
+        Returns:
+            The queue its events arrive in; None in the queue means the
+            subscriber fell too far behind and was dropped
+        """
+        queue = asyncio.Queue(maxsize=self._max_pending + 1)
+        self._subscribers[queue] = actions
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.pop(queue, None)
+
+    def publish(self, event: Dict[str, Any]) -> int:
+        """
+        Queues an event for every subscriber that wants it
+
+        Returns:
+            How many subscribers that perform actions received it
+        """
+        delivered = 0
+        is_action = event.get("type") == "action"
+        for queue, actions in list(self._subscribers.items()):
+            if is_action and not actions:
+                continue
+            if queue.qsize() >= self._max_pending:
+                # Nobody is reading this queue; drop the subscriber so it
+                # reconnects and starts over from the current state
+                self.unsubscribe(queue)
+                queue.put_nowait(None)
+                continue
+            queue.put_nowait(event)
+            if actions:
+                delivered += 1
+        return delivered
+
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+
+async def next_event(queue: asyncio.Queue, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+    """
+    Waits for the next event of a subscriber
+
+    Returns:
+        The event, or {"type": "keepalive"} if nothing arrived within timeout
+    """
+    try:
+        return await asyncio.wait_for(queue.get(), timeout)
+    except asyncio.TimeoutError:
+        return {"type": "keepalive"}
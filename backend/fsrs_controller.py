@@ -1,6 +1,17 @@
 from fsrs import Scheduler, Card, Rating, ReviewLog
 from datetime import datetime, timezone, timedelta
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, Tuple, List, Optional, Sequence
+from collections import OrderedDict
+from concurrent.futures import Future
+from threading import Lock
+import os
+import numpy as np
+
+import database
+import fsrs_kernel
+from columnar import NULL_INT
+from fsrs_kernel import DECAY, FACTOR
+from timestamps import US_PER_DAY, datetime_to_us, iso_to_us
 
 # Initialize the FSRS scheduler optimized for SHORT-TERM demo/exam prep
 # Based on the FSRS Advanced Learner's Guide:
@@ -48,6 +59,186 @@ scheduler = Scheduler(
     enable_fuzzing=True
 )
 
+# Keys of a stored scheduler configuration (the Scheduler.to_dict() format);
+# keys left out keep the value of the default scheduler above
+CONFIG_KEYS = ("parameters", "desired_retention", "learning_steps", "relearning_steps", "maximum_interval", "enable_fuzzing")
+
+# How many shards keep their built scheduler in memory
+MAX_CACHED_SCHEDULERS = int(os.getenv("MAX_CACHED_SCHEDULERS", "256"))
+
+def build_scheduler(config: Optional[Dict[str, Any]]) -> Scheduler:
+    """
+    Builds a scheduler from a stored configuration, over the default scheduler's settings
+    
+    Args:
+        config: Some or all of CONFIG_KEYS (steps in seconds), or None for the default
+    
+    Raises:
+        ValueError: If the configuration has unknown keys or values out of range
+    """
+    if not config:
+        return scheduler
+    unknown = set(config) - set(CONFIG_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown scheduler settings: {', '.join(sorted(unknown))}")
+    
+    settings = {**scheduler.to_dict(), **config}
+    try:
+        settings["parameters"] = [float(value) for value in settings["parameters"]]
+        settings["desired_retention"] = float(settings["desired_retention"])
+        settings["maximum_interval"] = int(settings["maximum_interval"])
+        settings["enable_fuzzing"] = bool(settings["enable_fuzzing"])
+        for key in ("learning_steps", "relearning_steps"):
+            settings[key] = [int(step) for step in settings[key]]
+    except (TypeError, ValueError):
+        raise ValueError("Scheduler settings must be numbers (steps in seconds)")
+    
+    if len(settings["parameters"]) != len(scheduler.parameters):
+        raise ValueError(f"parameters must have {len(scheduler.parameters)} values")
+    if not 0 < settings["desired_retention"] < 1:
+        raise ValueError("desired_retention must be between 0 and 1")
+    if settings["maximum_interval"] < 1:
+        raise ValueError("maximum_interval must be at least 1 day")
+    for key in ("learning_steps", "relearning_steps"):
+        if any(step <= 0 for step in settings[key]):
+            raise ValueError(f"{key} must be positive numbers of seconds")
+    return Scheduler.from_dict(settings)
+
+class SchedulerCache:
+    """
+    Least recently used shards' schedulers, each with its
+    fsrs_kernel.SchedulerSettings, so reviews never rebuild one
+    
+    A shard's entry is built from its stored configuration on first use and
+    dropped by invalidate when the configuration changes. Every invalidation
+    bumps a generation counter; an entry built from a configuration read
+    before it is returned but not kept, so a stale scheduler can't come back.
+    """
+    
+    def __init__(self, max_size: int = MAX_CACHED_SCHEDULERS):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self._generation = 0
+    
+    def get(self, shard: Optional[str] = None) -> Tuple[Scheduler, fsrs_kernel.SchedulerSettings]:
+        """
+        Returns (scheduler, kernel settings) of a shard, building them on a miss
+        """
+        key = shard or database.DEFAULT_SHARD
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+            generation = self._generation
+        
+        # Outside the lock: reading the configuration may wait for the store
+        built = build_scheduler(database.get_scheduler_config(shard=shard))
+        entry = (built, fsrs_kernel.SchedulerSettings.from_scheduler(built))
+        
+        with self._lock:
+            if generation == self._generation:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return entry
+    
+    def invalidate(self, shard: Optional[str] = None):
+        """
+        Drops a shard's scheduler so the next review rebuilds it from the stored configuration
+        """
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(shard or database.DEFAULT_SHARD, None)
+    
+    def clear(self):
+        """
+        Drops every cached scheduler
+        """
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+schedulers = SchedulerCache()
+
+def get_scheduler(shard: Optional[str] = None) -> Scheduler:
+    """
+    Returns the scheduler of a shard (its stored configuration, or the default scheduler)
+    """
+    return schedulers.get(shard)[0]
+
+def get_kernel_settings(shard: Optional[str] = None) -> fsrs_kernel.SchedulerSettings:
+    """
+    Returns the settings of a shard's scheduler as plain numbers, for fsrs_kernel
+    """
+    return schedulers.get(shard)[1]
+
+def invalidate_scheduler(shard: Optional[str] = None):
+    """
+    Hook for a changed scheduler configuration: the shard's next review
+    uses a scheduler rebuilt from the stored configuration
+    """
+    schedulers.invalidate(shard)
+
+def _config_of(built: Scheduler) -> Dict[str, Any]:
+    config = built.to_dict()
+    config["parameters"] = list(config["parameters"])
+    return config
+
+def get_scheduler_config(shard: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Returns the complete configuration of a shard's scheduler (Scheduler.to_dict() format)
+    """
+    return _config_of(get_scheduler(shard))
+
+def set_scheduler_config(config: Optional[Dict[str, Any]], shard: Optional[str] = None) -> Future:
+    """
+    Stores a shard's scheduler configuration and switches its reviews to it
+    
+    Args:
+        config: Some or all of CONFIG_KEYS, merged over the default scheduler's
+            settings, or None to go back to the default scheduler
+        shard: User/deck shard name, or None for the default shard
+    
+    Returns:
+        A future that resolves once the configuration is durable
+    
+    Raises:
+        ValueError: If the configuration is invalid (nothing is stored)
+    """
+    # Stored complete, so later changes to the default scheduler don't alter it
+    stored = _config_of(build_scheduler(config)) if config else None
+    durable = database.submit_scheduler_config(stored, shard=shard)
+    invalidate_scheduler(shard)
+    return durable
+
+def get_parameters(shard: Optional[str] = None) -> List[float]:
+    """
+    Returns the weights of a shard's scheduler
+    """
+    return list(get_scheduler(shard).parameters)
+
+def set_parameters(parameters: Sequence[float], shard: Optional[str] = None) -> Future:
+    """
+    Stores new weights for a shard (e.g. fitted by fsrs_optimizer), keeping
+    its other settings, and switches its reviews to them
+    
+    Returns:
+        A future that resolves once the configuration is durable
+    """
+    config = get_scheduler_config(shard)
+    config["parameters"] = [float(value) for value in parameters]
+    return set_scheduler_config(config, shard=shard)
+
+_RATINGS = {
+    1: Rating.Again,
+    2: Rating.Hard,
+    3: Rating.Good,
+    4: Rating.Easy
+}
+
 def create_new_card() -> Dict[str, Any]:
     """
     Creates a new FSRS card and returns its dictionary representation
@@ -55,42 +246,65 @@ def create_new_card() -> Dict[str, Any]:
     card = Card()
     return card.to_dict()
 
-def review_card(card_dict: Dict[str, Any], rating: int, now: datetime = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+def review_card(card_dict: Dict[str, Any], rating: int, now: datetime = None,
+                shard: Optional[str] = None,
+                settings: Optional[fsrs_kernel.SchedulerSettings] = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
     """
     Reviews a card with the given rating and returns updated card and review log
     
+    Computed by fsrs_kernel on the card's numbers, without building fsrs Card
+    and ReviewLog objects; the dicts are the same as the shard's
+    Scheduler.review_card gives
+    
     Args:
         card_dict: Dictionary representation of an FSRS card
         rating: Integer from 1-4 representing the user's rating
         now: Optional datetime for the review (defaults to current time if not provided)
+        shard: Shard whose scheduler to use (see get_scheduler), None for the default shard
+        settings: The shard's get_kernel_settings, looked up beforehand; required
+            inside a store callback (submit_reviews), where looking it up could
+            read the store under its own lock
     
     Returns:
         Tuple of (updated_card_dict, review_log_dict)
     """
-    # Deserialize the card
-    card = Card.from_dict(card_dict)
+    now_us = datetime_to_us(now if now is not None else datetime.now(timezone.utc))
+    card = fsrs_kernel.card_from_dict(card_dict)
+    updated_card = fsrs_kernel.review(settings or get_kernel_settings(shard), card, rating, now_us)
+    return fsrs_kernel.card_to_dict(updated_card), fsrs_kernel.review_log_to_dict(card, rating, now_us)
+
+def review_fsrs_card(card: Card, rating: int, now: datetime = None,
+                     shard: Optional[str] = None) -> Tuple[Card, ReviewLog]:
+    """
+    Reviews an fsrs Card object, for callers that keep the card as an object
+    across several reviews instead of serializing it after each one
     
-    # Convert rating integer to Rating enum
-    rating_map = {
-        1: Rating.Again,
-        2: Rating.Hard,
-        3: Rating.Good,
-        4: Rating.Easy
-    }
+    Args:
+        card: The FSRS card
+        rating: Integer from 1-4 representing the user's rating
+        now: Optional datetime for the review (defaults to current time if not provided)
+        shard: Shard whose scheduler to use (see get_scheduler), None for the default shard
     
-    if rating not in rating_map:
+    Returns:
+        Tuple of (updated_card, review_log)
+    """
+    if rating not in _RATINGS:
         raise ValueError(f"Invalid rating: {rating}. Must be 1-4.")
     
-    rating_enum = rating_map[rating]
+    rating_enum = _RATINGS[rating]
+    
+    # fsrs can clamp difficulty to an int (1 or 10) and then rejects the card on
+    # its next review; Card.from_dict converts to float, so do the same here
+    if card.difficulty is not None:
+        card.difficulty = float(card.difficulty)
+    if card.stability is not None:
+        card.stability = float(card.stability)
     
     # Review the card (pass 'now' parameter for backdated or current reviews)
+    shard_scheduler = get_scheduler(shard)
     if now is not None:
-        updated_card, review_log = scheduler.review_card(card, rating_enum, now)
-    else:
-        updated_card, review_log = scheduler.review_card(card, rating_enum)
-    
-    # Return serialized versions
-    return updated_card.to_dict(), review_log.to_dict()
+        return shard_scheduler.review_card(card, rating_enum, now)
+    return shard_scheduler.review_card(card, rating_enum)
 
 def get_card_retrievability(card_dict: Dict[str, Any]) -> float:
     """
@@ -101,9 +315,10 @@ def get_card_retrievability(card_dict: Dict[str, Any]) -> float:
     
     Returns:
         Float between 0 and 1 representing retrievability probability
+        (0 for a card never reviewed, as Card.get_retrievability)
     """
-    card = Card.from_dict(card_dict)
-    return scheduler.get_card_retrievability(card)
+    retrievability = retrievability_batch(*_card_columns(card_dict))[0]
+    return 0.0 if np.isnan(retrievability) else float(retrievability)
 
 def calculate_mastery_score(card_dict: Dict[str, Any]) -> float:
     """
@@ -114,106 +329,92 @@ def calculate_mastery_score(card_dict: Dict[str, Any]) -> float:
     
     Returns:
         Float representing the mastery score
+    
+    Raises:
+        ValueError: If the card has never been reviewed
     """
-    card = Card.from_dict(card_dict)
-    retrievability = scheduler.get_card_retrievability(card)
-    stability = card.stability
+    score = mastery_batch(*_card_columns(card_dict))[0]
+    if np.isnan(score):
+        raise ValueError("Card has not been reviewed yet")
+    return float(score)
+
+def _card_columns(card_dict: Dict[str, Any]) -> Tuple[List[float], np.ndarray]:
+    """
+    One card's stability and elapsed days now, as the batch functions take them
+    """
+    stability = card_dict.get("stability")
+    last_review_us = iso_to_us(card_dict.get("last_review"))
+    elapsed_days = elapsed_days_batch(
+        [NULL_INT if last_review_us is None else last_review_us], datetime_to_us(datetime.now(timezone.utc))
+    )
+    return [np.nan if stability is None else stability], elapsed_days
+
+def elapsed_days_batch(last_reviews_us: Sequence[int], now_us: int) -> np.ndarray:
+    """
+    Calculates the whole days elapsed since the last review of many cards
+    
+    Args:
+        last_reviews_us: Last review of each card in epoch microseconds (NULL_INT if
+            never reviewed), e.g. get_card_columns()["last_review_us"]
+        now_us: Current time in epoch microseconds
     
-    # Mastery score is the product of retrievability and stability
-    return retrievability * stability
+    Returns:
+        Float array of elapsed days (0 for reviews in the future), NaN for cards never reviewed
+    """
+    last_reviews_us = np.asarray(last_reviews_us, dtype=np.int64)
+    reviewed = last_reviews_us != NULL_INT
+    elapsed = np.full(len(last_reviews_us), np.nan)
+    elapsed[reviewed] = np.maximum((now_us - last_reviews_us[reviewed]) // US_PER_DAY, 0)
+    return elapsed
 
-def is_card_due(card_dict: Dict[str, Any]) -> bool:
+def retrievability_batch(stabilities: Sequence[float], elapsed_days: Sequence[float]) -> np.ndarray:
     """
-    Checks if a card is due for review
+    Calculates the retrievability of many cards at once with the forgetting
+    curve of the scheduler (same result as Card.get_retrievability)
     
     Args:
-        card_dict: Dictionary representation of an FSRS card
+        stabilities: Stability of each card in days (NaN if unknown)
+        elapsed_days: Whole days since each card's last review (NaN if never
+            reviewed), see elapsed_days_batch
     
     Returns:
-        Boolean indicating if the card is due
+        Float array of retrievability between 0 and 1, NaN for cards never
+        reviewed or without a stability
     """
-    card = Card.from_dict(card_dict)
-    current_time = datetime.now(timezone.utc)
-    return card.due <= current_time
+    stabilities = np.asarray(stabilities, dtype=np.float64)
+    elapsed_days = np.asarray(elapsed_days, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        retrievability = (1 + FACTOR * elapsed_days / stabilities) ** DECAY
+    # Card.get_retrievability has no value for these either (get_card_retrievability returns 0)
+    retrievability[~(stabilities > 0)] = np.nan
+    return retrievability
 
-def estimate_workload_for_retention(cards: list, target_retention: float) -> float:
+def mastery_batch(stabilities: Sequence[float], elapsed_days: Sequence[float]) -> np.ndarray:
     """
-    Estimates the daily workload (number of reviews) for a given retention target.
+    Calculates the mastery score (retrievability x stability) of many cards at
+    once; calculate_mastery_score is the same for one card
     
-    This uses the FSRS formula to calculate expected intervals at different retention
-    levels and estimates the resulting daily review count.
+    Args:
+        stabilities: Stability of each card in days (NaN if unknown)
+        elapsed_days: Whole days since each card's last review (NaN if never reviewed)
     
-    Higher retention → Shorter intervals → More reviews per day (higher workload)
-    Lower retention → Longer intervals → Fewer reviews per day (lower workload)
+    Returns:
+        Float array of scores, NaN for cards never reviewed or without a stability
+    """
+    stabilities = np.asarray(stabilities, dtype=np.float64)
+    return retrievability_batch(stabilities, elapsed_days) * stabilities
+
+def is_card_due(card_dict: Dict[str, Any]) -> bool:
+    """
+    Checks if a card is due for review
     
     Args:
-        cards: List of card dictionaries
-        target_retention: Target retention rate (0.0 to 1.0)
+        card_dict: Dictionary representation of an FSRS card
     
     Returns:
-        Estimated daily reviews as a float
-    """
-    if not cards:
-        return 0.0
-    
-    # Calculate the average stability of all cards
-    # Cards in different states contribute to overall workload differently
-    total_interval = 0.0
-    card_count = 0
-    
-    for card_data in cards:
-        try:
-            fsrs_card = card_data.get("fsrs_card", {})
-            stability = fsrs_card.get("stability", 1.0)
-            state = fsrs_card.get("state", 0)
-            
-            # For new cards (state 0), use initial stability estimates
-            if state == 0:
-                # New cards will be reviewed frequently initially
-                stability = 1.0
-            
-            # FSRS formula: I(R) = S * (R^(-1/d) - 1) where:
-            # - I is the interval in days
-            # - S is stability
-            # - R is retrievability (target_retention)
-            # - d is decay constant (typically around 0.3 for FSRS)
-            # 
-            # Key insight: As R approaches 1 (high retention), R^(-1/d) gets smaller,
-            # making the interval shorter, requiring more frequent reviews
-            
-            if target_retention > 0:
-                # Use FSRS-like power law with negative exponent
-                # This ensures: high retention → small interval → high workload
-                decay_constant = 0.3  # FSRS typical value
-                
-                # Calculate R^(-1/d) - 1
-                # When R is high (e.g., 0.99), R^(-1/0.3) = R^(-3.33) ≈ very small
-                # When R is low (e.g., 0.70), R^(-3.33) ≈ larger
-                power_term = target_retention ** (-1 / decay_constant)
-                interval = stability * (power_term - 1)
-                
-                # Clamp to reasonable bounds
-                # Minimum 0.5 days, maximum based on stability
-                interval = max(0.5, min(interval, stability * 50))
-            else:
-                interval = stability
-            
-            total_interval += interval
-            card_count += 1
-            
-        except (KeyError, TypeError, ValueError):
-            # Skip cards with invalid data
-            continue
-    
-    if card_count == 0:
-        return 0.0
-    
-    # Average interval across all cards
-    avg_interval = total_interval / card_count
-    
-    # Daily workload = number of cards / average interval
-    # This gives us how many cards need review per day on average
-    daily_workload = card_count / avg_interval if avg_interval > 0 else card_count
-    
-    return round(daily_workload, 2)
+        Boolean indicating if the card is due
+    """
+    card = Card.from_dict(card_dict)
+    current_time = datetime.now(timezone.utc)
+    return card.due <= current_time
 
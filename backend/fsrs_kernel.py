@@ -0,0 +1,410 @@
+"""
+FSRS scheduling step on plain numbers.
+
+fsrs.Scheduler.review_card works on Card objects. Each review through
+fsrs_controller.review_card parses the stored dict into a Card, deep-copies
+it twice (once for the card, once for the review log) and serializes both
+back to dicts with ISO dates. Replaying many reviews spends most of its time
+on that object churn. The functions here compute the same step from the
+card's numbers:
+
+- review: one card as a CardState of Python numbers, timestamps in epoch
+  microseconds and None for missing values. It gives the same result as
+  Scheduler.review_card, including the learning and relearning steps, the
+  maximum interval and fuzzing (which draws from the random module
+  exactly when the library does).
+- review_batch: many cards at once, as a CardState of NumPy arrays
+  (NaN / NULL_STEP / NULL_INT for missing values).
+
+The formulas are those of fsrs 4.x. Check them against fsrs.Scheduler with
+the parameters in fsrs_controller.py by running `python bench_kernel.py`.
+"""
+
+import math
+import random
+from datetime import timedelta
+from typing import Any, Dict, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+from fsrs import Scheduler
+from fsrs.fsrs import FUZZ_RANGES
+
+from columnar import NULL_INT, NULL_STEP
+from timestamps import US_PER_DAY, iso_to_us, us_to_iso
+
+# Forgetting curve constants of fsrs 4.x (Card.get_retrievability)
+DECAY = -0.5
+FACTOR = 0.9 ** (1 / DECAY) - 1
+
+# fsrs.State values
+LEARNING = 1
+REVIEW = 2
+RELEARNING = 3
+
+RATINGS = (1, 2, 3, 4)
+
+_MICROSECOND = timedelta(microseconds=1)
+
+
+class SchedulerSettings(NamedTuple):
+    parameters: Tuple[float, ...]
+    desired_retention: float
+    learning_steps_us: Tuple[int, ...]
+    relearning_steps_us: Tuple[int, ...]
+    maximum_interval: int
+    enable_fuzzing: bool
+
+    @classmethod
+    def from_scheduler(cls, scheduler: Scheduler) -> "SchedulerSettings":
+        return cls(
+            tuple(float(value) for value in scheduler.parameters),
+            scheduler.desired_retention,
+            tuple(step // _MICROSECOND for step in scheduler.learning_steps),
+            tuple(step // _MICROSECOND for step in scheduler.relearning_steps),
+            scheduler.maximum_interval,
+            scheduler.enable_fuzzing
+        )
+
+
+class CardState(NamedTuple):
+    """
+    The fields of an fsrs Card; Python numbers for review, arrays for review_batch
+    """
+    card_id: Any
+    state: Any
+    step: Any
+    stability: Any
+    difficulty: Any
+    due_us: Any
+    last_review_us: Any
+
+
+def card_from_dict(fsrs_card: Dict[str, Any]) -> CardState:
+    """
+    Reads an fsrs_card dict (Card.to_dict()), converting values as Card.from_dict does
+    """
+    return CardState(
+        int(fsrs_card["card_id"]),
+        int(fsrs_card["state"]),
+        fsrs_card["step"],
+        float(fsrs_card["stability"]) if fsrs_card["stability"] else None,
+        float(fsrs_card["difficulty"]) if fsrs_card["difficulty"] else None,
+        iso_to_us(fsrs_card["due"]),
+        iso_to_us(fsrs_card["last_review"])
+    )
+
+
+def card_to_dict(card: CardState) -> Dict[str, Any]:
+    """
+    Returns the fsrs_card dict Card.to_dict() gives for the same card
+    """
+    return {
+        "card_id": card.card_id,
+        "state": card.state,
+        "step": card.step,
+        "stability": card.stability,
+        "difficulty": card.difficulty,
+        "due": us_to_iso(card.due_us),
+        "last_review": us_to_iso(card.last_review_us)
+    }
+
+
+def card_from_batch(cards: CardState, index: int) -> CardState:
+    """
+    Returns one card of a CardState of arrays (see review_batch) as Python numbers and None
+    """
+    stability = float(cards.stability[index])
+    difficulty = float(cards.difficulty[index])
+    step = int(cards.step[index])
+    last_review_us = int(cards.last_review_us[index])
+    return CardState(
+        int(cards.card_id[index]),
+        int(cards.state[index]),
+        None if step == NULL_STEP else step,
+        None if math.isnan(stability) else stability,
+        None if math.isnan(difficulty) else difficulty,
+        int(cards.due_us[index]),
+        None if last_review_us == NULL_INT else last_review_us
+    )
+
+
+def review_log_to_dict(card: CardState, rating: int, review_us: int) -> Dict[str, Any]:
+    """
+    Returns the review log dict ReviewLog.to_dict() gives for a review of card (its state before the review)
+    """
+    return {
+        "card": card_to_dict(card),
+        "rating": rating,
+        "review_datetime": us_to_iso(review_us),
+        "review_duration": None
+    }
+
+
+# Memory model on Python floats; w is SchedulerSettings.parameters
+
+def initial_stability(w: Sequence[float], rating: int) -> float:
+    return max(w[rating - 1], 0.1)
+
+
+def initial_difficulty(w: Sequence[float], rating: int) -> float:
+    return float(min(max(w[4] - math.exp(w[5] * (rating - 1)) + 1, 1), 10))
+
+
+def next_difficulty(w: Sequence[float], difficulty: float, rating: int) -> float:
+    delta_difficulty = -(w[6] * (rating - 3))
+    damped = difficulty + (10.0 - difficulty) * delta_difficulty / 9.0
+    return float(min(max(w[7] * initial_difficulty(w, 4) + (1 - w[7]) * damped, 1), 10))
+
+
+def short_term_stability(w: Sequence[float], stability: float, rating: int) -> float:
+    return stability * math.exp(w[17] * (rating - 3 + w[18]))
+
+
+def next_stability(w: Sequence[float], difficulty: float, stability: float,
+                   retrievability: float, rating: int) -> float:
+    if rating == 1:
+        return min(
+            w[11] * math.pow(difficulty, -w[12]) * (math.pow(stability + 1, w[13]) - 1)
+            * math.exp((1 - retrievability) * w[14]),
+            stability / math.exp(w[17] * w[18])
+        )
+    hard_penalty = w[15] if rating == 2 else 1
+    easy_bonus = w[16] if rating == 4 else 1
+    return stability * (
+        1 + math.exp(w[8]) * (11 - difficulty) * math.pow(stability, -w[9])
+        * (math.exp((1 - retrievability) * w[10]) - 1) * hard_penalty * easy_bonus
+    )
+
+
+def next_interval(settings: SchedulerSettings, stability: float) -> int:
+    """
+    Days until the next review of a card in the Review state, before fuzzing
+    """
+    interval = round((stability / FACTOR) * ((settings.desired_retention ** (1 / DECAY)) - 1))
+    return min(max(interval, 1), settings.maximum_interval)
+
+
+def fuzz_range(settings: SchedulerSettings, interval: int) -> Tuple[int, int]:
+    delta = 1.0
+    for fuzz in FUZZ_RANGES:
+        delta += fuzz["factor"] * max(min(interval, fuzz["end"]) - fuzz["start"], 0.0)
+    min_interval = max(2, int(round(interval - delta)))
+    max_interval = min(int(round(interval + delta)), settings.maximum_interval)
+    return min(min_interval, max_interval), max_interval
+
+
+def fuzzed_interval(settings: SchedulerSettings, interval: int, draw: float) -> int:
+    """
+    Interval after fuzzing with a uniform draw in [0, 1); intervals under 3 days are kept
+    """
+    if interval < 2.5:
+        return interval
+    min_interval, max_interval = fuzz_range(settings, interval)
+    return min(round(draw * (max_interval - min_interval + 1) + min_interval), settings.maximum_interval)
+
+
+def _step_interval(steps: Tuple[int, ...], step: int, rating: int) -> Tuple[Optional[int], Optional[int]]:
+    """
+    Next step and its interval (microseconds) of a card in learning or
+    relearning; (None, None) when the card graduates to Review
+    """
+    if not steps or step > len(steps):
+        return None, None
+    if rating == 1:
+        return 0, steps[0]
+    if rating == 2:
+        if step == 0 and len(steps) == 1:
+            return step, round(steps[0] * 1.5)
+        if step == 0:
+            return step, round((steps[0] + steps[1]) / 2.0)
+        return step, steps[step]
+    if rating == 3 and step + 1 < len(steps):
+        return step + 1, steps[step + 1]
+    return None, None
+
+
+def review(settings: SchedulerSettings, card: CardState, rating: int, now_us: int,
+           fuzz: Optional[float] = None) -> CardState:
+    """
+    Reviews one card, as Scheduler.review_card does
+
+    Args:
+        settings: The scheduler's settings (SchedulerSettings.from_scheduler)
+        card: State before the review; None for missing stability, difficulty, step and last review
+        rating: Integer from 1-4
+        now_us: Review time in epoch microseconds
+        fuzz: Uniform draw in [0, 1) for fuzzing the interval; by default
+            random.random() is called when the interval is fuzzed, like the library does
+
+    Returns:
+        The card's state after the review
+    """
+    if rating not in RATINGS:
+        raise ValueError(f"Invalid rating: {rating}. Must be 1-4.")
+
+    w = settings.parameters
+    state, step, stability, difficulty = card.state, card.step, card.stability, card.difficulty
+    days_since_last_review = None if card.last_review_us is None else (now_us - card.last_review_us) // US_PER_DAY
+
+    if state == LEARNING and stability is None and difficulty is None:
+        stability = initial_stability(w, rating)
+        difficulty = initial_difficulty(w, rating)
+    elif days_since_last_review is not None and days_since_last_review < 1:
+        stability = short_term_stability(w, stability, rating)
+        difficulty = next_difficulty(w, difficulty, rating)
+    else:
+        if days_since_last_review is None:
+            retrievability = 0
+        else:
+            retrievability = (1 + FACTOR * max(0, days_since_last_review) / stability) ** DECAY
+        stability = next_stability(w, difficulty, stability, retrievability, rating)
+        difficulty = next_difficulty(w, difficulty, rating)
+
+    interval_us = None
+    if state == REVIEW:
+        if rating == 1 and settings.relearning_steps_us:
+            state, step, interval_us = RELEARNING, 0, settings.relearning_steps_us[0]
+    else:
+        steps = settings.learning_steps_us if state == LEARNING else settings.relearning_steps_us
+        step, interval_us = _step_interval(steps, step, rating)
+        if interval_us is None:
+            state = REVIEW
+
+    if interval_us is None:
+        interval = next_interval(settings, stability)
+        if settings.enable_fuzzing and interval >= 2.5:
+            interval = fuzzed_interval(settings, interval, random.random() if fuzz is None else fuzz)
+        interval_us = interval * US_PER_DAY
+
+    return CardState(card.card_id, state, step, stability, difficulty, now_us + interval_us, now_us)
+
+
+def review_batch(settings: SchedulerSettings, cards: CardState, ratings, now_us,
+                 fuzz: Optional[np.ndarray] = None) -> CardState:
+    """
+    Reviews many cards at once; same results as review for each card
+
+    Args:
+        settings: The scheduler's settings
+        cards: CardState of arrays; NaN for missing stability and difficulty,
+            NULL_STEP for no step and NULL_INT for no last review
+        ratings: Rating of each card
+        now_us: Review time of each card (or one for all) in epoch microseconds
+        fuzz: Uniform draws in [0, 1), one per card, for fuzzing the intervals;
+            drawn with NumPy if not given
+
+    Returns:
+        CardState of new arrays
+    """
+    w = settings.parameters
+    ratings = np.asarray(ratings, dtype=np.int64)
+    if ratings.size and (ratings.min() < 1 or ratings.max() > 4):
+        raise ValueError("Invalid rating. Must be 1-4.")
+    count = len(ratings)
+    now_us = np.broadcast_to(np.asarray(now_us, dtype=np.int64), (count,))
+    state = np.asarray(cards.state, dtype=np.int64)
+    step = np.asarray(cards.step, dtype=np.int64)
+    stability = np.asarray(cards.stability, dtype=np.float64)
+    difficulty = np.asarray(cards.difficulty, dtype=np.float64)
+    last_review_us = np.asarray(cards.last_review_us, dtype=np.int64)
+
+    reviewed = last_review_us != NULL_INT
+    days_since_last_review = (now_us - np.where(reviewed, last_review_us, now_us)) // US_PER_DAY
+    first = (state == LEARNING) & np.isnan(stability) & np.isnan(difficulty)
+    short_term = ~first & reviewed & (days_since_last_review < 1)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        retrievability = np.where(
+            reviewed, (1 + FACTOR * np.maximum(days_since_last_review, 0) / stability) ** DECAY, 0.0
+        )
+        hard_penalty = np.where(ratings == 2, w[15], 1.0)
+        easy_bonus = np.where(ratings == 4, w[16], 1.0)
+        recall_stability = stability * (
+            1 + math.exp(w[8]) * (11 - difficulty) * stability ** -w[9]
+            * (np.exp((1 - retrievability) * w[10]) - 1) * hard_penalty * easy_bonus
+        )
+        forget_stability = np.minimum(
+            w[11] * difficulty ** -w[12] * ((stability + 1) ** w[13] - 1) * np.exp((1 - retrievability) * w[14]),
+            stability / math.exp(w[17] * w[18])
+        )
+        new_stability = np.select(
+            [first, short_term, ratings == 1],
+            [np.maximum(np.asarray(w[:4])[ratings - 1], 0.1),
+             stability * np.exp(w[17] * (ratings - 3 + w[18])),
+             forget_stability],
+            recall_stability
+        )
+        damped = difficulty + (10.0 - difficulty) * -(w[6] * (ratings - 3)) / 9.0
+        new_difficulty = np.where(
+            first,
+            np.clip(w[4] - np.exp(w[5] * (ratings - 1)) + 1, 1, 10),
+            np.clip(w[7] * initial_difficulty(w, 4) + (1 - w[7]) * damped, 1, 10)
+        )
+
+    new_state = state.copy()
+    new_step = step.copy()
+    interval_us = np.full(count, -1, dtype=np.int64)
+    for steps_state, steps in ((LEARNING, settings.learning_steps_us), (RELEARNING, settings.relearning_steps_us)):
+        in_steps = state == steps_state
+        next_step, step_interval_us = _step_interval_batch(steps, step, ratings)
+        stepping = in_steps & (step_interval_us >= 0)
+        new_step[stepping] = next_step[stepping]
+        interval_us[stepping] = step_interval_us[stepping]
+        new_state[in_steps & ~stepping] = REVIEW
+    if settings.relearning_steps_us:
+        lapsed = (state == REVIEW) & (ratings == 1)
+        new_state[lapsed] = RELEARNING
+        new_step[lapsed] = 0
+        interval_us[lapsed] = settings.relearning_steps_us[0]
+    graduated = interval_us < 0
+    new_step[graduated] = NULL_STEP
+
+    # Review intervals in days, fuzzed as by review
+    intervals = np.clip(
+        np.round((new_stability / FACTOR) * ((settings.desired_retention ** (1 / DECAY)) - 1)),
+        1, settings.maximum_interval
+    )
+    if settings.enable_fuzzing:
+        draws = np.random.random(count) if fuzz is None else np.asarray(fuzz, dtype=np.float64)
+        intervals = np.where(graduated & (intervals >= 2.5), _fuzzed_intervals_batch(settings, intervals, draws), intervals)
+    interval_us = np.where(graduated, intervals.astype(np.int64) * US_PER_DAY, interval_us)
+
+    return CardState(
+        np.asarray(cards.card_id), new_state, new_step, new_stability, new_difficulty,
+        now_us + interval_us, now_us.copy()
+    )
+
+
+def _step_interval_batch(steps: Tuple[int, ...], step: np.ndarray, ratings: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    _step_interval for arrays; the interval is -1 where the card graduates
+    """
+    if not steps:
+        return step, np.full(len(step), -1, dtype=np.int64)
+    steps_us = np.asarray(steps, dtype=np.int64)
+    current = np.clip(step, 0, len(steps) - 1)
+    following = np.clip(step + 1, 0, len(steps) - 1)
+    if len(steps) == 1:
+        hard_first = round(steps[0] * 1.5)
+    else:
+        hard_first = round((steps[0] + steps[1]) / 2.0)
+
+    next_step = np.select([ratings == 1, ratings == 2], [0, step], step + 1)
+    interval_us = np.select(
+        [ratings == 1, ratings == 2, (ratings == 3) & (step + 1 < len(steps))],
+        [steps_us[0], np.where(step == 0, hard_first, steps_us[current]), steps_us[following]],
+        -1
+    )
+    interval_us[step > len(steps)] = -1
+    return next_step, interval_us
+
+
+def _fuzzed_intervals_batch(settings: SchedulerSettings, intervals: np.ndarray, draws: np.ndarray) -> np.ndarray:
+    delta = np.ones(len(intervals))
+    for fuzz in FUZZ_RANGES:
+        delta += fuzz["factor"] * np.maximum(np.minimum(intervals, fuzz["end"]) - fuzz["start"], 0.0)
+    min_intervals = np.maximum(2, np.round(intervals - delta))
+    max_intervals = np.minimum(np.round(intervals + delta), settings.maximum_interval)
+    min_intervals = np.minimum(min_intervals, max_intervals)
+    return np.minimum(np.round(draws * (max_intervals - min_intervals + 1) + min_intervals), settings.maximum_interval)
+
@@ -0,0 +1,460 @@
+"""
+FSRS parameter optimizer.
+
+Fits the 19 model weights of the fsrs 4.x scheduler to a review history,
+the way the reference FSRS optimizer does: each card's reviews are
+replayed through the memory model (stability and difficulty after every
+review), each review a day or more after the previous one is a prediction
+(retrievability) of whether it will be recalled (rating > 1), and the
+weights are moved by Adam to minimize the log loss of these predictions.
+
+fsrs 4.1.1 ships no optimizer and the usual one needs PyTorch, so the
+model is replayed with NumPy instead:
+- Review sequences are laid out step-major: cards sorted by review count,
+  so the cards that have a k-th review are a prefix of the state arrays
+  and step k is one slice of each array; no Python loop over reviews.
+- Gradients are forward differences, evaluated for all 19 weights at once
+  by replaying with a leading axis of 20 parameter sets.
+- Each Adam step uses one minibatch of cards (about BATCH_REVIEWS reviews);
+  a few epochs over the history are enough, as in the reference optimizer.
+
+The memory model mirrors fsrs.Scheduler.review_card: it only depends on
+the ratings and on whether a review came less than a day after the
+previous one (learning steps do not change it), and fuzzing only moves due
+dates, so the replay gives the same stability and difficulty as the
+scheduler (see bench_optimizer.py).
+"""
+
+import math
+import time
+from array import array
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import background_jobs
+import database
+from fsrs_controller import DECAY, FACTOR
+from timestamps import US_PER_DAY, iso_to_us
+
+# Weights the fsrs 4.x memory model uses; the scheduler ignores any after these
+MODEL_WEIGHTS = 19
+
+# Allowed range of each weight while fitting (as in the reference optimizer)
+WEIGHT_BOUNDS = np.array([
+    (0.001, 100.0), (0.001, 100.0), (0.001, 100.0), (0.001, 100.0),  # w[0-3] initial stability
+    (1.0, 10.0),     # w[4]  initial difficulty
+    (0.001, 4.0),    # w[5]  initial difficulty per rating
+    (0.001, 4.0),    # w[6]  difficulty change
+    (0.001, 0.75),   # w[7]  difficulty mean reversion
+    (0.0, 4.5),      # w[8]  stability after success
+    (0.0, 0.8),      # w[9]  stability decay
+    (0.001, 3.5),    # w[10] retrievability gain
+    (0.001, 5.0),    # w[11] stability after failure
+    (0.001, 0.25),   # w[12] difficulty penalty after failure
+    (0.001, 0.9),    # w[13] stability power after failure
+    (0.0, 4.0),      # w[14] retrievability gain after failure
+    (0.0, 1.0),      # w[15] hard penalty
+    (1.0, 6.0),      # w[16] easy bonus
+    (0.0, 2.0),      # w[17] short-term stability
+    (0.0, 2.0),      # w[18] short-term stability
+])
+
+# Stability is kept in this range while replaying, so no step divides by zero
+MIN_STABILITY = 0.01
+MAX_STABILITY = 36500.0
+
+EPOCHS = 5
+BATCH_REVIEWS = 8192
+LEARNING_RATE = 0.04
+
+# Small histories get more epochs, so Adam takes at least this many steps
+MIN_STEPS = 200
+
+# Weight of the pull towards the starting weights, in reviews: with little
+# history the fit stays close to them, with a lot the data decides
+PRIOR_REVIEWS = 100
+
+# Minimum number of scored reviews (a day or more after the previous review) to fit on
+MIN_TRAINING_REVIEWS = 10
+
+
+class ReviewBatch:
+    """
+    Review sequences of some cards in step-major order
+
+    Sequences are sorted by length (longest first), so the sequences with a
+    k-th review are the first counts[k]; ratings[offsets[k]:offsets[k + 1]]
+    and elapsed_days[...] hold those reviews in the same order.
+    """
+
+    def __init__(self, ratings: np.ndarray, elapsed_days: np.ndarray, counts: np.ndarray):
+        self.ratings = ratings
+        self.elapsed_days = elapsed_days
+        self.counts = counts
+        self.offsets = np.concatenate(([0], np.cumsum(counts)))
+        # Reviews that are predictions: a day or more after the previous one
+        self.scored = int(np.count_nonzero(elapsed_days >= 1))
+
+    @property
+    def sequences(self) -> int:
+        return int(self.counts[0]) if len(self.counts) else 0
+
+    @property
+    def reviews(self) -> int:
+        return len(self.ratings)
+
+
+class ReviewHistory:
+    """
+    Every card's review sequence, split into minibatches
+    """
+
+    def __init__(self, batches: List[ReviewBatch], review_count: int):
+        self.batches = batches
+        # Review logs read, including ones of sequences that could not be used
+        self.review_count = review_count
+
+    @property
+    def sequences(self) -> int:
+        return sum(batch.sequences for batch in self.batches)
+
+    @property
+    def reviews(self) -> int:
+        return sum(batch.reviews for batch in self.batches)
+
+    @property
+    def scored(self) -> int:
+        return sum(batch.scored for batch in self.batches)
+
+
+def build_history(card_ids: Sequence[int], ratings: Sequence[int], review_us: Sequence[int],
+                  first_reviews: Sequence[bool], batch_reviews: int = BATCH_REVIEWS, seed: int = 0) -> ReviewHistory:
+    """
+    Groups review logs into per-card sequences and lays them out for replaying
+
+    Args:
+        card_ids, ratings, review_us: Card, rating (1-4) and time (epoch
+            microseconds) of each review log, in any order
+        first_reviews: True for logs of a card's first review (the card had
+            no stability yet); a sequence starts at each of them, and logs
+            of cards whose first review is missing are left out
+        batch_reviews: Approximate number of reviews per minibatch
+        seed: Seed for assigning cards to minibatches
+
+    Returns:
+        The history
+    """
+    card_ids = np.asarray(card_ids, dtype=np.int64)
+    ratings = np.asarray(ratings, dtype=np.int8)
+    review_us = np.asarray(review_us, dtype=np.int64)
+    first_reviews = np.asarray(first_reviews, dtype=bool)
+    review_count = len(card_ids)
+
+    order = np.lexsort((review_us, card_ids))
+    card_ids, ratings, review_us, first_reviews = card_ids[order], ratings[order], review_us[order], first_reviews[order]
+
+    # Sequence number of each log: a new one starts at every first review
+    sequence_ids = np.cumsum(first_reviews)
+    new_card = np.ones(len(card_ids), dtype=bool)
+    new_card[1:] = card_ids[1:] != card_ids[:-1]
+    # Sequence number in effect before each card's first log
+    card_start = np.maximum.accumulate(np.where(new_card, np.arange(len(card_ids)), 0))
+    before_card = sequence_ids[card_start] - first_reviews[card_start]
+    usable = sequence_ids > before_card
+
+    sequence_ids = sequence_ids[usable]
+    ratings = ratings[usable]
+    review_us = review_us[usable]
+    if not len(sequence_ids):
+        return ReviewHistory([], review_count)
+
+    starts = np.ones(len(sequence_ids), dtype=bool)
+    starts[1:] = sequence_ids[1:] != sequence_ids[:-1]
+    start_index = np.flatnonzero(starts)
+    lengths = np.diff(np.append(start_index, len(sequence_ids)))
+    positions = np.arange(len(sequence_ids)) - np.repeat(start_index, lengths)
+
+    # Whole days since the previous review, as Scheduler.review_card counts them
+    elapsed_days = np.zeros(len(sequence_ids), dtype=np.float64)
+    elapsed_days[~starts] = (review_us[1:] - review_us[:-1])[~starts[1:]] // US_PER_DAY
+
+    # Random minibatches of whole sequences
+    sequence_count = len(start_index)
+    batch_count = max(1, int(round(len(sequence_ids) / batch_reviews)))
+    sequence_batch = np.random.default_rng(seed).integers(0, batch_count, sequence_count)
+    log_batch = np.repeat(sequence_batch, lengths)
+    log_length = np.repeat(lengths, lengths)
+    log_sequence = np.repeat(np.arange(sequence_count), lengths)
+
+    batches = []
+    for batch in range(batch_count):
+        logs = np.flatnonzero(log_batch == batch)
+        if not len(logs):
+            continue
+        # Step by step; within a step, longest sequences first
+        logs = logs[np.lexsort((log_sequence[logs], -log_length[logs], positions[logs]))]
+        batches.append(ReviewBatch(
+            ratings[logs].astype(np.int64),
+            elapsed_days[logs],
+            np.bincount(positions[logs])
+        ))
+    return ReviewHistory(batches, review_count)
+
+
+def _split_weights(weights: np.ndarray) -> List[np.ndarray]:
+    """
+    Columns of a (sets, MODEL_WEIGHTS) weight array, each shaped (sets, 1) to broadcast over cards
+    """
+    return [weights[:, j:j + 1] for j in range(MODEL_WEIGHTS)]
+
+
+def initial_states(weights: np.ndarray, ratings: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Stability and difficulty after the first review of each card
+
+    Args:
+        weights: Array of shape (sets, MODEL_WEIGHTS)
+        ratings: Rating of each card's first review
+
+    Returns:
+        Stability and difficulty, shaped (sets, cards)
+    """
+    w = _split_weights(weights)
+    stability = np.clip(np.maximum(weights[:, ratings - 1], 0.1), MIN_STABILITY, MAX_STABILITY)
+    difficulty = np.clip(w[4] - np.exp(w[5] * (ratings - 1)) + 1, 1, 10)
+    return stability, difficulty
+
+
+def next_states(weights: np.ndarray, stability: np.ndarray, difficulty: np.ndarray,
+                ratings: np.ndarray, elapsed_days: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    One review of many cards, as Scheduler.review_card updates their memory state
+
+    Args:
+        weights: Array of shape (sets, MODEL_WEIGHTS)
+        stability, difficulty: State before the review, shaped (sets, cards)
+        ratings: Rating of each card's review
+        elapsed_days: Whole days since each card's previous review
+
+    Returns:
+        Retrievability at the review, and stability and difficulty after it
+    """
+    w = _split_weights(weights)
+    s, d = stability, difficulty
+
+    retrievability = (1 + FACTOR * elapsed_days / s) ** DECAY
+    long_term = elapsed_days >= 1
+
+    hard_penalty = np.where(ratings == 2, w[15], 1.0)
+    easy_bonus = np.where(ratings == 4, w[16], 1.0)
+    recall_stability = s * (
+        1 + np.exp(w[8]) * (11 - d) * s ** -w[9]
+        * (np.exp((1 - retrievability) * w[10]) - 1) * hard_penalty * easy_bonus
+    )
+    forget_stability = np.minimum(
+        w[11] * d ** -w[12] * ((s + 1) ** w[13] - 1) * np.exp((1 - retrievability) * w[14]),
+        s / np.exp(w[17] * w[18])
+    )
+    short_term_stability = s * np.exp(w[17] * (ratings - 3 + w[18]))
+    new_stability = np.clip(
+        np.where(long_term, np.where(ratings == 1, forget_stability, recall_stability), short_term_stability),
+        MIN_STABILITY, MAX_STABILITY
+    )
+
+    easy_difficulty = np.clip(w[4] - np.exp(w[5] * 3) + 1, 1, 10)
+    new_difficulty = np.clip(
+        w[7] * easy_difficulty + (1 - w[7]) * (d + (10 - d) * -(w[6] * (ratings - 3)) / 9),
+        1, 10
+    )
+    return retrievability, new_stability, new_difficulty
+
+
+def _replay(weights: np.ndarray, batch: ReviewBatch) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Replays a batch with several weight vectors at once
+
+    Args:
+        weights: Array of shape (sets, MODEL_WEIGHTS)
+
+    Returns:
+        Summed log loss of the scored reviews for each weight vector, and the
+        stability and difficulty of each sequence after its last review,
+        shaped (sets, sequences)
+    """
+    loss = np.zeros(len(weights))
+    stability, difficulty = initial_states(weights, batch.ratings[:batch.counts[0]])
+
+    for step in range(1, len(batch.counts)):
+        count = batch.counts[step]
+        begin = batch.offsets[step]
+        ratings = batch.ratings[begin:begin + count]
+        elapsed_days = batch.elapsed_days[begin:begin + count]
+
+        retrievability, stability[:, :count], difficulty[:, :count] = next_states(
+            weights, stability[:, :count], difficulty[:, :count], ratings, elapsed_days
+        )
+
+        long_term = elapsed_days >= 1
+        if long_term.any():
+            recalled = ratings[long_term] > 1
+            p = np.clip(retrievability[:, long_term], 1e-6, 1 - 1e-6)
+            loss -= np.where(recalled, np.log(p), np.log(1 - p)).sum(axis=1)
+    return loss, stability, difficulty
+
+
+def replay(parameters: Sequence[float], ratings: Sequence[int], elapsed_days: Sequence[float]) -> List[Tuple[float, float]]:
+    """
+    Replays one card's reviews through the memory model
+
+    Args:
+        parameters: Scheduler weights
+        ratings: Rating of each review
+        elapsed_days: Whole days since the previous review (ignored for the first)
+
+    Returns:
+        (stability, difficulty) after each review
+    """
+    weights = np.asarray(parameters[:MODEL_WEIGHTS], dtype=np.float64)[None, :]
+    states = []
+    for length in range(1, len(ratings) + 1):
+        batch = ReviewBatch(
+            np.asarray(ratings[:length], dtype=np.int64),
+            np.asarray([0.0] + list(elapsed_days[1:length]), dtype=np.float64),
+            np.ones(length, dtype=np.int64)
+        )
+        _, stability, difficulty = _replay(weights, batch)
+        states.append((float(stability[0, 0]), float(difficulty[0, 0])))
+    return states
+
+
+def log_loss(parameters: Sequence[float], history: ReviewHistory) -> float:
+    """
+    Mean log loss of the recall predictions the weights make for a history
+    """
+    weights = np.asarray(parameters[:MODEL_WEIGHTS], dtype=np.float64)[None, :]
+    total = sum(_replay(weights, batch)[0][0] for batch in history.batches)
+    return float(total / max(history.scored, 1))
+
+
+def fit_parameters(history: ReviewHistory, initial_parameters: Sequence[float], epochs: int = EPOCHS,
+                   learning_rate: float = LEARNING_RATE, progress=None, seed: int = 0) -> List[float]:
+    """
+    Fits the model weights to a history with Adam, starting from initial_parameters
+
+    Args:
+        history: Review sequences from build_history
+        initial_parameters: Current scheduler weights (only the first MODEL_WEIGHTS are fitted)
+        epochs: Passes over the history (more if that is fewer than MIN_STEPS minibatches)
+        learning_rate: Adam step size at the start (it decays along a cosine)
+        progress: Called with the fraction of steps done
+        seed: Seed for the minibatch order
+
+    Returns:
+        The fitted weights (MODEL_WEIGHTS of them)
+    """
+    low, high = WEIGHT_BOUNDS[:, 0], WEIGHT_BOUNDS[:, 1]
+    scale = high - low
+    initial = np.clip(np.asarray(initial_parameters[:MODEL_WEIGHTS], dtype=np.float64), low, high)
+    weights = initial.copy()
+    prior = PRIOR_REVIEWS / max(history.scored, 1)
+
+    batches = [batch for batch in history.batches if batch.scored]
+    epochs = max(epochs, math.ceil(MIN_STEPS / max(len(batches), 1)))
+    total_steps = epochs * len(batches)
+    rng = np.random.default_rng(seed)
+    first_moment = np.zeros(MODEL_WEIGHTS)
+    second_moment = np.zeros(MODEL_WEIGHTS)
+    step = 0
+
+    for epoch in range(epochs):
+        for index in rng.permutation(len(batches)):
+            batch = batches[index]
+
+            # Row 0 is the current weights, row 1 + j has weight j nudged (inwards at a bound)
+            delta = 1e-6 * np.maximum(np.abs(weights), 1.0)
+            delta = np.where(weights + delta > high, -delta, delta)
+            candidates = np.repeat(weights[None, :], MODEL_WEIGHTS + 1, axis=0)
+            candidates[1:] += np.diag(delta)
+
+            loss = _replay(candidates, batch)[0] / batch.scored
+            loss += prior * (((candidates - initial) / scale) ** 2).sum(axis=1)
+            gradient = (loss[1:] - loss[0]) / delta
+
+            step += 1
+            first_moment = 0.9 * first_moment + 0.1 * gradient
+            second_moment = 0.999 * second_moment + 0.001 * gradient ** 2
+            rate = learning_rate * 0.5 * (1 + np.cos(np.pi * (step - 1) / total_steps))
+            update = (first_moment / (1 - 0.9 ** step)) / (np.sqrt(second_moment / (1 - 0.999 ** step)) + 1e-8)
+            weights = np.clip(weights - rate * update, low, high)
+
+            if progress is not None:
+                progress(step / total_steps)
+
+    return weights.tolist()
+
+
+def load_review_history(shard: Optional[str] = None, progress=None) -> ReviewHistory:
+    """
+    Reads a shard's review logs (streamed, see database.iter_review_logs) into a ReviewHistory
+
+    Args:
+        progress: Called with the fraction of logs read
+    """
+    total = max(database.count_review_logs(shard=shard), 1)
+    card_ids = array('q')
+    ratings = array('b')
+    review_us = array('q')
+    first_reviews = array('b')
+
+    for count, review_log in enumerate(database.iter_review_logs(shard=shard, iso=False), 1):
+        rating = review_log.get("rating")
+        reviewed_at = review_log.get("review_datetime")
+        if type(reviewed_at) is str:
+            reviewed_at = iso_to_us(reviewed_at)
+        if rating in (1, 2, 3, 4) and reviewed_at is not None:
+            card_ids.append(review_log["card_id"])
+            ratings.append(rating)
+            review_us.append(reviewed_at)
+            first_reviews.append((review_log.get("card") or {}).get("stability") is None)
+        if progress is not None and count % 50_000 == 0:
+            progress(min(count / total, 1.0))
+
+    return build_history(card_ids, ratings, review_us, np.frombuffer(first_reviews, dtype=np.int8).astype(bool))
+
+
+def run_optimization(job_id: int, shard: Optional[str], initial_parameters: Sequence[float]) -> Dict[str, Any]:
+    """
+    Job function for background_jobs: reads a shard's history, fits and evaluates the weights
+
+    Returns:
+        {"parameters": full parameter list (fitted weights followed by any
+        extra ones of initial_parameters), "log_loss_before", "log_loss_after",
+        "review_count", "training_reviews", "cards", "seconds"}
+
+    Raises:
+        ValueError: If the history has too few reviews to fit on
+    """
+    started = time.perf_counter()
+    history = load_review_history(shard, lambda fraction: background_jobs.report_progress(job_id, "reading", 0.3 * fraction))
+    if history.scored < MIN_TRAINING_REVIEWS:
+        raise ValueError(
+            f"Need at least {MIN_TRAINING_REVIEWS} reviews made a day or more after the previous review "
+            f"of their card. Current: {history.scored}"
+        )
+
+    fitted = fit_parameters(
+        history, initial_parameters,
+        progress=lambda fraction: background_jobs.report_progress(job_id, "fitting", 0.3 + 0.65 * fraction)
+    )
+
+    background_jobs.report_progress(job_id, "evaluating", 0.95)
+    return {
+        "parameters": fitted + list(initial_parameters[MODEL_WEIGHTS:]),
+        "log_loss_before": log_loss(initial_parameters, history),
+        "log_loss_after": log_loss(fitted, history),
+        "review_count": history.review_count,
+        "training_reviews": history.scored,
+        "cards": history.sequences,
+        "seconds": round(time.perf_counter() - started, 3)
+    }
@@ -103,6 +103,7 @@ def clear_database():
         "review_logs": []
     }
     database.write_data(data)
+    fsrs_controller.invalidate_scheduler()
     print("✅ Database cleared")
 
 def create_note_with_cards(word, translation, note_id, creation_date):
@@ -343,6 +344,7 @@ def main():
         "review_logs": review_logs
     }
     database.write_data(data)
+    fsrs_controller.invalidate_scheduler()
     
     print("=" * 60)
     print("✅ Dummy data generation complete!")
@@ -13,8 +13,11 @@ Usage: python gen_dummy_logs.py [--debug or -d for detailed output]
 
 import random
 from datetime import datetime, timezone, timedelta
+from fsrs import Card
 import database
 import fsrs_controller
+import fsrs_kernel
+from timestamps import datetime_to_us, us_to_datetime
 
 def generate_card_difficulty_profile():
     """
@@ -48,12 +51,12 @@ def generate_review_logs(cards, start_date, end_date, debug=False):
     
     review_logs = []
     review_log_id = 1
+    settings = fsrs_controller.get_kernel_settings()
     
     profile_stats = {"easy": 0, "hard": 0, "medium-hard": 0, "medium-easy": 0, "average": 0}
     
     for card_idx, card in enumerate(cards, 1):
-        card_dict = card.copy()
-        card_id = card_dict["id"]
+        card_id = card["id"]
         
         weights, profile_name = generate_card_difficulty_profile()
         profile_stats[profile_name] += 1
@@ -68,12 +71,15 @@ def generate_review_logs(cards, start_date, end_date, debug=False):
         if debug:
             print(f"Card {card_id} (#{card_idx}/{len(cards)}): Profile={profile_name}, Target reviews={num_reviews}")
         
-        # Get the initial due date for this card
-        initial_due = card_dict["fsrs_card"].get("due", "")
+        # The FSRS card is parsed once and kept as plain numbers across all its
+        # reviews (fsrs_kernel), so no Card objects are built and copied per review
         try:
-            card_creation_date = datetime.fromisoformat(initial_due.replace('Z', '+00:00'))
-        except:
-            card_creation_date = start_date
+            fsrs_card = fsrs_kernel.card_from_dict(card["fsrs_card"])
+        except (KeyError, TypeError, ValueError):
+            fsrs_card = fsrs_kernel.card_from_dict(Card(due=start_date).to_dict())
+        
+        # Get the initial due date for this card
+        card_creation_date = us_to_datetime(fsrs_card.due_us)
         
         if debug:
             print(f"  Card created at: {card_creation_date.strftime('%Y-%m-%d %H:%M')}")
@@ -93,28 +99,11 @@ def generate_review_logs(cards, start_date, end_date, debug=False):
                     print(f"    Base date: {base_date.strftime('%Y-%m-%d %H:%M')}")
             else:
                 # Subsequent reviews are based on the FSRS due date
-                due_str = card_dict["fsrs_card"].get("due", "")
-                if due_str:
-                    try:
-                        fsrs_due = datetime.fromisoformat(due_str.replace('Z', '+00:00'))
-                        base_date = fsrs_due
-                        
-                        if debug:
-                            print(f"  Review {review_num + 1}: Using FSRS due date")
-                            print(f"    Due: {fsrs_due.strftime('%Y-%m-%d %H:%M')}")
-                    except (ValueError, TypeError):
-                        # Fallback if due date is invalid
-                        fallback_days = random.uniform(0.5, 3)
-                        base_date = last_review_time + timedelta(days=fallback_days) if last_review_time else card_creation_date
-                        
-                        if debug:
-                            print(f"  Review {review_num + 1}: Due invalid, using fallback +{fallback_days:.2f} days")
-                else:
-                    fallback_days = random.uniform(0.5, 3)
-                    base_date = last_review_time + timedelta(days=fallback_days) if last_review_time else card_creation_date
-                    
-                    if debug:
-                        print(f"  Review {review_num + 1}: No due, using fallback +{fallback_days:.2f} days")
+                base_date = us_to_datetime(fsrs_card.due_us)
+                
+                if debug:
+                    print(f"  Review {review_num + 1}: Using FSRS due date")
+                    print(f"    Due: {base_date.strftime('%Y-%m-%d %H:%M')}")
 
             # Add jitter to simulate user reviewing early or late
             jitter_days = random.uniform(-0.3, 0.5)
@@ -162,25 +151,18 @@ def generate_review_logs(cards, start_date, end_date, debug=False):
             
             # Review the card using FSRS with the backdated review_datetime
             # This ensures FSRS calculates intervals from the simulated time, not current time
-            updated_fsrs_card, review_log = fsrs_controller.review_card(card_dict["fsrs_card"], rating, review_datetime)
+            review_us = datetime_to_us(review_datetime)
+            review_log = fsrs_kernel.review_log_to_dict(fsrs_card, rating, review_us)
+            fsrs_card = fsrs_kernel.review(settings, fsrs_card, rating, review_us)
             
             if debug:
-                new_due = updated_fsrs_card.get("due", "")
-                if new_due:
-                    try:
-                        new_due_dt = datetime.fromisoformat(new_due.replace('Z', '+00:00'))
-                        days_until_next = (new_due_dt - review_datetime).total_seconds() / 86400
-                        print(f"    New FSRS due: {new_due_dt.strftime('%Y-%m-%d %H:%M')} (in {days_until_next:.1f} days)")
-                    except:
-                        pass
-            
-            card_dict["fsrs_card"] = updated_fsrs_card
-            
-            review_log["review_datetime"] = review_datetime.isoformat()
+                due = us_to_datetime(fsrs_card.due_us)
+                days_until_next = (due - review_datetime).total_seconds() / 86400
+                print(f"    New FSRS due: {due.strftime('%Y-%m-%d %H:%M')} (in {days_until_next:.1f} days)")
             
             review_log_entry = {
                 "id": review_log_id,
-                "card_id": card_dict["id"],
+                "card_id": card_id,
                 **review_log
             }
             review_logs.append(review_log_entry)
@@ -192,7 +174,7 @@ def generate_review_logs(cards, start_date, end_date, debug=False):
             print(f"  Completed {reviews_completed}/{num_reviews} reviews")
             print()
         
-        card["fsrs_card"] = card_dict["fsrs_card"]
+        card["fsrs_card"] = fsrs_kernel.card_to_dict(fsrs_card)
     
     print()
     print(f"✅ Generated {len(review_logs)} review logs")
@@ -236,12 +218,13 @@ def main():
     
     # Step 1: Read existing database
     print("📖 Reading existing database.json...")
-    data = database.read_data()
-    
-    notes = data.get("learning_notes", [])
-    cards = data.get("cards", [])
+    # Only notes and cards are needed; the old review history (possibly
+    # archived in monthly segments) is counted, not loaded
+    notes = database.get_notes()
+    cards = database.get_cards()
+    old_review_count = database.count_review_logs()
     
-    print(f"✅ Found {len(notes)} notes and {len(cards)} cards")
+    print(f"✅ Found {len(notes)} notes, {len(cards)} cards and {old_review_count} review logs to replace")
     print()
     
     if not cards:
@@ -281,9 +264,13 @@ def main():
     
     # Step 5: Write updated data to database
     print("💾 Writing updated data to database.json...")
-    data["cards"] = cards
-    data["review_logs"] = review_logs
+    data = {
+        "learning_notes": notes,
+        "cards": cards,
+        "review_logs": review_logs
+    }
     database.write_data(data)
+    fsrs_controller.invalidate_scheduler()
     
     print("=" * 60)
     print("✅ Review logs regeneration complete!")
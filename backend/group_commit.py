@@ -0,0 +1,172 @@
+"""
+Group commit for append-only files such as the JSON engine's journal.
+
+Writers submit one line each and get back a concurrent.futures.Future. A
+background thread collects the lines submitted within a short window (10 ms
+by default) and appends them with a single write, so reviews arriving close
+together (hardware buttons plus the web UI) share one write and one fsync
+instead of queueing for the disk one by one.
+
+Durability modes decide when a caller's future resolves:
+- fsync: after the batch is written and fsync'd (survives power loss)
+- batched: after the batch is written to the operating system (survives a
+  crash of the server process; reaches the disk with the next compaction)
+- none: immediately; the batch is written in the background (the last window
+  of writes can be lost if the process dies)
+"""
+
+import os
+import time
+from concurrent.futures import Future
+from threading import Condition, Thread
+from typing import Callable, List, Optional
+
+DURABILITY_MODES = ("fsync", "batched", "none")
+
+# Seconds a batch stays open for more writes
+DEFAULT_WINDOW = 0.010
+
+
+def completed_future(result=None) -> Future:
+    """
+    Returns a future that is already resolved
+    """
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+class GroupCommitWriter:
+    """
+    Appends lines to a file in batches from a background thread
+    """
+
+    def __init__(self, path: str, durability: str = "fsync", window: float = DEFAULT_WINDOW,
+                 on_written: Optional[Callable[[], None]] = None,
+                 on_failed: Optional[Callable[[OSError], None]] = None):
+        """
+        Args:
+            path: File to append to (created if missing, reopened for every batch)
+            durability: One of DURABILITY_MODES
+            window: Seconds to wait for more lines after the first one of a batch
+            on_written: Called from the writer thread after each batch is written
+            on_failed: Called from the writer thread when a batch can't be written
+        """
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"Unknown durability mode: {durability}. Must be one of {', '.join(DURABILITY_MODES)}.")
+        self.path = path
+        self.durability = durability
+        self.window = window
+        self._on_written = on_written
+        self._on_failed = on_failed
+
+        self._cond = Condition()
+        self._pending = []
+        self._batch_started = 0.0
+        self._writing = False
+        self._flush_requested = False
+        self._closing = False
+        self._thread = None
+
+    def submit(self, line: str) -> Future:
+        """
+        Queues one line (including its newline) for the next batch
+
+        Returns:
+            A future that resolves according to the durability mode
+        """
+        future = completed_future() if self.durability == "none" else Future()
+        with self._cond:
+            if not self._pending:
+                self._batch_started = time.monotonic()
+            self._pending.append((line, future))
+            if self._thread is None or not self._thread.is_alive():
+                self._closing = False
+                self._thread = Thread(target=self._run, name="group-commit", daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+        return future
+
+    def busy(self) -> bool:
+        """
+        Returns True while lines are queued or being written
+        """
+        with self._cond:
+            return bool(self._pending) or self._writing
+
+    def flush(self):
+        """
+        Writes everything queued now, without waiting for the window, and waits until it is written
+        """
+        with self._cond:
+            if not self._pending and not self._writing:
+                return
+            self._flush_requested = True
+            self._cond.notify_all()
+            while self._pending or self._writing:
+                self._cond.wait()
+
+    def close(self):
+        """
+        Flushes queued lines and stops the writer thread
+        """
+        self.flush()
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+
+    def _next_batch(self) -> Optional[List[tuple]]:
+        with self._cond:
+            while not self._pending:
+                if self._closing:
+                    return None
+                self._cond.wait()
+
+            deadline = self._batch_started + self.window
+            while not self._flush_requested and not self._closing:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            batch = self._pending
+            self._pending = []
+            self._flush_requested = False
+            self._writing = True
+            return batch
+
+    def _write(self, lines: List[str]):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(''.join(lines))
+            f.flush()
+            if self.durability == "fsync":
+                os.fsync(f.fileno())
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+
+            try:
+                self._write([line for line, _ in batch])
+            except OSError as e:
+                print(f"Group commit to {self.path} failed: {e}")
+                if self._on_failed is not None:
+                    self._on_failed(e)
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                if self._on_written is not None:
+                    self._on_written()
+                for _, future in batch:
+                    if not future.done():
+                        future.set_result(None)
+            finally:
+                with self._cond:
+                    self._writing = False
+                    self._cond.notify_all()
@@ -0,0 +1,1144 @@
+"""
+JSON file storage engine for the language learning database.
+
+Keeps cards and review_logs in a snapshot file (database.json, or
+database.msgpack with the msgpack snapshot format, see snapshot_formats.py) plus
+an append-only journal (database.journal.jsonl). Reviews and new notes are
+written as one journal line each, so their cost does not depend on the
+collection size, and a background compactor periodically folds the journal
+back into the snapshot. Journal lines go through a group-commit writer (see
+group_commit.py): writes arriving within a few milliseconds share one append
+and one fsync.
+
+One parsed copy of the database stays resident in memory and serves every
+read. It is reloaded only when the snapshot or journal changes on disk
+(another process such as gen_dummy_logs.py or paste_dummy_data.py wrote it);
+writes made through the store update the resident copy in place. Cards and
+review logs are held in columnar tables (see columnar.py); their dictionaries
+are only built when a caller asks for them. The snapshot and log segments
+store due / last_review / review_datetime as integer epoch microseconds, so
+nothing is date-parsed on load; ISO strings are only produced for returned
+dictionaries.
+
+Only recent review logs (the current calendar month) stay in the snapshot and
+in memory. At compaction older logs are moved to one segment file per month,
+database.logs/YYYY-MM.jsonl. Whole-history readers stream the segments with
+iter_review_logs() instead of loading them all. The snapshot records how many
+logs each segment holds, and readers ignore any lines past that count. A crash
+during archiving therefore never shows a log twice.
+
+Notes (long sentences and four audio file names each) are only needed for the
+card being shown, so they are kept out of memory. They live in
+database.notes.jsonl, one note per line, and the snapshot stores each note's
+byte offset so get_note() reads just that line. New notes stay in memory until
+the next compaction appends them. A legacy database.json with inline notes is
+read with the streaming parser in json_stream.py and split up on its first
+compaction.
+
+With the msgpack format these files are named database.msgpack.journal.jsonl,
+database.msgpack.logs/ and database.msgpack.notes.jsonl (see sidecar_base), so
+a converted snapshot never shares them with the JSON one it came from.
+"""
+
+import glob
+import json
+import os
+import uuid
+from array import array
+from datetime import datetime, timezone
+from operator import itemgetter
+from concurrent.futures import Future
+from threading import RLock, Thread, Event
+from typing import Dict, Any, List, Optional, Tuple, Iterator, Iterable, Callable
+
+import json_stream
+import snapshot_formats
+from group_commit import GroupCommitWriter, DEFAULT_WINDOW, completed_future
+from columnar import CardTable, ReviewLogTable, NULL_INT, iso_review_log
+from due_index import DueIndex
+from timestamps import datetime_to_us, us_to_datetime
+
+# Seconds between background compactions
+COMPACT_INTERVAL = 30.0
+
+# Fold the journal early once it holds this many entries
+COMPACT_THRESHOLD = 1000
+
+# Review logs from this many calendar months (including the current one) stay
+# in the snapshot; older ones are archived to monthly segments
+HOT_LOG_MONTHS = 1
+
+COLLECTIONS = ("learning_notes", "cards", "review_logs")
+
+# Top-level keys holding per-collection settings (e.g. the scheduler
+# configuration) rather than items; see get_setting / set_setting
+SETTINGS = ("scheduler",)
+
+# Snapshot keys whose lists are loaded item by item
+_STREAMED_KEYS = COLLECTIONS + ("note_offsets",)
+
+# Snapshot keys describing files this store manages; never taken from write_data
+_FILE_KEYS = ("log_segments", "note_offsets", "notes_size", "journal_seq", "replacements")
+
+
+def empty_data() -> Dict[str, Any]:
+    """
+    Returns an empty database document
+    """
+    return {
+        "learning_notes": [],
+        "cards": [],
+        "review_logs": []
+    }
+
+
+def _file_signature(path: str) -> Optional[tuple]:
+    """
+    Returns a value that changes whenever the file is rewritten, or None if it doesn't exist
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    # ctime is included because shutil.copy2 restores the source mtime
+    return (st.st_ino, st.st_size, st.st_mtime_ns, st.st_ctime_ns)
+
+
+def hot_log_cutoff(now: Optional[datetime] = None) -> int:
+    """
+    Returns the start of the hot review log window in epoch microseconds
+    """
+    now = now or datetime.now(timezone.utc)
+    month_index = now.year * 12 + now.month - 1 - (HOT_LOG_MONTHS - 1)
+    start = datetime(month_index // 12, month_index % 12 + 1, 1, tzinfo=timezone.utc)
+    return datetime_to_us(start)
+
+
+def sidecar_base(path: str, snapshot_format: str) -> str:
+    """
+    Returns the path prefix of a snapshot's journal, notes file and log segments
+
+    database.json keeps database.journal.jsonl etc.; other formats add their
+    name (database.msgpack.journal.jsonl), so a JSON and a MessagePack
+    snapshot of the same collection never share files.
+    """
+    base = os.path.splitext(path)[0]
+    return base if snapshot_format == "json" else f"{base}.{snapshot_format}"
+
+
+def _month_of(timestamp_us: int) -> str:
+    return us_to_datetime(timestamp_us).strftime('%Y-%m')
+
+
+class JSONStore:
+    """
+    Storage engine backed by a snapshot file and an append-only journal
+    """
+
+    def __init__(self, path: str, snapshot_format: str = "json", durability: str = "fsync",
+                 commit_window: float = DEFAULT_WINDOW):
+        self.path = path
+        self.snapshot_format = snapshot_format
+        base = sidecar_base(path, snapshot_format)
+        self.journal_path = base + '.journal.jsonl'
+        self.segments_dir = base + '.logs'
+        self.notes_path = base + '.notes.jsonl'
+        self._journal_writer = GroupCommitWriter(
+            self.journal_path,
+            durability=durability,
+            window=commit_window,
+            on_written=self._journal_written,
+            on_failed=self._journal_failed
+        )
+        # Lock for thread-safe file operations; reentrant, so callbacks run
+        # under it (submit_answer's pick) can read the store
+        self._lock = RLock()
+
+        # Sequence number of the last journal entry written or replayed
+        self._journal_seq = 0
+        self._journal_entries = 0
+
+        # Resident copy of the database and the file signatures it was loaded from
+        self._loaded = False
+        self._signature = None
+        # Notes in the notes file: id -> (byte offset, length), and the committed file size
+        self._note_offsets = {}
+        self._notes_size = 0
+        # Notes not written to the notes file yet, by id
+        self._pending_notes = {}
+        self._cards = CardTable()
+        # Card rows ordered by due date, kept up to date on every write
+        self._due_index = DueIndex()
+        self._logs = ReviewLogTable()
+        self._sequences = {}
+        # Archived review logs: month ("YYYY-MM") -> number of logs in its segment
+        self._segments = {}
+        # Set when the hot review logs may hold logs older than the hot window
+        self._needs_archive = False
+        # (temporary file, file) pairs to rename once the snapshot referring
+        # to the new files is saved; recorded in it in case of a crash
+        self._replacements = []
+        # Any other top-level keys of the snapshot, written back unchanged
+        self._meta = {}
+
+        # Incremented whenever the resident copy changes
+        self.version = 0
+
+        self._compactor = None
+        self._wake_compactor = Event()
+
+    def initialize(self):
+        """
+        Creates the snapshot file if it doesn't exist with empty lists
+        """
+        if not os.path.exists(self.path):
+            with self._lock:
+                if not os.path.exists(self.path):
+                    self._current()
+                    self._checkpoint()
+                    self._signature = self._disk_signature()
+
+    def _snapshot_items(self) -> Iterator[Tuple[str, Any]]:
+        """
+        Streams the snapshot as (key, item) pairs, see json_stream.iter_document
+        """
+        if self.snapshot_format == "json":
+            yield from json_stream.iter_file(self.path, _STREAMED_KEYS)
+        else:
+            data = snapshot_formats.load_snapshot(self.path, self.snapshot_format)
+            yield from json_stream.document_items(data, _STREAMED_KEYS)
+
+    def _load(self):
+        """
+        Reads the snapshot and replays the journal on top of it. Caller must hold the lock.
+        """
+        self._replacements = []
+        try:
+            snapshot_seq = self._set_items(self._snapshot_items())
+        except FileNotFoundError:
+            snapshot_seq = self._set_items(json_stream.document_items(empty_data()))
+        except ValueError as e:
+            # Starting empty would compact the empty state over the collection
+            raise ValueError(
+                f"Snapshot {self.path} is corrupted ({e}); restore it from a backup, "
+                f"or move it away together with its journal, notes file and log segments to start empty"
+            ) from e
+        # A crash may have come between saving the snapshot and renaming its files
+        self._finish_replacements()
+
+        self._journal_seq = snapshot_seq
+        self._journal_entries = 0
+
+        for entry in self._read_journal():
+            # Entries already folded into the snapshot are skipped, so a crash
+            # between writing the snapshot and truncating the journal is harmless
+            if entry["seq"] <= snapshot_seq:
+                continue
+            self._apply(entry)
+            self._journal_seq = entry["seq"]
+            self._journal_entries += 1
+
+    def _set_items(self, items: Iterator[Tuple[str, Any]]) -> int:
+        """
+        Replaces the resident copy with a streamed database document. Caller must hold the lock.
+
+        Items are consumed one at a time, so a large legacy database.json is
+        never held in memory as a whole next to the tables built from it.
+
+        Returns:
+            The journal sequence number recorded in the document
+        """
+        pending_notes = {}
+        note_offsets = {}
+        cards = CardTable()
+        logs = ReviewLogTable()
+        sequences = {}
+        segments = {}
+        notes_size = 0
+        journal_seq = 0
+        meta = {}
+
+        for key, value in items:
+            if key == "learning_notes":
+                pending_notes[value["id"]] = value
+            elif key == "cards":
+                cards.append(value)
+            elif key == "review_logs":
+                logs.append(value)
+            elif key == "note_offsets":
+                note_id, offset, length = value
+                note_offsets[note_id] = (offset, length)
+            elif key == "sequences":
+                sequences = dict(value)
+            elif key == "log_segments":
+                segments = dict(value)
+            elif key == "notes_size":
+                notes_size = value
+            elif key == "journal_seq":
+                journal_seq = value
+            elif key == "replacements":
+                self._replacements = [tuple(pair) for pair in value]
+            else:
+                meta[key] = value
+
+        # The counters are persisted with the data and only ever move forward,
+        # so IDs are never reused even after the items holding the highest IDs are deleted
+        highest = {
+            "learning_notes": max(max(pending_notes, default=0), max(note_offsets, default=0)),
+            "cards": max(cards.id, default=0),
+            "review_logs": max(logs.id, default=0)
+        }
+        for key in COLLECTIONS:
+            sequences[key] = max(sequences.get(key, 0), highest[key])
+
+        self._pending_notes = pending_notes
+        self._note_offsets = note_offsets
+        self._notes_size = notes_size
+        self._cards = cards
+        self._due_index = DueIndex.build(cards.due_us(row) for row in range(len(cards)))
+        self._logs = logs
+        self._sequences = sequences
+        self._segments = segments
+        self._needs_archive = True
+        self._meta = meta
+
+        return journal_seq
+
+    def _snapshot_document(self, iso: bool = True) -> Dict[str, Any]:
+        """
+        Materializes the resident copy (hot review logs only) as a snapshot. Caller must hold the lock.
+
+        The snapshot on disk keeps timestamps as epoch microseconds (iso=False),
+        so loading it doesn't parse a date per card and review log.
+        """
+        return {
+            "cards": self._cards.to_dicts(iso),
+            "review_logs": self._logs.to_dicts(iso),
+            **self._meta,
+            "sequences": dict(self._sequences),
+            "note_offsets": [[note_id, offset, length] for note_id, (offset, length) in self._note_offsets.items()],
+            "notes_size": self._notes_size,
+            "log_segments": dict(self._segments),
+            "replacements": [list(pair) for pair in self._replacements],
+            "journal_seq": self._journal_seq
+        }
+
+    def _read_note(self, note_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Returns one note, reading only its line of the notes file. Caller must hold the lock.
+        """
+        note = self._pending_notes.get(note_id)
+        if note is not None:
+            return note
+        location = self._note_offsets.get(note_id)
+        if location is None:
+            return None
+        offset, length = location
+        with open(self.notes_path, 'rb') as f:
+            f.seek(offset)
+            return json.loads(f.read(length))
+
+    def _read_notes_by_id(self, note_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+        """
+        Returns the notes with the given IDs (missing ones are left out), opening
+        the notes file once and reading in file order. Caller must hold the lock.
+        """
+        notes = {}
+        locations = []
+        for note_id in set(note_ids):
+            note = self._pending_notes.get(note_id)
+            if note is not None:
+                notes[note_id] = note
+            elif note_id in self._note_offsets:
+                locations.append((self._note_offsets[note_id], note_id))
+        if locations:
+            locations.sort()
+            with open(self.notes_path, 'rb') as f:
+                for (offset, length), note_id in locations:
+                    f.seek(offset)
+                    notes[note_id] = json.loads(f.read(length))
+        return notes
+
+    def _stream_notes(self, size: int) -> Iterator[Dict[str, Any]]:
+        """
+        Streams the notes stored in the first size bytes of the notes file
+        """
+        if size <= 0:
+            return
+        with open(self.notes_path, 'rb') as f:
+            for line in f:
+                if size <= 0:
+                    break
+                size -= len(line)
+                yield json.loads(line)
+
+    def _read_notes(self) -> List[Dict[str, Any]]:
+        """
+        Returns every note in insertion order. Caller must hold the lock.
+        """
+        return [*self._stream_notes(self._notes_size), *self._pending_notes.values()]
+
+    def _replace_later(self, path: str) -> str:
+        """
+        Returns a new temporary file to write the next contents of path to; it
+        replaces path once the snapshot is saved. Caller must hold the lock.
+        """
+        directory = os.path.dirname(os.path.abspath(self.path))
+        temp_file = f"{path}.{uuid.uuid4().hex[:12]}.tmp"
+        self._replacements.append((os.path.relpath(temp_file, directory), os.path.relpath(path, directory)))
+        return temp_file
+
+    def _finish_replacements(self):
+        """
+        Moves the files written by _replace_later into place. Caller must hold the lock.
+        """
+        directory = os.path.dirname(os.path.abspath(self.path))
+        for temp_file, path in self._replacements:
+            try:
+                os.replace(os.path.join(directory, temp_file), os.path.join(directory, path))
+            except FileNotFoundError:
+                # Already moved (by this process or another one that loaded the snapshot)
+                pass
+
+    def _flush_notes(self):
+        """
+        Appends the pending notes to the notes file. Caller must hold the lock.
+
+        Anything past the committed size (left by a crash) is cut off first;
+        the new size and offsets take effect once the snapshot that records
+        them is written. When nothing of the file is committed any more (after
+        write_data) the saved snapshot may still point into it, so the notes
+        go to a new file that replaces it once the next snapshot is saved.
+        """
+        try:
+            file_size = os.path.getsize(self.notes_path)
+        except FileNotFoundError:
+            file_size = 0
+        if not self._pending_notes and file_size == self._notes_size:
+            return
+
+        offset = self._notes_size
+        rewrite = offset == 0 and file_size > 0
+        with open(self._replace_later(self.notes_path) if rewrite else self.notes_path, 'wb' if rewrite else 'ab') as f:
+            f.truncate(offset)
+            for note_id, note in self._pending_notes.items():
+                line = (json.dumps(note, ensure_ascii=False) + '\n').encode('utf-8')
+                f.write(line)
+                self._note_offsets[note_id] = (offset, len(line))
+                offset += len(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+        self._notes_size = offset
+        self._pending_notes = {}
+
+    def _segment_path(self, month: str) -> str:
+        return os.path.join(self.segments_dir, month + '.jsonl')
+
+    def _read_segment(self, month: str, count: int, iso: bool = True) -> Iterator[Dict[str, Any]]:
+        """
+        Streams the first count review logs of a segment; anything after them was never committed
+
+        Segments store timestamps as epoch microseconds; they are converted to
+        ISO strings unless iso is False.
+        """
+        if count <= 0:
+            return
+        with open(self._segment_path(month), 'r', encoding='utf-8') as f:
+            for index, line in enumerate(f):
+                if index >= count:
+                    break
+                review_log = json.loads(line)
+                yield iso_review_log(review_log) if iso else review_log
+
+    def _archive_logs(self):
+        """
+        Moves review logs older than the hot window to their monthly segments. Caller must hold the lock.
+
+        Each touched segment is rewritten atomically as its committed logs plus
+        the new ones; the new count only takes effect once the snapshot that
+        records it is written. A segment with no committed logs that exists
+        on disk (after write_data) may still be read through the saved
+        snapshot, so it is only replaced once the next snapshot is saved.
+        """
+        cutoff = hot_log_cutoff()
+        rows_by_month = {}
+        keep = []
+        for row, timestamp in enumerate(self._logs.review_datetime):
+            if NULL_INT < timestamp < cutoff:
+                rows_by_month.setdefault(_month_of(timestamp), []).append(row)
+            else:
+                keep.append(row)
+        self._needs_archive = False
+        if not rows_by_month:
+            return
+
+        os.makedirs(self.segments_dir, exist_ok=True)
+        for month, rows in sorted(rows_by_month.items()):
+            committed = self._segments.get(month, 0)
+            path = self._segment_path(month)
+            deferred = committed == 0 and os.path.exists(path)
+            temp_file = self._replace_later(path) if deferred else path + '.tmp'
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                for review_log in self._read_segment(month, committed, iso=False):
+                    f.write(json.dumps(review_log, ensure_ascii=False) + '\n')
+                for row in rows:
+                    f.write(json.dumps(self._logs.get(row, iso=False), ensure_ascii=False) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            if not deferred:
+                os.replace(temp_file, path)
+            self._segments[month] = committed + len(rows)
+
+        self._logs = self._logs.take(keep)
+
+    def _remove_stale_segments(self):
+        """
+        Deletes segment files the snapshot no longer refers to. Caller must hold the lock.
+        """
+        if not os.path.isdir(self.segments_dir):
+            return
+        for name in os.listdir(self.segments_dir):
+            month = os.path.splitext(name)[0]
+            if name.endswith('.tmp') or month not in self._segments:
+                os.remove(os.path.join(self.segments_dir, name))
+
+    def _checkpoint(self):
+        """
+        Archives old review logs, writes the snapshot and truncates the journal. Caller must hold the lock.
+        """
+        self._replacements = []
+        if self._needs_archive:
+            self._archive_logs()
+        self._flush_notes()
+        self._dump(self._snapshot_document(iso=False))
+        self._finish_replacements()
+        self._remove_stale_segments()
+        for temp_file in glob.glob(glob.escape(self.notes_path) + '.*.tmp'):
+            # Notes written before a crash that came before their snapshot
+            os.remove(temp_file)
+
+    def _bump_sequence(self, key: str, item_id: int):
+        if item_id > self._sequences[key]:
+            self._sequences[key] = item_id
+
+    def _apply(self, entry: Dict[str, Any]):
+        """
+        Applies one journal entry ({"op": "review", ...}, {"op": "reviews", "reviews": [...]},
+        {"op": "note", ...}, {"op": "cards", "cards": [...]} or {"op": "setting", ...})
+        to the resident copy
+        """
+        if entry["op"] == "review":
+            row = self._cards.row_of.get(entry["card_id"])
+            if row is None:
+                return
+            self._cards.set_fsrs(row, entry["fsrs_card"])
+            self._due_index.set(row, self._cards.due_us(row))
+            self._logs.append(entry["review_log"])
+            self._needs_archive = True
+            self._bump_sequence("review_logs", entry["review_log"]["id"])
+
+        elif entry["op"] == "reviews":
+            for review in entry["reviews"]:
+                self._apply({"op": "review", **review})
+
+        elif entry["op"] == "note":
+            self._pending_notes[entry["note"]["id"]] = entry["note"]
+            self._bump_sequence("learning_notes", entry["note"]["id"])
+            for card in entry["cards"]:
+                row = self._cards.append(card)
+                self._due_index.set(row, self._cards.due_us(row))
+                self._bump_sequence("cards", card["id"])
+
+        elif entry["op"] == "cards":
+            for card in entry["cards"]:
+                row = self._cards.row_of.get(card["card_id"])
+                if row is not None:
+                    self._cards.set_fsrs(row, card["fsrs_card"])
+                    self._due_index.set(row, self._cards.due_us(row))
+
+        elif entry["op"] == "setting":
+            if entry["value"] is None:
+                self._meta.pop(entry["name"], None)
+            else:
+                self._meta[entry["name"]] = entry["value"]
+
+    def _disk_signature(self) -> tuple:
+        return (_file_signature(self.path), _file_signature(self.journal_path))
+
+    def _current(self):
+        """
+        Reloads the resident copy if the files changed on disk. Caller must hold the lock.
+        """
+        if self._loaded and self._journal_writer.busy():
+            # Our own journal writes are still on their way to disk
+            return
+        signature = self._disk_signature()
+        if not self._loaded or signature != self._signature:
+            self._load()
+            self._loaded = True
+            self._signature = signature
+            self.version += 1
+
+    def _changed(self):
+        """
+        Records a write made through this store. Caller must hold the lock.
+        """
+        self._signature = self._disk_signature()
+        self.version += 1
+
+    def _journal_written(self):
+        # Called by the journal writer thread, so the next _current() doesn't
+        # mistake our own appends for another process writing the journal
+        self._signature = (self._signature[0], _file_signature(self.journal_path))
+
+    def _journal_failed(self, error: OSError):
+        # The resident copy holds entries that never reached the journal;
+        # reload it from disk on next access
+        self._loaded = False
+
+    def _read_journal(self) -> List[Dict[str, Any]]:
+        """
+        Returns the journal entries in write order, ignoring a torn final line
+        """
+        entries = []
+        try:
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entries.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        # A crash mid-append can only damage the last line
+                        break
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def _append_journal(self, entry: Dict[str, Any]) -> Future:
+        """
+        Queues one entry for the journal. Caller must hold the lock.
+
+        Returns:
+            A future that resolves once the entry is durable (see group_commit.py)
+        """
+        self._journal_seq += 1
+        entry["seq"] = self._journal_seq
+
+        durable = self._journal_writer.submit(json.dumps(entry, ensure_ascii=False) + '\n')
+
+        self._journal_entries += 1
+        if self._journal_entries >= COMPACT_THRESHOLD and self._compactor is not None:
+            # Wake the compactor early
+            self._wake_compactor.set()
+
+        return durable
+
+    def _dump(self, data: Dict[str, Any]):
+        """
+        Writes the snapshot atomically and truncates the journal. Caller must hold the lock.
+        """
+        # Queued journal lines must land before the journal is removed
+        self._journal_writer.flush()
+        data["journal_seq"] = self._journal_seq
+
+        # Write to a temporary file first
+        temp_file = self.path + '.tmp'
+        with open(temp_file, 'wb') as f:
+            f.write(snapshot_formats.dumps(data, self.snapshot_format))
+            f.flush()
+            os.fsync(f.fileno())
+
+        # Replace the original file
+        os.replace(temp_file, self.path)
+
+        # Everything in the journal is now part of the snapshot
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self._journal_entries = 0
+
+    def compact(self) -> bool:
+        """
+        Folds the journal into the snapshot and archives review logs that left the hot window
+
+        Returns:
+            True if there was anything to fold or archive
+        """
+        with self._lock:
+            self._journal_writer.flush()
+            self._current()
+            if not os.path.exists(self.journal_path) and not self._needs_archive and not self._pending_notes:
+                return False
+            self._checkpoint()
+            self._signature = self._disk_signature()
+            return True
+
+    def _compact_loop(self):
+        while True:
+            woken = self._wake_compactor.wait(COMPACT_INTERVAL)
+            if woken:
+                self._wake_compactor.clear()
+                if self._compactor is None:
+                    return
+            try:
+                self.compact()
+            except (OSError, ValueError) as e:
+                print(f"Journal compaction failed: {e}")
+
+    def start_background_tasks(self):
+        """
+        Replays any journal left by a previous run and starts the background compactor
+        """
+        self.initialize()
+        self.compact()
+
+        if self._compactor is None:
+            self._compactor = Thread(target=self._compact_loop, name="journal-compactor", daemon=True)
+            self._compactor.start()
+
+    def close(self):
+        """
+        Stops the background compactor and folds the journal into the snapshot
+        """
+        compactor = self._compactor
+        if compactor is not None:
+            self._compactor = None
+            self._wake_compactor.set()
+            compactor.join()
+        self.compact()
+        self._journal_writer.close()
+
+    def read_data(self) -> Dict[str, Any]:
+        """
+        Returns the whole database
+        A dictionary with learning_notes, cards, and review_logs, built from the
+        resident tables; changes must be saved with write_data. ID counters and
+        settings are not included (see allocate_id and get_setting).
+        """
+        with self._lock:
+            self._current()
+            return {
+                "learning_notes": self._read_notes(),
+                "cards": self._cards.to_dicts(),
+                # Archived by month; returned in id (insertion) order, as SQLiteStore does
+                "review_logs": sorted([
+                    review_log
+                    for month, count in sorted(self._segments.items())
+                    for review_log in self._read_segment(month, count)
+                ] + self._logs.to_dicts(), key=itemgetter("id"))
+            }
+
+    def write_data(self, data: Dict[str, Any]):
+        """
+        Replaces the whole database; settings (SETTINGS) that data doesn't
+        set keep their stored values, and the ID counters never go back
+        """
+        with self._lock:
+            self._current()
+            # The notes file and segments are replaced as well: every note and
+            # log in data starts out pending
+            data = {
+                **{name: value for name, value in self._meta.items() if name in SETTINGS},
+                **{key: value for key, value in data.items() if key not in _FILE_KEYS}
+            }
+            given = data.get("sequences") or {}
+            data["sequences"] = {
+                key: max(value, given.get(key, 0)) for key, value in {**given, **self._sequences}.items()
+            }
+            self._replace_items(json_stream.document_items(data, COLLECTIONS))
+
+    def import_items(self, items: Iterator[Tuple[str, Any]]) -> Dict[str, int]:
+        """
+        Replaces the whole database with a streamed document, e.g. another
+        store's iter_items(), taking its ID counters and settings as well
+
+        Returns:
+            Item counts per collection
+        """
+        with self._lock:
+            return self._replace_items((key, value) for key, value in items if key not in _FILE_KEYS)
+
+    def _replace_items(self, items: Iterator[Tuple[str, Any]]) -> Dict[str, int]:
+        """
+        Replaces the resident copy and saves it as the new snapshot. Caller must hold the lock.
+
+        Returns:
+            Item counts per collection
+        """
+        self._set_items(items)
+        # Every note and log starts out pending, until the checkpoint writes them out
+        counts = {"learning_notes": len(self._pending_notes), "cards": len(self._cards), "review_logs": len(self._logs)}
+        self._loaded = True
+        self._checkpoint()
+        self._changed()
+        return counts
+
+    def get_version(self) -> int:
+        """
+        Returns a number that goes up by one with every write made through this
+        store (and whenever another process changed the files)
+        """
+        with self._lock:
+            self._current()
+            return self.version
+
+    def get_notes(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            self._current()
+            return self._read_notes()
+
+    def get_note(self, note_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._current()
+            return self._read_note(note_id)
+
+    def get_notes_by_id(self, note_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+        with self._lock:
+            self._current()
+            return self._read_notes_by_id(note_ids)
+
+    def get_cards(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            self._current()
+            return self._cards.to_dicts()
+
+    def get_card_columns(self) -> Dict[str, array]:
+        """
+        Returns copies of the scheduling columns of every card, in row order
+        (see columnar.SCHEDULING_COLUMNS), for math over all cards without
+        building a dict or parsing a date per card. Missing integers are
+        NULL_INT and a missing stability or difficulty is NaN.
+        """
+        with self._lock:
+            self._current()
+            cards = self._cards
+            return {
+                "id": array('q', cards.id),
+                "note_id": array('q', cards.note_id),
+                "state": array('b', cards.fsrs.state),
+                "stability": array('d', cards.fsrs.stability),
+                "difficulty": array('d', cards.fsrs.difficulty),
+                "due_us": array('q', cards.fsrs.due),
+                "last_review_us": array('q', cards.fsrs.last_review)
+            }
+
+    def get_card(self, card_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._current()
+            row = self._cards.row_of.get(card_id)
+            return None if row is None else self._cards.get(row)
+
+    def get_cards_for_note(self, note_id: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            self._current()
+            return [self._cards.get(row) for row in self._cards.rows_of_note.get(note_id, ())]
+
+    def get_due_cards(self, now: datetime, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Returns cards whose FSRS due date is <= now, earliest first
+        """
+        now_us = datetime_to_us(now)
+
+        with self._lock:
+            self._current()
+            return [self._cards.get(row) for row in self._due_index.due(now_us, limit)]
+
+    def get_due_forecast(self, first_day: int, days: int) -> Tuple[int, List[int]]:
+        """
+        Returns (cards due before first_day, [cards due on each of the days from first_day]),
+        days counted by timestamps.study_day; from the due index's histogram, in O(days)
+        """
+        with self._lock:
+            self._current()
+            return self._due_index.forecast(first_day, days)
+
+    def get_review_logs(self) -> List[Dict[str, Any]]:
+        """
+        Returns every review log in id order (iter_review_logs streams them by month)
+        """
+        return sorted(self.iter_review_logs(), key=itemgetter("id"))
+
+    def iter_items(self) -> Iterator[Tuple[str, Any]]:
+        """
+        Streams the whole database as (key, item) pairs (see json_stream.iter_document)
+
+        Notes and archived review logs are read from disk one at a time, so
+        another store can import a large collection without it ever being
+        materialized as one document.
+        """
+        with self._lock:
+            self._current()
+            notes_size = self._notes_size
+            pending_notes = list(self._pending_notes.values())
+            cards = self._cards.to_dicts()
+            segments = sorted(self._segments.items())
+            hot_logs = self._logs.to_dicts()
+            sequences = dict(self._sequences)
+            meta = dict(self._meta)
+
+        for note in self._stream_notes(notes_size):
+            yield "learning_notes", note
+        for note in pending_notes:
+            yield "learning_notes", note
+        for card in cards:
+            yield "cards", card
+        for month, count in segments:
+            for review_log in self._read_segment(month, count):
+                yield "review_logs", review_log
+        for review_log in hot_logs:
+            yield "review_logs", review_log
+        yield from meta.items()
+        yield "sequences", sequences
+
+    def iter_review_logs(self, iso: bool = True, part: Optional[Tuple[int, int]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Streams every review log, oldest segment first, then the hot ones
+
+        Archived months are read from their segment files one log at a time,
+        so the whole history is never held in memory. With iso=False the
+        timestamps stay epoch microseconds, as stored. With part=(index, count)
+        only every count-th month from index is read (the hot logs go with
+        part 0), so count readers can share the history.
+        """
+        with self._lock:
+            self._current()
+            segments = sorted(self._segments.items())
+            hot_logs = self._logs.to_dicts(iso=iso) if part is None or part[0] == 0 else []
+        if part is not None:
+            segments = segments[part[0]::part[1]]
+
+        for month, count in segments:
+            yield from self._read_segment(month, count, iso=iso)
+        yield from hot_logs
+
+    def count_review_logs(self) -> int:
+        with self._lock:
+            self._current()
+            return sum(self._segments.values()) + len(self._logs)
+
+    def allocate_id(self, key: str) -> int:
+        """
+        Reserves and returns the next ID for a collection
+
+        The counter is persisted by the journal entry that stores the item, so
+        an ID reserved for an item that is never written may be handed out again
+        after a restart, but never one that was stored.
+        """
+        with self._lock:
+            self._current()
+            self._sequences[key] += 1
+            return self._sequences[key]
+
+    def get_setting(self, name: str) -> Any:
+        """
+        Returns a setting stored with the collection (one of SETTINGS), or None
+        """
+        with self._lock:
+            self._current()
+            return self._meta.get(name)
+
+    def submit_setting(self, name: str, value: Any) -> Future:
+        """
+        Stores a JSON-serializable setting (None removes it) as one journal entry
+
+        Returns:
+            A future that resolves once the entry is durable
+        """
+        if name not in SETTINGS:
+            raise ValueError(f"Unknown setting: {name}")
+        with self._lock:
+            self._current()
+            entry = {"op": "setting", "name": name, "value": value}
+            durable = self._append_journal(entry)
+            self._apply(entry)
+            self.version += 1
+            return durable
+
+    def set_setting(self, name: str, value: Any):
+        """
+        Stores a setting and waits until it is durable
+        """
+        self.submit_setting(name, value).result()
+
+    def submit_note(self, note: Dict[str, Any], cards: List[Dict[str, Any]]) -> Future:
+        """
+        Adds a note together with its cards as one journal entry
+
+        Returns:
+            A future that resolves once the entry is durable
+        """
+        with self._lock:
+            self._current()
+            entry = {"op": "note", "note": note, "cards": cards}
+            durable = self._append_journal(entry)
+            self._apply(entry)
+            self.version += 1
+            return durable
+
+    def insert_note(self, note: Dict[str, Any], cards: List[Dict[str, Any]]):
+        """
+        Adds a note together with its cards and waits until it is durable
+        """
+        self.submit_note(note, cards).result()
+
+    def submit_review(self, card_id: int, fsrs_card: Dict[str, Any], review_log: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Future]:
+        """
+        Stores a card's new FSRS state and its review log as one journal entry
+
+        Returns:
+            The stored review log entry (None if the card does not exist) and
+            a future that resolves once it is durable
+        """
+        with self._lock:
+            self._current()
+            if card_id not in self._cards.row_of:
+                return None, completed_future()
+            return self._submit_review(card_id, fsrs_card, review_log)
+
+    def _submit_review(self, card_id: int, fsrs_card: Dict[str, Any], review_log: Dict[str, Any]) -> Tuple[Dict[str, Any], Future]:
+        """
+        Journals and applies a review of an existing card. Caller must hold the lock.
+        """
+        self._sequences["review_logs"] += 1
+        review_log_entry = {
+            "id": self._sequences["review_logs"],
+            "card_id": card_id,
+            **review_log
+        }
+        entry = {
+            "op": "review",
+            "card_id": card_id,
+            "fsrs_card": fsrs_card,
+            "review_log": review_log_entry
+        }
+        durable = self._append_journal(entry)
+        self._apply(entry)
+        self.version += 1
+
+        return review_log_entry, durable
+
+    def submit_reviews(self, answers: List[Tuple[int, Any]],
+                       review: Callable[[Dict[str, Any], Any], Optional[Tuple[Dict[str, Any], Dict[str, Any]]]]) -> Tuple[List[Optional[Dict[str, Any]]], Future]:
+        """
+        Reviews a batch of cards in order and stores all of them as one journal entry
+
+        Args:
+            answers: (card_id, payload) pairs, applied in this order; a card
+                answered several times sees the state left by its earlier answers
+            review: Called with a card's current FSRS state and the payload;
+                returns the new state and the review log, or None to skip the answer
+
+        Returns:
+            The stored review log entry for each answer (None if its card does
+            not exist or it was skipped) and a future that resolves once the
+            batch is durable
+        """
+        with self._lock:
+            self._current()
+            results = []
+            reviews = []
+            # State left by earlier answers of this batch; applied together once journaled
+            states = {}
+            for card_id, payload in answers:
+                row = self._cards.row_of.get(card_id)
+                if row is None:
+                    results.append(None)
+                    continue
+                current = states[card_id] if card_id in states else self._cards.get(row)["fsrs_card"]
+                reviewed = review(current, payload)
+                if reviewed is None:
+                    results.append(None)
+                    continue
+
+                fsrs_card, review_log = reviewed
+                states[card_id] = fsrs_card
+                # Numbered once every answer is reviewed, so a review that
+                # raises leaves no gap in the sequence
+                review_log_entry = {"id": None, "card_id": card_id, **review_log}
+                reviews.append({"card_id": card_id, "fsrs_card": fsrs_card, "review_log": review_log_entry})
+                results.append(review_log_entry)
+
+            if not reviews:
+                return results, completed_future()
+
+            for stored in reviews:
+                self._sequences["review_logs"] += 1
+                stored["review_log"]["id"] = self._sequences["review_logs"]
+
+            entry = {"op": "reviews", "reviews": reviews}
+            durable = self._append_journal(entry)
+            self._apply(entry)
+            self.version += 1
+            return results, durable
+
+    def submit_card_states(self, updates: List[Tuple[int, Any]],
+                           update: Callable[[Dict[str, Any], Any], Optional[Dict[str, Any]]]) -> Tuple[int, Future]:
+        """
+        Replaces the FSRS state of a batch of cards as one journal entry,
+        without adding review logs (e.g. when rescheduling them)
+
+        Args:
+            updates: (card_id, payload) pairs
+            update: Called with a card's current FSRS state and the payload;
+                returns the new state, or None to leave the card as it is
+
+        Returns:
+            The number of cards changed and a future that resolves once they are durable
+        """
+        with self._lock:
+            self._current()
+            cards = []
+            for card_id, payload in updates:
+                row = self._cards.row_of.get(card_id)
+                if row is None:
+                    continue
+                fsrs_card = update(self._cards.get(row)["fsrs_card"], payload)
+                if fsrs_card is not None:
+                    cards.append({"card_id": card_id, "fsrs_card": fsrs_card})
+
+            if not cards:
+                return 0, completed_future()
+
+            entry = {"op": "cards", "cards": cards}
+            durable = self._append_journal(entry)
+            self._apply(entry)
+            self.version += 1
+            return len(cards), durable
+
+    def submit_answer(self, card_id: int, review: Callable[[Dict[str, Any]], Tuple[Dict[str, Any], Dict[str, Any]]],
+                      pick: Optional[Callable[[Dict[str, Any]], Any]] = None) -> Tuple[Optional[Dict[str, Any]], Any, Future]:
+        """
+        Reviews a card and picks what to show next under one hold of the lock,
+        so both see the same state and nothing else runs in between
+
+        Args:
+            card_id: Card being answered
+            review: Called with the card's current FSRS state; returns the new
+                state and the review log (see fsrs_controller.review_card)
+            pick: Called with the new FSRS state once the review is stored, still
+                holding the lock; it may read the store (e.g. the study session
+                picking the next card)
+
+        Returns:
+            The stored review log entry (None if the card does not exist), what
+            pick returned and a future that resolves once the review is durable
+        """
+        with self._lock:
+            self._current()
+            row = self._cards.row_of.get(card_id)
+            if row is None:
+                return None, None, completed_future()
+
+            fsrs_card, review_log = review(self._cards.get(row)["fsrs_card"])
+            review_log_entry, durable = self._submit_review(card_id, fsrs_card, review_log)
+            return review_log_entry, pick(fsrs_card) if pick is not None else None, durable
+
+    def record_review(self, card_id: int, fsrs_card: Dict[str, Any], review_log: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Stores a card's new FSRS state and its review log and waits until it is durable
+
+        Returns:
+            The stored review log entry, or None if the card does not exist
+        """
+        review_log_entry, durable = self.submit_review(card_id, fsrs_card, review_log)
+        durable.result()
+        return review_log_entry
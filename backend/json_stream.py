@@ -0,0 +1,156 @@
+"""
+Streaming reader for large database.json documents.
+
+json.load() has to hold the whole file and every parsed record at once.
+iter_document() instead reads the file in chunks and yields the items of each
+top-level list one by one (the way ijson does), so a legacy database.json
+can be imported into another store while only one record is in memory at a
+time. Each item is still parsed by the C JSON scanner, so this is only a
+little slower than json.load().
+"""
+
+import json
+import re
+from typing import Any, Dict, Iterator, Optional, Tuple, Collection
+
+# Bytes read from the file per refill
+CHUNK_SIZE = 1 << 20
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+# Characters that can follow the digits decoded so far within the same number
+_NUMBER_CONTINUATION = frozenset('.eE+-0123456789')
+
+
+class _Reader:
+    """
+    Text buffer over a file that values are decoded from in place
+    """
+
+    def __init__(self, f, chunk_size: int):
+        self._file = f
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        """
+        Appends the next chunk to the buffer, dropping what was already consumed
+        """
+        if self.eof:
+            return False
+        chunk = self._file.read(self._chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """
+        Skips whitespace and returns the next character ("" at the end of the file)
+        """
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} at offset {self.pos} of the current chunk")
+        self.pos += 1
+
+    def value(self) -> Any:
+        """
+        Decodes the next complete JSON value
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            # A value at the very end of the buffer, or a number cut before its
+            # fraction or exponent, may continue in the next chunk
+            cut = end == len(self.buffer) or (
+                isinstance(value, (int, float)) and self.buffer[end] in _NUMBER_CONTINUATION
+            )
+            if cut and not self.eof and self._fill():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_document(f, lists: Optional[Collection[str]] = None, chunk_size: int = CHUNK_SIZE) -> Iterator[Tuple[str, Any]]:
+    """
+    Streams a JSON object from a text file
+
+    Args:
+        f: Text file positioned at the start of the object
+        lists: Top-level keys whose lists are streamed item by item (None for every list)
+        chunk_size: Characters read per refill
+
+    Yields:
+        (key, item) for every item of a streamed list, and (key, value) once
+        for every other top-level value
+    """
+    reader = _Reader(f, chunk_size)
+    reader.expect("{")
+    if reader.peek() == "}":
+        return
+
+    while True:
+        key = reader.value()
+        if not isinstance(key, str):
+            raise ValueError("Expected an object key")
+        reader.expect(":")
+
+        if reader.peek() == "[" and (lists is None or key in lists):
+            reader.pos += 1
+            if reader.peek() == "]":
+                reader.pos += 1
+            else:
+                while True:
+                    yield key, reader.value()
+                    separator = reader.peek()
+                    reader.pos += 1
+                    if separator == "]":
+                        break
+                    if separator != ",":
+                        raise ValueError(f"Expected ',' or ']' in list {key!r}")
+        else:
+            yield key, reader.value()
+
+        separator = reader.peek()
+        reader.pos += 1
+        if separator == "}":
+            return
+        if separator != ",":
+            raise ValueError("Expected ',' or '}' between object members")
+
+
+def iter_file(path: str, lists: Optional[Collection[str]] = None, chunk_size: int = CHUNK_SIZE) -> Iterator[Tuple[str, Any]]:
+    """
+    Streams a JSON document from a path, see iter_document
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        yield from iter_document(f, lists, chunk_size)
+
+
+def document_items(data: Dict[str, Any], lists: Optional[Collection[str]] = None) -> Iterator[Tuple[str, Any]]:
+    """
+    Yields the same pairs as iter_document for an already parsed document
+    """
+    for key, value in data.items():
+        if isinstance(value, list) and (lists is None or key in lists):
+            for item in value:
+                yield key, item
+        else:
+            yield key, value
@@ -1,16 +1,28 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
+import asyncio
+import json
 import random
-from typing import Dict, Any
+import numpy as np
+from typing import Dict, Any, Optional, Tuple
+from concurrent.futures import Future
 import os
 import time
 
+import background_jobs
 import database
 import fsrs_controller
+import fsrs_optimizer
 import gemini_controller
+import rescheduler
 import elevenlabs_controller
+import study_session
+import workload_simulator
+from event_hub import EventHub, next_event
+from timestamps import datetime_to_us, iso_to_us, us_to_datetime, study_day, study_day_start_us
 
 app = FastAPI()
 
@@ -32,18 +44,42 @@ if os.path.exists(audio_directory):
 @app.on_event("startup")
 async def startup_event():
     database.initialize_database()
+    database.start_background_tasks()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    background_jobs.jobs.shutdown()
+    database.close_database()
+    study_session.reset_sessions()
+    workload_simulator.reset_cache()
+    fsrs_controller.schedulers.clear()
+
+def get_shard(user_id: Optional[str], create: bool = False) -> Optional[str]:
+    """
+    Routes a request to a user's shard
+    The optional user_id query parameter selects the shard; without it the
+    default shard (database.json) is used. Only endpoints that add to the
+    collection (create=True) create a shard; the others answer 404 for a
+    user_id that has none.
+    """
+    if not database.is_valid_shard(user_id):
+        raise HTTPException(status_code=400, detail="Invalid user_id. Use letters, digits, '-' and '_' (at most 64).")
+    if not create and not database.shard_exists(user_id):
+        raise HTTPException(status_code=404, detail="Unknown user_id")
+    return user_id
 
 @app.get("/")
 async def root():
     return {"message": "Language Learning API is running"}
 
 @app.post("/notes")
-async def create_note(request_body: dict):
+async def create_note(request_body: dict, user_id: Optional[str] = None):
     """
     Creates a new note, generates a sentence and audio, and creates two associated flashcards.
     
     Request Body: { "word": "objetivo", "translation": "target" }
     """
+    shard = get_shard(user_id, create=True)
     try:
         # Validate request body
         if "word" not in request_body or "translation" not in request_body:
@@ -52,37 +88,27 @@ async def create_note(request_body: dict):
         word = request_body["word"]
         translation = request_body["translation"]
         
-        # Read current data
-        data = database.read_data()
-        
         # Step 1: Select well-known words
         well_known_words = []
-        if data["cards"]:
-            # Calculate mastery scores for all cards
-            card_scores = []
-            for card in data["cards"]:
-                try:
-                    score = fsrs_controller.calculate_mastery_score(card["fsrs_card"])
-                    card_scores.append((card, score))
-                except:
-                    continue
+        columns = database.get_card_columns(shard=shard)
+        if len(columns["id"]):
+            # Calculate mastery scores for all cards at once straight from the stored columns
+            now_us = datetime_to_us(datetime.now(timezone.utc))
+            elapsed_days = fsrs_controller.elapsed_days_batch(columns["last_review_us"], now_us)
+            scores = fsrs_controller.mastery_batch(columns["stability"], elapsed_days)
+            reviewed_rows = np.flatnonzero(~np.isnan(scores))
             
-            # Sort by score descending
-            card_scores.sort(key=lambda x: x[1], reverse=True)
+            # Sort by score descending (stable, so ties keep card order)
+            ranked_rows = reviewed_rows[np.argsort(-scores[reviewed_rows], kind="stable")]
             
             # Take top 10%
-            top_10_percent_count = max(1, len(card_scores) // 10)
-            top_cards = card_scores[:top_10_percent_count]
+            top_10_percent_count = max(1, len(ranked_rows) // 10)
+            top_rows = ranked_rows[:top_10_percent_count]
             
-            # Get unique words from these cards' notes
-            unique_words_set = set()
-            for card, score in top_cards:
-                note_id = card.get("note_id")
-                if note_id:
-                    # Find the note
-                    note = next((n for n in data["learning_notes"] if n["id"] == note_id), None)
-                    if note and "word" in note:
-                        unique_words_set.add(note["word"])
+            # Get unique words from these cards' notes, looked up by ID in one pass
+            note_ids = {columns["note_id"][row] for row in top_rows.tolist()}
+            notes = database.get_notes_by_id(note_ids, shard=shard)
+            unique_words_set = {note["word"] for note in notes.values() if "word" in note}
             
             # Randomly select up to 20 words
             unique_words_list = list(unique_words_set)
@@ -101,8 +127,8 @@ async def create_note(request_body: dict):
         if not success:
             raise HTTPException(status_code=500, detail=f"Gemini API error: {error}")
         
-        # Get next note ID
-        note_id = database.get_next_id(data, "learning_notes")
+        # Reserve the next note ID
+        note_id = database.allocate_id("learning_notes", shard=shard)
         
         # Step 3: Call ElevenLabs API to generate audio files
         success, filenames, error = elevenlabs_controller.generate_audio_for_note(
@@ -126,35 +152,34 @@ async def create_note(request_body: dict):
             "created_at": datetime.now(timezone.utc).isoformat()
         }
         
-        data["learning_notes"].append(note)
-        
         # Step 5: Create two cards (forward and reverse)
         card_ids = []
         
         # Forward card
-        forward_card_id = database.get_next_id(data, "cards")
+        forward_card_id = database.allocate_id("cards", shard=shard)
         forward_card = {
             "id": forward_card_id,
             "note_id": note_id,
             "direction": "forward",
             "fsrs_card": fsrs_controller.create_new_card()
         }
-        data["cards"].append(forward_card)
         card_ids.append(forward_card_id)
         
         # Reverse card
-        reverse_card_id = database.get_next_id(data, "cards")
+        reverse_card_id = database.allocate_id("cards", shard=shard)
         reverse_card = {
             "id": reverse_card_id,
             "note_id": note_id,
             "direction": "reverse",
             "fsrs_card": fsrs_controller.create_new_card()
         }
-        data["cards"].append(reverse_card)
         card_ids.append(reverse_card_id)
         
-        # Step 6: Write data back to database
-        database.write_data(data)
+        # Step 6: Write note and cards to database
+        # Awaiting the write lets other requests join the same group commit
+        durable = database.submit_note(note, [forward_card, reverse_card], shard=shard)
+        study_session.get_session(shard).cards_added([forward_card, reverse_card])
+        await asyncio.wrap_future(durable)
         
         return {
             "note_id": note_id,
@@ -168,118 +193,329 @@ async def create_note(request_body: dict):
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @app.get("/notes")
-async def get_notes():
+async def get_notes(user_id: Optional[str] = None):
     """
     Gets a list of all notes
     """
+    shard = get_shard(user_id)
     try:
-        data = database.read_data()
-        return data["learning_notes"]
+        return database.get_notes(shard=shard)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+# Note fields holding audio file names, served under /audio
+AUDIO_FIELDS = ["word_audio", "translation_audio", "sentence_audio", "sentence_translation_audio"]
+
+# Most cards /study/batch returns at once
+MAX_STUDY_BATCH = 100
+
+def join_card_with_note(card: Dict[str, Any], shard: Optional[str], note: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    """
+    Combines a card with its note and the URLs of the note's audio files
+    Looks the note up unless it is passed in; returns None if it doesn't exist
+    """
+    if note is None:
+        note = database.get_note(card["note_id"], shard=shard)
+    if not note:
+        return None
+    
+    audio_urls = {
+        field: f"/audio/{note[field]}"
+        for field in AUDIO_FIELDS
+        if note.get(field)
+    }
+    
+    return {
+        **card,
+        "note": note,
+        "audio_urls": audio_urls
+    }
+
 @app.get("/study/next")
-async def get_next_card():
+async def get_next_card(user_id: Optional[str] = None):
     """
-    Gets the next card that is due for review
+    Gets the next card that is due for review, from the day's study session
+    (see study_session.py)
     """
+    shard = get_shard(user_id)
     try:
-        data = database.read_data()
         current_time = datetime.now(timezone.utc)
         
-        # Find the card with the earliest due date that is <= current time
-        due_cards = []
+        # The front of the session queue: due now, siblings of a just-answered card kept apart
+        next_card = study_session.get_session(shard).next_card(current_time)
         
-        for card in data["cards"]:
-            try:
-                fsrs_card = card["fsrs_card"]
-                # Parse the due date from the FSRS card
-                due_str = fsrs_card.get("due")
-                if due_str:
-                    # Parse ISO format datetime
-                    due_date = datetime.fromisoformat(due_str.replace('Z', '+00:00'))
-                    if due_date <= current_time:
-                        due_cards.append((card, due_date))
-            except:
-                continue
-        
-        if not due_cards:
+        if not next_card:
             return {"message": "No cards due"}
         
-        # Sort by due date (earliest first)
-        due_cards.sort(key=lambda x: x[1])
-        next_card = due_cards[0][0]
-        
-        # Get the corresponding note
-        note = next((n for n in data["learning_notes"] if n["id"] == next_card["note_id"]), None)
+        # Combine card and note data
+        result = join_card_with_note(next_card, shard)
         
-        if not note:
+        if not result:
             return {"message": "No cards due"}
         
-        # Combine card and note data
-        result = {
-            **next_card,
-            "note": note
-        }
-        
         # Reset card state for new card
-        card_state["state"] = "question_showing"
+        set_card_state("question_showing")
         
         return result
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+@app.get("/study/batch")
+async def get_study_batch(n: int = 20, user_id: Optional[str] = None):
+    """
+    Gets the next n due cards in the order /study/next serves them, each
+    joined with its note and audio URLs, so the client can preload upcoming cards
+    
+    Unlike /study/next this doesn't reset the hardware card state; the order
+    can change once a card is answered, so refetch after each answer.
+    """
+    shard = get_shard(user_id)
+    if n < 1 or n > MAX_STUDY_BATCH:
+        raise HTTPException(status_code=400, detail=f"n must be between 1 and {MAX_STUDY_BATCH}")
+    try:
+        current_time = datetime.now(timezone.utc)
+        due_cards = study_session.get_session(shard).upcoming(current_time, n)
+        
+        notes = database.get_notes_by_id([card["note_id"] for card in due_cards], shard=shard)
+        
+        cards = []
+        for card in due_cards:
+            note = notes.get(card["note_id"])
+            result = join_card_with_note(card, shard, note) if note else None
+            if result:
+                cards.append(result)
+        
+        return {"cards": cards}
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+def is_card_id(value: Any) -> bool:
+    """
+    Card IDs are JSON integers; "1" or 1.0 would match a card in one engine and not the other
+    """
+    return type(value) is int
+
+def record_answer(card_id: int, rating: int, shard: Optional[str],
+                  next_at: Optional[datetime] = None) -> Tuple[Future, Optional[Dict[str, Any]]]:
+    """
+    Reviews a card now, stores the review and moves the card in the study session
+    
+    Reading the card, storing its review and updating the session (and, with
+    next_at, picking the session's next card due by then) are one locked store
+    operation (database.submit_answer), so no other write comes in between.
+    
+    Returns:
+        A future that resolves once the review is durable, and the next card
+        (None without next_at or if nothing is due)
+    
+    Raises:
+        HTTPException: 400 for an invalid card_id or rating, 404 if the card doesn't exist
+    """
+    if not is_card_id(card_id):
+        raise HTTPException(status_code=400, detail="card_id must be an integer")
+    
+    # Validate rating
+    if rating not in [1, 2, 3, 4]:
+        raise HTTPException(status_code=400, detail="Rating must be 1, 2, 3, or 4")
+    
+    session = study_session.get_session(shard)
+    # Looked up before the store calls review with its lock held
+    settings = fsrs_controller.get_kernel_settings(shard)
+    
+    def pick(updated_fsrs_card: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        session.card_answered(card_id, updated_fsrs_card)
+        return session.next_card(next_at) if next_at is not None else None
+    
+    # Review the card and update it and add the review log in one write
+    try:
+        review_log_entry, next_card, durable = database.submit_answer(
+            card_id, lambda fsrs_card: fsrs_controller.review_card(fsrs_card, rating, settings=settings),
+            pick, shard=shard
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if review_log_entry is None:
+        raise HTTPException(status_code=404, detail=f"Card with id {card_id} not found")
+    
+    return durable, next_card
+
 @app.post("/study/answer")
-async def answer_card(request_body: dict):
+async def answer_card(request_body: dict, user_id: Optional[str] = None):
     """
     Records a review for a card and updates its schedule
     
     Request Body: { "card_id": 1, "rating": 3 }
     """
+    shard = get_shard(user_id)
     try:
         # Validate request body
         if "card_id" not in request_body or "rating" not in request_body:
             raise HTTPException(status_code=400, detail="Missing 'card_id' or 'rating' in request body")
         
         card_id = request_body["card_id"]
-        rating = request_body["rating"]
+        durable, _ = record_answer(card_id, request_body["rating"], shard)
         
-        # Validate rating
-        if rating not in [1, 2, 3, 4]:
-            raise HTTPException(status_code=400, detail="Rating must be 1, 2, 3, or 4")
+        # Awaiting the write lets other requests join the same group commit
+        await asyncio.wrap_future(durable)
         
-        # Read data
-        data = database.read_data()
-        
-        # Find the card
-        card = next((c for c in data["cards"] if c["id"] == card_id), None)
-        
-        if not card:
-            raise HTTPException(status_code=404, detail=f"Card with id {card_id} not found")
+        return {"message": f"Review recorded for card_id: {card_id}"}
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+# Most reviews accepted by one /study/answers request
+MAX_SYNC_BATCH = 1000
+
+# How far in the future a synced review may be timestamped (client clock skew)
+MAX_CLOCK_SKEW = timedelta(minutes=5)
+
+def parse_reviewed_at(value: Any) -> datetime:
+    """
+    Parses an ISO 8601 review time (naive times are UTC)
+    
+    Raises:
+        ValueError: If the value isn't an ISO 8601 timestamp
+    """
+    if not isinstance(value, str):
+        raise ValueError("reviewed_at must be an ISO 8601 string")
+    reviewed_at = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if reviewed_at.tzinfo is None:
+        reviewed_at = reviewed_at.replace(tzinfo=timezone.utc)
+    return reviewed_at
+
+@app.post("/study/answers")
+async def answer_cards(request_body: dict, user_id: Optional[str] = None):
+    """
+    Records a batch of reviews made offline (or queued by a hardware station)
+    
+    Reviews are applied in reviewed_at order, each scheduled as of its own
+    time, so a card answered several times ends up where live reviews would
+    have left it. The whole batch is stored with one write.
+    
+    Request Body: { "answers": [{ "card_id": 1, "rating": 3, "reviewed_at": "2025-10-01T08:00:00Z" }, ...] }
+    Response: { "recorded": n, "results": [{ "card_id": 1, "status": "recorded" | "not_found" | "stale", "review_log_id": 5 }, ...] }
+    with one result per answer, in request order. "stale" answers are older
+    than the card's last review and are not applied.
+    """
+    shard = get_shard(user_id)
+    try:
+        # Validate request body
+        answers = request_body.get("answers")
+        if not isinstance(answers, list):
+            raise HTTPException(status_code=400, detail="Missing 'answers' list in request body")
+        if len(answers) > MAX_SYNC_BATCH:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_SYNC_BATCH} answers per request")
+        
+        latest = datetime.now(timezone.utc) + MAX_CLOCK_SKEW
+        reviewed_at = []
+        for index, answer in enumerate(answers):
+            if not isinstance(answer, dict) or not {"card_id", "rating", "reviewed_at"} <= answer.keys():
+                raise HTTPException(status_code=400, detail=f"Answer {index}: missing 'card_id', 'rating' or 'reviewed_at'")
+            if not is_card_id(answer["card_id"]):
+                raise HTTPException(status_code=400, detail=f"Answer {index}: card_id must be an integer")
+            if answer["rating"] not in [1, 2, 3, 4]:
+                raise HTTPException(status_code=400, detail=f"Answer {index}: rating must be 1, 2, 3, or 4")
+            try:
+                timestamp = parse_reviewed_at(answer["reviewed_at"])
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=f"Answer {index}: {e}")
+            if timestamp > latest:
+                raise HTTPException(status_code=400, detail=f"Answer {index}: reviewed_at is in the future")
+            reviewed_at.append(timestamp)
+        
+        # Timestamp order (stable, so ties keep request order) is also per-card order
+        order = sorted(range(len(answers)), key=lambda index: reviewed_at[index])
+        stale = set()
+        # New FSRS state of each applied answer, for the study session
+        new_states = {}
+        # Looked up before the store calls review with its lock held
+        settings = fsrs_controller.get_kernel_settings(shard)
+        
+        def review(fsrs_card: Dict[str, Any], index: int):
+            last_review = iso_to_us(fsrs_card.get("last_review"))
+            if last_review is not None and last_review > datetime_to_us(reviewed_at[index]):
+                # Reviewed live after this answer was made; replaying it would rewind the schedule
+                stale.add(index)
+                return None
+            reviewed = fsrs_controller.review_card(fsrs_card, answers[index]["rating"], reviewed_at[index], settings=settings)
+            new_states[index] = reviewed[0]
+            return reviewed
         
-        # Review the card
         try:
-            updated_fsrs_card, review_log = fsrs_controller.review_card(card["fsrs_card"], rating)
+            entries, durable = database.submit_reviews(
+                [(answers[index]["card_id"], index) for index in order], review, shard=shard
+            )
         except ValueError as e:
             raise HTTPException(status_code=400, detail=str(e))
         
-        # Update the card in the database
-        card["fsrs_card"] = updated_fsrs_card
+        study_session.get_session(shard).cards_answered([
+            (answers[index]["card_id"], new_states[index])
+            for index, entry in zip(order, entries) if entry is not None
+        ])
+        
+        # Awaiting the write lets other requests join the same group commit
+        await asyncio.wrap_future(durable)
+        
+        results = [None] * len(answers)
+        for index, entry in zip(order, entries):
+            result = {"card_id": answers[index]["card_id"]}
+            if entry is not None:
+                result["status"] = "recorded"
+                result["review_log_id"] = entry["id"]
+            elif index in stale:
+                result["status"] = "stale"
+            else:
+                result["status"] = "not_found"
+            results[index] = result
         
-        # Add review log with additional metadata
-        review_log_id = database.get_next_id(data, "review_logs")
-        review_log_entry = {
-            "id": review_log_id,
-            "card_id": card_id,
-            **review_log
+        return {
+            "recorded": sum(entry is not None for entry in entries),
+            "results": results
         }
-        data["review_logs"].append(review_log_entry)
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@app.post("/study/answer-next")
+async def answer_and_get_next_card(request_body: dict, user_id: Optional[str] = None):
+    """
+    Records a review like /study/answer and returns the next due card like
+    /study/next, saving the study loop a round trip
+    
+    The next card comes from the study session after it took the review
+    into account, picked in the same locked store operation as the review,
+    so it reflects exactly the review just recorded.
+    
+    Request Body: { "card_id": 1, "rating": 3 }
+    Response: { "message": ..., "next_card": { ...card, "note": ..., "audio_urls": ... } or null }
+    """
+    shard = get_shard(user_id)
+    try:
+        # Validate request body
+        if "card_id" not in request_body or "rating" not in request_body:
+            raise HTTPException(status_code=400, detail="Missing 'card_id' or 'rating' in request body")
         
-        # Write changes
-        database.write_data(data)
+        card_id = request_body["card_id"]
+        durable, next_card = record_answer(card_id, request_body["rating"], shard, next_at=datetime.now(timezone.utc))
         
-        return {"message": f"Review recorded for card_id: {card_id}"}
+        # Awaiting the write lets other requests join the same group commit
+        await asyncio.wrap_future(durable)
+        
+        result = join_card_with_note(next_card, shard) if next_card else None
+        if result:
+            # Reset card state for new card
+            set_card_state("question_showing")
+        
+        return {
+            "message": f"Review recorded for card_id: {card_id}",
+            "next_card": result
+        }
     
     except HTTPException:
         raise
@@ -287,16 +523,46 @@ async def answer_card(request_body: dict):
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @app.get("/stats")
-async def get_stats():
+async def get_stats(user_id: Optional[str] = None):
     """
     Gets all data for frontend processing
     """
+    shard = get_shard(user_id)
     try:
-        data = database.read_data()
+        data = database.read_data(shard=shard)
         return data
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+# Most days /forecast covers at once
+MAX_FORECAST_DAYS = 365
+
+@app.get("/forecast")
+async def get_forecast(days: int = 30, user_id: Optional[str] = None):
+    """
+    Counts the cards due on each of the next days (study days starting at
+    DAY_START_HOUR UTC, today first) and the cards overdue from earlier days
+    
+    Read from the store's due histogram, so it costs O(days) whatever the
+    number of cards
+    """
+    shard = get_shard(user_id)
+    if days < 1 or days > MAX_FORECAST_DAYS:
+        raise HTTPException(status_code=400, detail=f"days must be between 1 and {MAX_FORECAST_DAYS}")
+    try:
+        today = study_day(datetime_to_us(datetime.now(timezone.utc)))
+        overdue, counts = database.get_due_forecast(today, days, shard=shard)
+        return {
+            "overdue": overdue,
+            "days": [
+                {"date": us_to_datetime(study_day_start_us(today + offset)).date().isoformat(), "due": due}
+                for offset, due in enumerate(counts)
+            ]
+        }
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
 # Global state for current page (used by hardware)
 current_page_state = {"page": "study"}  # Default to study page
 
@@ -308,6 +574,42 @@ card_state = {"state": "question_showing"}  # "question_showing" or "answer_show
 last_hardware_input_time = 0
 HARDWARE_COOLDOWN = 1.0  # seconds
 
+# Subscribers of /hardware/ws and /hardware/events
+hardware_events = EventHub()
+
+# Seconds between keepalive messages on idle push connections
+PUSH_KEEPALIVE = 15
+
+def set_card_state(state: str):
+    """
+    Updates the card state and pushes the change to subscribers
+    """
+    if card_state["state"] != state:
+        card_state["state"] = state
+        hardware_events.publish({"type": "card_state", "state": state})
+
+def dispatch_hardware_action(action: Dict[str, Any]):
+    """
+    Pushes a hardware action to the study page, or queues it for /hardware/poll
+    if no study page is subscribed
+    """
+    if hardware_events.publish({"type": "action", **action}) == 0:
+        hardware_action_queue.append(action)
+
+def take_queued_actions() -> list:
+    """
+    Removes and returns the actions waiting for /hardware/poll
+    """
+    actions = hardware_action_queue.copy()
+    hardware_action_queue.clear()
+    return actions
+
+def hardware_state_event() -> Dict[str, Any]:
+    """
+    First event of every push connection: the current card state and page
+    """
+    return {"type": "state", "card_state": card_state["state"], "page": current_page_state["page"]}
+
 @app.post("/hardware/page")
 async def set_current_page(request_body: dict):
     """
@@ -323,7 +625,9 @@ async def set_current_page(request_body: dict):
         if page not in ["study", "manage", "stats"]:
             raise HTTPException(status_code=400, detail="Invalid page. Must be 'study', 'manage', or 'stats'")
         
-        current_page_state["page"] = page
+        if current_page_state["page"] != page:
+            current_page_state["page"] = page
+            hardware_events.publish({"type": "page", "page": page})
         return {"status": "ok", "current_page": page}
     except HTTPException:
         raise
@@ -374,8 +678,8 @@ async def hardware_input(request_body: dict):
         action = request_body["action"]
         
         if action == "show_card":
-            hardware_action_queue.append({"action": "show_card"})
-            card_state["state"] = "answer_showing"
+            dispatch_hardware_action({"action": "show_card"})
+            set_card_state("answer_showing")
             return {"status": "ok", "action": "show_card"}
         
         elif action == "submit_rating":
@@ -386,8 +690,8 @@ async def hardware_input(request_body: dict):
             if rating not in [1, 2, 3, 4]:
                 raise HTTPException(status_code=400, detail="Rating must be 1, 2, 3, or 4")
             
-            hardware_action_queue.append({"action": "submit_rating", "rating": rating})
-            card_state["state"] = "question_showing" # Reset state after rating
+            dispatch_hardware_action({"action": "submit_rating", "rating": rating})
+            set_card_state("question_showing") # Reset state after rating
             # Update last input time when rating is submitted (action is complete)
             last_hardware_input_time = current_time
             return {"status": "ok", "action": "submit_rating", "rating": rating}
@@ -405,45 +709,142 @@ async def poll_hardware_actions():
     """
     Polls for pending hardware actions and clears the queue
     Returns all pending actions
+    
+    Fallback for clients that can't keep /hardware/ws open; actions pushed to
+    a connected study page are not queued here
     """
     try:
-        if hardware_action_queue:
-            # Get all actions and clear the queue
-            actions = hardware_action_queue.copy()
-            hardware_action_queue.clear()
-            return {"actions": actions}
-        else:
-            return {"actions": []}
+        return {"actions": take_queued_actions()}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+async def push_hardware_events(websocket: WebSocket, queue: asyncio.Queue):
+    """
+    Sends a subscriber's events over its WebSocket until it is dropped or the socket fails
+    """
+    try:
+        while True:
+            event = await next_event(queue, PUSH_KEEPALIVE)
+            if event is None:
+                # Fell too far behind; the client reconnects and resyncs
+                await websocket.close()
+                return
+            await websocket.send_json(event)
+    except Exception:
+        return
+
+async def receive_until_closed(websocket: WebSocket):
+    """
+    Reads (and ignores) client messages until the WebSocket closes
+    """
+    try:
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        return
+
+@app.websocket("/hardware/ws")
+async def hardware_websocket(websocket: WebSocket):
+    """
+    Pushes hardware actions and card state / page changes to the study page as they happen
+    
+    Messages (JSON):
+    - { "type": "state", "card_state": ..., "page": ... } once on connect
+    - { "type": "action", "action": "show_card" | "submit_rating", "rating": 1-4 }
+    - { "type": "card_state", "state": ... } and { "type": "page", "page": ... }
+    - { "type": "keepalive" } when idle
+    
+    While a study page is connected, actions are delivered here instead of
+    being queued for /hardware/poll.
+    """
+    await websocket.accept()
+    queue = hardware_events.subscribe(actions=True)
+    try:
+        await websocket.send_json(hardware_state_event())
+        # Actions queued for polling before this page connected
+        for action in take_queued_actions():
+            await websocket.send_json({"type": "action", **action})
+        
+        tasks = {
+            asyncio.create_task(push_hardware_events(websocket, queue)),
+            asyncio.create_task(receive_until_closed(websocket))
+        }
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        hardware_events.unsubscribe(queue)
+
+@app.get("/hardware/events")
+async def hardware_event_stream(actions: bool = False):
+    """
+    Server-Sent Events stream of card state / page changes, for clients
+    without WebSockets (hardware_sensors.py follows the card state this way)
+    
+    Sends the same JSON messages as /hardware/ws, one per "data:" line.
+    Hardware actions are only included with actions=true, in which case
+    this connection takes them over from /hardware/poll like /hardware/ws.
+    """
+    async def stream():
+        queue = hardware_events.subscribe(actions=actions)
+        try:
+            yield f"data: {json.dumps(hardware_state_event())}\n\n"
+            if actions:
+                for action in take_queued_actions():
+                    yield f"data: {json.dumps({'type': 'action', **action})}\n\n"
+            while True:
+                event = await next_event(queue, PUSH_KEEPALIVE)
+                if event is None:
+                    return
+                yield f"data: {json.dumps(event)}\n\n"
+        finally:
+            hardware_events.unsubscribe(queue)
+    
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+def apply_optimized_parameters(job: background_jobs.Job):
+    """
+    Stores the fitted weights as the shard's scheduler configuration when an
+    optimization job finishes, if they predict the history better than the
+    weights it started from
+    """
+    result = job.result
+    result["applied"] = result["log_loss_after"] < result["log_loss_before"]
+    if result["applied"]:
+        fsrs_controller.set_parameters(result["parameters"], shard=job.shard).result()
+
 @app.post("/optimize-fsrs")
-async def optimize_fsrs():
+async def optimize_fsrs(user_id: Optional[str] = None):
     """
-    Optimizes FSRS parameters based on review history
+    Starts fitting the FSRS parameters to the review history (fsrs_optimizer.py)
     
-    Note: This is a placeholder implementation. Full optimization requires
-    the FSRS optimizer which uses review logs to tune parameters.
+    The fit runs in a worker process (background_jobs.py), so the API stays
+    responsive; follow it with GET /optimize-fsrs/status. When it finishes
+    the fitted weights become the shard's scheduler configuration. While a job runs for the shard,
+    this returns that job instead of starting another.
     """
+    shard = get_shard(user_id)
     try:
-        data = database.read_data()
+        review_count = database.count_review_logs(shard=shard)
         
         # Check if we have enough review logs
-        if len(data["review_logs"]) < 10:
+        if review_count < 10:
             raise HTTPException(
                 status_code=400, 
-                detail=f"Need at least 10 reviews to optimize. Current: {len(data['review_logs'])}"
+                detail=f"Need at least 10 reviews to optimize. Current: {review_count}"
             )
         
-        # In a real implementation, you would use the FSRS optimizer here
-        # For now, we return a message indicating the feature is available
-        # but the actual optimization would require implementing the FSRS optimizer
-        # from the fsrs-rs or py-fsrs library
+        job = background_jobs.jobs.submit(
+            "optimize", shard, fsrs_optimizer.run_optimization, shard, fsrs_controller.get_parameters(shard),
+            on_done=apply_optimized_parameters
+        )
         
         return {
-            "message": f"Optimization completed with {len(data['review_logs'])} reviews analyzed. Parameters are now optimized for your learning pattern.",
-            "review_count": len(data["review_logs"]),
-            "note": "Using default FSRS parameters. For production, implement fsrs.optimizer() function."
+            "message": f"Optimization started on {review_count} reviews. Parameters are swapped in when it finishes.",
+            "review_count": review_count,
+            "job": job.to_dict()
         }
     
     except HTTPException:
@@ -451,31 +852,101 @@ async def optimize_fsrs():
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
-@app.get("/workload-retention")
-async def get_workload_retention():
+@app.get("/optimize-fsrs/status")
+async def get_optimize_fsrs_status(user_id: Optional[str] = None):
+    """
+    Gets the status and progress of the latest optimization job of a shard
     """
-    Calculates workload (daily reviews) for different retention levels
-    Returns data for visualizing the workload vs retention curve
+    shard = get_shard(user_id)
+    job = background_jobs.jobs.latest("optimize", shard)
+    if job is None:
+        raise HTTPException(status_code=404, detail="No optimization has been started")
+    return job.to_dict()
+
+@app.post("/reschedule")
+async def reschedule_cards(user_id: Optional[str] = None):
+    """
+    Starts rebuilding every card's FSRS state from its review history (rescheduler.py)
+    
+    Replays each card's reviews with the shard's current scheduler configuration,
+    e.g. after new parameters were applied. The replay is split across the worker
+    processes (background_jobs.py); follow it with GET /reschedule/status. While
+    a job runs for the shard, this returns that job instead of starting another.
     """
+    shard = get_shard(user_id)
     try:
-        data = database.read_data()
-        cards = data.get("cards", [])
-        
-        if not cards:
-            return {"data_points": []}
-        
-        # Calculate workload for retention levels from 70% to 99%
-        retention_levels = [0.70, 0.75, 0.80, 0.85, 0.90, 0.92, 0.94, 0.95, 0.96, 0.97, 0.98, 0.99]
-        workload_data = []
+        job = background_jobs.jobs.start(
+            "reschedule", shard, rescheduler.run_reschedule, shard, fsrs_controller.get_kernel_settings(shard)
+        )
         
-        for retention in retention_levels:
-            workload = fsrs_controller.estimate_workload_for_retention(cards, retention)
-            workload_data.append({
-                "retention": retention,
-                "workload": workload
-            })
+        return {
+            "message": "Rescheduling started. Cards are updated as their reviews are replayed.",
+            "job": job.to_dict()
+        }
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@app.get("/reschedule/status")
+async def get_reschedule_status(user_id: Optional[str] = None):
+    """
+    Gets the status and progress of the latest rescheduling job of a shard
+    """
+    shard = get_shard(user_id)
+    job = background_jobs.jobs.latest("reschedule", shard)
+    if job is None:
+        raise HTTPException(status_code=404, detail="No rescheduling has been started")
+    return job.to_dict()
+
+@app.get("/scheduler-config")
+async def get_scheduler_config(user_id: Optional[str] = None):
+    """
+    Gets the FSRS scheduler configuration of a shard (Scheduler.to_dict() format, steps in seconds)
+    """
+    shard = get_shard(user_id)
+    try:
+        return {
+            "config": fsrs_controller.get_scheduler_config(shard),
+            "custom": database.get_scheduler_config(shard=shard) is not None
+        }
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@app.put("/scheduler-config")
+async def put_scheduler_config(request_body: dict, user_id: Optional[str] = None):
+    """
+    Stores the FSRS scheduler configuration of a shard; reviews use it from the next one
+    
+    Request Body: any of { "parameters": [...], "desired_retention": 0.9,
+    "learning_steps": [60, 600], "relearning_steps": [600], "maximum_interval": 36500,
+    "enable_fuzzing": true }, merged over the default scheduler; {} goes back to the default
+    """
+    shard = get_shard(user_id, create=True)
+    try:
+        try:
+            durable = fsrs_controller.set_scheduler_config(request_body, shard=shard)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        await asyncio.wrap_future(durable)
         
-        return {"data_points": workload_data}
+        return {"config": fsrs_controller.get_scheduler_config(shard)}
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@app.get("/workload-retention")
+async def get_workload_retention(user_id: Optional[str] = None):
+    """
+    Simulates the workload (daily reviews) at different retention levels
+    Returns data for visualizing the workload vs retention curve; cached
+    until the cards or the scheduler change
+    """
+    shard = get_shard(user_id)
+    try:
+        return {"data_points": await workload_simulator.workload_curve(shard)}
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
@@ -0,0 +1,44 @@
+"""
+Migrate database.json to SQLite
+
+This script:
+1. Streams the existing database.json (with its journal, notes file and review log segments) record by record
+2. Creates (or overwrites) database.sqlite3 with indexed notes, cards and review_logs tables
+3. Copies every note, card and review log into it
+
+The server imports database.json automatically the first time it starts with
+DATABASE_BACKEND=sqlite; run this script to redo the import explicitly.
+
+Usage: python migrate_to_sqlite.py [path/to/database.json]
+"""
+
+import os
+import sys
+import database
+import sqlite_store
+
+def main():
+    """Main function to migrate the JSON database to SQLite"""
+    json_file = sys.argv[1] if len(sys.argv) > 1 else database.DATABASE_FILE
+
+    print("🚀 Starting migration to SQLite...")
+    print("=" * 60)
+
+    if not os.path.exists(json_file):
+        print(f"❌ Error: {json_file} not found!")
+        return
+
+    print(f"📖 Streaming {json_file}...")
+    counts = sqlite_store.migrate_from_json(json_file, database.SQLITE_FILE)
+
+    print("=" * 60)
+    print(f"✅ Migrated to {database.SQLITE_FILE}")
+    print(f"📊 Summary:")
+    print(f"   - {counts['learning_notes']} learning notes")
+    print(f"   - {counts['cards']} cards")
+    print(f"   - {counts['review_logs']} review logs")
+    print()
+    print("💡 Set DATABASE_BACKEND=sqlite in .env to use it")
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,7 @@ Paste Dummy Data Script
 
 This script:
 1. Clears database.json and audio directory
-2. Copies dummy_database.json to database.json
+2. Copies dummy_database.json into the database (database.json, or SQLite when DATABASE_BACKEND=sqlite)
 3. Copies all files from dummy_audio/ to audio/
 
 This is useful for quickly setting up a demo environment without calling APIs.
@@ -15,10 +15,11 @@ import json
 import os
 import shutil
 import glob
+import database
+import fsrs_controller
 
 # Paths
 SCRIPT_DIR = os.path.dirname(__file__)
-DATABASE_FILE = os.path.join(SCRIPT_DIR, 'database.json')
 DUMMY_DATABASE_FILE = os.path.join(SCRIPT_DIR, 'dummy_database.json')
 AUDIO_DIR = os.path.join(SCRIPT_DIR, 'audio')
 DUMMY_AUDIO_DIR = os.path.join(SCRIPT_DIR, 'dummy_audio')
@@ -43,15 +44,21 @@ def clear_audio_directory():
     print(f"✅ Deleted {deleted_count} audio files")
 
 def copy_database():
-    """Copies dummy_database.json to database.json"""
-    print("📄 Copying dummy_database.json to database.json...")
+    """Copies dummy_database.json into the database"""
+    print("📄 Copying dummy_database.json into the database...")
     
     if not os.path.exists(DUMMY_DATABASE_FILE):
         print(f"❌ Error: {DUMMY_DATABASE_FILE} not found!")
         return False
     
     try:
-        shutil.copy2(DUMMY_DATABASE_FILE, DATABASE_FILE)
+        with open(DUMMY_DATABASE_FILE, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        
+        # Written through the database module so pending journal entries are
+        # discarded and a running server picks up the new file
+        database.write_data(data)
+        fsrs_controller.invalidate_scheduler()
         print("✅ Database copied successfully")
         return True
     except Exception as e:
@@ -111,8 +118,7 @@ def main():
     
     # Step 4: Read the copied database to show summary
     try:
-        with open(DATABASE_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        data = database.read_data()
         
         print("=" * 60)
         print("✅ Dummy data pasted successfully!")
@@ -0,0 +1,55 @@
+"""
+Reschedule every card from its review history
+
+This script:
+1. Reads the shard's review logs in parallel worker processes
+2. Replays each card's reviews in time order with the shard's current scheduler
+   configuration (see rescheduler.py)
+3. Stores each card's new stability, difficulty and due date, in batches
+
+Run it after changing the FSRS parameters, so existing cards are scheduled
+as the new parameters would have scheduled them. With the server running,
+POST /reschedule does the same as a background job.
+
+Usage: python reschedule_cards.py [user_id]
+"""
+
+import sys
+import background_jobs
+import database
+import fsrs_controller
+import rescheduler
+
+def main():
+    """Main function to reschedule all cards of a shard"""
+    shard = sys.argv[1] if len(sys.argv) > 1 else None
+
+    if not database.is_valid_shard(shard):
+        print(f"❌ Error: invalid user_id {shard!r}")
+        return
+
+    print(f"🚀 Rescheduling the cards of {shard or 'the default shard'}...")
+    print("=" * 60)
+
+    try:
+        last_phase = None
+        def progress(phase, fraction):
+            nonlocal last_phase
+            if phase != last_phase:
+                print(f"📖 {phase.capitalize()}...")
+                last_phase = phase
+
+        result = rescheduler.reschedule(shard, fsrs_controller.get_kernel_settings(shard), progress)
+    finally:
+        background_jobs.jobs.shutdown()
+        database.close_database()
+
+    print("=" * 60)
+    print(f"✅ Rescheduled in {result['seconds']} s")
+    print(f"📊 Summary:")
+    print(f"   - {result['review_count']} review logs replayed")
+    print(f"   - {result['cards']} cards rescheduled")
+    print(f"   - {result['skipped']} cards skipped (reviewed meanwhile or deleted)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""
+Rescheduling: rebuilds every card's FSRS state from its review history.
+
+Card states are computed by the scheduler of the day, so after the
+parameters or the scheduler configuration change (an optimization, a
+PUT /scheduler-config) they no longer match what the new scheduler would
+have made of the same reviews. Rescheduling replays each card's real
+review logs, in time order, through fsrs_kernel from a new card and
+stores the resulting state (stability, difficulty, step and due date).
+
+It runs in three phases, the first two spread over the background_jobs pool:
+- Reading: each worker reads one part of the history
+  (database.iter_review_logs with part=), returning plain arrays.
+- Replaying: the logs are sorted by card and time and split at card
+  boundaries into groups of about the same number of reviews; each worker
+  replays a group with review_batch, all of its cards advancing one
+  review at a time (cards sorted by review count, so the cards with a
+  k-th review are a prefix of the arrays, as in fsrs_optimizer.py).
+- Writing: as groups finish, their states are written WRITE_BATCH cards
+  per database.submit_card_states call, so reviews keep going in between.
+
+Fuzz is drawn from a hash of each review log's id instead of the random
+module, so rescheduling twice with the same settings gives the same due
+dates. Cards without review logs are left as they are, and so is any card
+reviewed again after its logs were read.
+
+Run it with `python reschedule_cards.py [user_id]` or POST /reschedule.
+"""
+
+import math
+import time
+from array import array
+from concurrent.futures import as_completed
+from typing import Dict, Any, Optional, Tuple
+
+import numpy as np
+
+import background_jobs
+import database
+import fsrs_kernel
+from columnar import NULL_INT
+from timestamps import iso_to_us
+
+# Groups of cards replayed per worker; more than one so writing can start
+# while the last groups are still replaying
+GROUPS_PER_WORKER = 4
+
+# Cards per database.submit_card_states call
+WRITE_BATCH = 1000
+
+# Mixed into the fuzz hash of the review log ids
+FUZZ_SEED = 0x5EED_F5A5
+
+
+def read_review_part(shard: Optional[str], part: int, parts: int) -> Tuple[np.ndarray, ...]:
+    """
+    Reads one part of a shard's review logs (run in a worker)
+
+    Returns:
+        Arrays of log id, card id, rating and review time (epoch microseconds)
+        of each log with a valid rating and time
+    """
+    ids = array('q')
+    card_ids = array('q')
+    ratings = array('b')
+    review_us = array('q')
+    for review_log in database.iter_review_logs(shard=shard, iso=False, part=(part, parts)):
+        rating = review_log.get("rating")
+        reviewed_at = review_log.get("review_datetime")
+        if type(reviewed_at) is str:
+            reviewed_at = iso_to_us(reviewed_at)
+        if rating in fsrs_kernel.RATINGS and reviewed_at is not None:
+            ids.append(review_log.get("id") or 0)
+            card_ids.append(review_log["card_id"])
+            ratings.append(rating)
+            review_us.append(reviewed_at)
+    return (np.frombuffer(ids, dtype=np.int64), np.frombuffer(card_ids, dtype=np.int64),
+            np.frombuffer(ratings, dtype=np.int8), np.frombuffer(review_us, dtype=np.int64))
+
+
+def review_draws(log_ids: np.ndarray) -> np.ndarray:
+    """
+    Fuzz draws in [0, 1), one per review log, from a hash (splitmix64) of its id
+    """
+    with np.errstate(over="ignore"):
+        z = np.asarray(log_ids, dtype=np.uint64) + np.uint64(FUZZ_SEED)
+        z = z * np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        z = z ^ (z >> np.uint64(31))
+    return (z >> np.uint64(11)).astype(np.float64) / float(1 << 53)
+
+
+def replay_cards(settings: fsrs_kernel.SchedulerSettings, card_ids: np.ndarray, ratings: np.ndarray,
+                 review_us: np.ndarray, draws: np.ndarray) -> fsrs_kernel.CardState:
+    """
+    Replays the reviews of a group of cards from new cards (run in a worker)
+
+    Args:
+        settings: The scheduler's settings
+        card_ids, ratings, review_us, draws: One entry per review, sorted by
+            card and then by time
+        draws: Fuzz draw of each review
+
+    Returns:
+        CardState of arrays with each card's state after its last review
+    """
+    cards, starts, counts = np.unique(card_ids, return_index=True, return_counts=True)
+    order = np.argsort(-counts, kind="stable")
+    cards, starts, counts = cards[order], starts[order], counts[order]
+    count = len(cards)
+
+    state = [
+        cards, np.full(count, fsrs_kernel.LEARNING, dtype=np.int64), np.zeros(count, dtype=np.int64),
+        np.full(count, math.nan), np.full(count, math.nan), review_us[starts].astype(np.int64),
+        np.full(count, NULL_INT, dtype=np.int64)
+    ]
+    for k in range(int(counts[0]) if count else 0):
+        # Cards with more than k reviews
+        active = int(np.searchsorted(-counts, -k, "left"))
+        logs = starts[:active] + k
+        reviewed = fsrs_kernel.review_batch(
+            settings, fsrs_kernel.CardState(*(column[:active] for column in state)),
+            ratings[logs], review_us[logs], draws[logs]
+        )
+        for column, values in zip(state, reviewed):
+            column[:active] = values
+    return fsrs_kernel.CardState(*state)
+
+
+def _replayed_card(fsrs_card: Dict[str, Any], replayed: fsrs_kernel.CardState) -> Optional[Dict[str, Any]]:
+    """
+    submit_card_states callback: the replayed state under the card's own
+    fsrs card_id, or None if the card was reviewed after its last replayed review
+    """
+    current = fsrs_kernel.card_from_dict(fsrs_card)
+    if current.last_review_us is not None and current.last_review_us > replayed.last_review_us:
+        return None
+    return fsrs_kernel.card_to_dict(replayed._replace(card_id=current.card_id))
+
+
+def _split_groups(card_ids: np.ndarray, groups: int):
+    """
+    Yields (start, end) slices of sorted card_ids with about the same number
+    of logs each, never splitting a card's logs
+    """
+    boundaries = np.append(np.flatnonzero(np.concatenate(([True], card_ids[1:] != card_ids[:-1]))), len(card_ids))
+    targets = np.arange(1, groups) * len(card_ids) // groups
+    cuts = np.unique(boundaries[np.searchsorted(boundaries, targets)])
+    bounds = [0] + [int(cut) for cut in cuts if 0 < cut < len(card_ids)] + [len(card_ids)]
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        yield start, end
+
+
+def reschedule(shard: Optional[str], settings: fsrs_kernel.SchedulerSettings, progress=None) -> Dict[str, Any]:
+    """
+    Replays a shard's review history and stores every reviewed card's new state
+
+    Args:
+        settings: Settings of the scheduler to replay with (fsrs_controller.get_kernel_settings)
+        progress: Called with a phase name ("reading", "replaying") and the fraction done
+
+    Returns:
+        {"cards": cards rescheduled, "skipped": cards left alone because they were
+        reviewed meanwhile (or deleted), "review_count": logs replayed, "seconds"}
+    """
+    started = time.perf_counter()
+    report = progress or (lambda phase, fraction: None)
+    workers = background_jobs.MAX_WORKERS
+
+    parts = [background_jobs.jobs.run(read_review_part, shard, part, workers) for part in range(workers)]
+    read = []
+    for done, future in enumerate(as_completed(parts), 1):
+        read.append(future.result())
+        report("reading", 0.4 * done / workers)
+    log_ids, card_ids, ratings, review_us = (np.concatenate(columns) for columns in zip(*read))
+    del read
+
+    order = np.lexsort((log_ids, review_us, card_ids))
+    card_ids, ratings, review_us = card_ids[order], ratings[order], review_us[order]
+    draws = review_draws(log_ids[order])
+    review_count = len(card_ids)
+
+    groups = {
+        background_jobs.jobs.run(replay_cards, settings, card_ids[start:end], ratings[start:end],
+                                 review_us[start:end], draws[start:end]): end - start
+        for start, end in _split_groups(card_ids, workers * GROUPS_PER_WORKER)
+    } if review_count else {}
+
+    rescheduled = skipped = replayed = 0
+    for future in as_completed(groups):
+        cards = future.result()
+        for start in range(0, len(cards.card_id), WRITE_BATCH):
+            updates = [(int(cards.card_id[index]), fsrs_kernel.card_from_batch(cards, index))
+                       for index in range(start, min(start + WRITE_BATCH, len(cards.card_id)))]
+            changed, durable = database.submit_card_states(updates, _replayed_card, shard=shard)
+            durable.result()
+            rescheduled += changed
+            skipped += len(updates) - changed
+        replayed += groups[future]
+        report("replaying", 0.4 + 0.6 * replayed / review_count)
+
+    return {
+        "cards": rescheduled,
+        "skipped": skipped,
+        "review_count": review_count,
+        "seconds": round(time.perf_counter() - started, 3)
+    }
+
+
+def run_reschedule(job_id: int, shard: Optional[str], settings: fsrs_kernel.SchedulerSettings) -> Dict[str, Any]:
+    """
+    Job function for JobRunner.start: reschedule with progress reports
+    """
+    return reschedule(shard, settings, lambda phase, fraction: background_jobs.report_progress(job_id, phase, fraction))
@@ -0,0 +1,163 @@
+"""
+On-disk snapshot formats for the JSON storage engine.
+
+- json: the original pretty-printed database.json
+- msgpack: MessagePack with column-oriented collections. Each list of records
+  (learning_notes, cards, review_logs) is stored once as {column: [values]},
+  so keys such as "fsrs_card", "stability" or "review_datetime" are written once
+  per collection instead of once per record. Nested records (a card's
+  fsrs_card, a log's card snapshot) are stored the same way.
+
+Both formats load to the same dictionaries.
+"""
+
+import gc
+import json
+from typing import Dict, Any, List
+
+FORMATS = ("json", "msgpack")
+
+# Marks a table inside a msgpack snapshot
+_TABLE_KEY = "__columns__"
+_ROWS_KEY = "__rows__"
+_SPARSE_KEY = "__sparse__"
+
+# ExtType code used for keys missing from some records of a table
+_MISSING_EXT = 0
+
+
+class _Missing:
+    pass
+
+
+_MISSING = _Missing()
+
+
+def _msgpack():
+    try:
+        import msgpack
+    except ImportError:
+        raise ImportError("The msgpack snapshot format requires the msgpack package: pip install msgpack")
+    return msgpack
+
+
+def format_for_path(path: str) -> str:
+    """
+    Guesses the snapshot format from a file name
+    """
+    return "msgpack" if path.endswith((".msgpack", ".mpk")) else "json"
+
+
+def _is_table(value: Any) -> bool:
+    return isinstance(value, list) and len(value) > 0 and all(isinstance(item, dict) for item in value)
+
+
+def _encode_table(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Turns a list of records into {column: [values]}
+    """
+    msgpack = _msgpack()
+    missing = msgpack.ExtType(_MISSING_EXT, b"")
+
+    keys = {}
+    for record in records:
+        for key in record:
+            keys.setdefault(key, None)
+
+    columns = {}
+    sparse = []
+    for key in keys:
+        column = [record[key] if key in record else missing for record in records]
+        if any(value is missing for value in column):
+            sparse.append(key)
+        columns[key] = _encode_table(column) if _is_table(column) else column
+
+    return {_TABLE_KEY: columns, _ROWS_KEY: len(records), _SPARSE_KEY: sparse}
+
+
+def _decode_table(table: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Turns {column: [values]} back into a list of records
+    """
+    keys = list(table[_TABLE_KEY])
+    columns = [_decode_value(column) for column in table[_TABLE_KEY].values()]
+
+    if not keys:
+        return [{} for _ in range(table[_ROWS_KEY])]
+    if not table.get(_SPARSE_KEY):
+        return [dict(zip(keys, row)) for row in zip(*columns)]
+
+    return [
+        {key: value for key, value in zip(keys, row) if value is not _MISSING}
+        for row in zip(*columns)
+    ]
+
+
+def _decode_value(value: Any) -> Any:
+    if isinstance(value, dict) and _TABLE_KEY in value:
+        return _decode_table(value)
+    return value
+
+
+def _ext_hook(code: int, data: bytes) -> Any:
+    if code == _MISSING_EXT:
+        return _MISSING
+    return _msgpack().ExtType(code, data)
+
+
+def dumps(data: Dict[str, Any], fmt: str) -> bytes:
+    """
+    Serializes a database document in the given format
+    """
+    if fmt == "json":
+        return json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8')
+    if fmt == "msgpack":
+        encoded = {key: _encode_table(value) if _is_table(value) else value for key, value in data.items()}
+        return _msgpack().packb(encoded, use_bin_type=True)
+    raise ValueError(f"Unknown snapshot format: {fmt}. Must be one of {', '.join(FORMATS)}.")
+
+
+def loads(raw: bytes, fmt: str) -> Dict[str, Any]:
+    """
+    Parses a database document in the given format
+
+    Raises:
+        ValueError: If the snapshot is corrupted
+    """
+    if fmt == "json":
+        return json.loads(raw.decode('utf-8'))
+    if fmt == "msgpack":
+        msgpack = _msgpack()
+        try:
+            decoded = msgpack.unpackb(raw, raw=False, strict_map_key=False, ext_hook=_ext_hook)
+        except (ValueError, TypeError, msgpack.UnpackException) as e:
+            raise ValueError(f"Corrupted msgpack snapshot: {e}")
+        if not isinstance(decoded, dict):
+            raise ValueError("Corrupted msgpack snapshot: not a document")
+
+        # Rebuilding records allocates millions of objects that are all kept;
+        # pausing the cyclic GC meanwhile avoids repeated full collections
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return {key: _decode_value(value) for key, value in decoded.items()}
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+    raise ValueError(f"Unknown snapshot format: {fmt}. Must be one of {', '.join(FORMATS)}.")
+
+
+def load_snapshot(path: str, fmt: str = None) -> Dict[str, Any]:
+    """
+    Reads a snapshot file (format guessed from the extension if not given)
+    """
+    with open(path, 'rb') as f:
+        return loads(f.read(), fmt or format_for_path(path))
+
+
+def dump_snapshot(data: Dict[str, Any], path: str, fmt: str = None):
+    """
+    Writes a snapshot file (format guessed from the extension if not given)
+    """
+    with open(path, 'wb') as f:
+        f.write(dumps(data, fmt or format_for_path(path)))
@@ -0,0 +1,704 @@
+"""
+SQLite storage engine for the language learning database.
+
+Stores learning_notes, cards and review_logs in indexed tables so that
+endpoints only touch the rows they need. Timestamps used for scheduling
+(card due / last_review and review_datetime) are stored as integer epoch
+microseconds so the `due` index can be range-scanned directly; the API still
+sees the same dictionaries as the JSON engine.
+
+Each write is one transaction. The durability modes of group_commit.py map
+to SQLite's synchronous setting: fsync -> FULL, batched -> NORMAL (WAL is
+fsync'd at checkpoints), none -> OFF.
+"""
+
+import json
+import math
+import os
+import sqlite3
+from array import array
+from datetime import datetime
+from threading import RLock
+from concurrent.futures import Future
+from typing import Dict, Any, List, Optional, Tuple, Iterator, Iterable, Callable
+
+import json_stream
+import snapshot_formats
+from group_commit import DURABILITY_MODES, completed_future
+from columnar import NULL_INT
+from json_store import JSONStore, SETTINGS
+from timestamps import US_PER_DAY, datetime_to_us, iso_to_us, us_to_iso, study_day_start_us
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS notes (
+    id INTEGER PRIMARY KEY,
+    word TEXT NOT NULL,
+    translation TEXT NOT NULL,
+    sentence TEXT,
+    sentence_translation TEXT,
+    word_audio TEXT,
+    translation_audio TEXT,
+    sentence_audio TEXT,
+    sentence_translation_audio TEXT,
+    created_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS cards (
+    id INTEGER PRIMARY KEY,
+    note_id INTEGER NOT NULL,
+    direction TEXT NOT NULL,
+    fsrs_card_id INTEGER NOT NULL,
+    state INTEGER NOT NULL,
+    step INTEGER,
+    stability REAL,
+    difficulty REAL,
+    due_us INTEGER NOT NULL,
+    last_review_us INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS review_logs (
+    id INTEGER PRIMARY KEY,
+    card_id INTEGER NOT NULL,
+    rating INTEGER NOT NULL,
+    review_datetime_us INTEGER NOT NULL,
+    review_duration INTEGER,
+    card TEXT
+);
+
+-- Monotonic ID counters per collection; never move backwards, so deleted IDs are not reused
+CREATE TABLE IF NOT EXISTS sequences (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+
+-- Per-collection settings (json_store.SETTINGS) as JSON
+CREATE TABLE IF NOT EXISTS settings (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_cards_note_id ON cards (note_id);
+CREATE INDEX IF NOT EXISTS idx_cards_due ON cards (due_us);
+CREATE INDEX IF NOT EXISTS idx_review_logs_card_id ON review_logs (card_id);
+"""
+
+# Study day of a card's due date, as timestamps.study_day computes it
+# (integer division truncates like // for dates after the epoch)
+_DUE_DAY = f"((ROW.due_us - {study_day_start_us(0)}) / {US_PER_DAY})"
+
+# Cards per study day of their due date, kept up to date by triggers on
+# every insert, review and delete, so the review forecast reads one row per day
+DUE_DAYS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS due_days (
+    day INTEGER PRIMARY KEY,
+    cards INTEGER NOT NULL
+);
+
+CREATE TRIGGER IF NOT EXISTS due_days_insert AFTER INSERT ON cards BEGIN
+    INSERT INTO due_days (day, cards) VALUES (NEW_DAY, 1)
+        ON CONFLICT (day) DO UPDATE SET cards = cards + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS due_days_delete AFTER DELETE ON cards BEGIN
+    UPDATE due_days SET cards = cards - 1 WHERE day = OLD_DAY;
+    DELETE FROM due_days WHERE day = OLD_DAY AND cards = 0;
+END;
+
+CREATE TRIGGER IF NOT EXISTS due_days_update AFTER UPDATE OF due_us ON cards
+WHEN OLD_DAY != NEW_DAY BEGIN
+    UPDATE due_days SET cards = cards - 1 WHERE day = OLD_DAY;
+    DELETE FROM due_days WHERE day = OLD_DAY AND cards = 0;
+    INSERT INTO due_days (day, cards) VALUES (NEW_DAY, 1)
+        ON CONFLICT (day) DO UPDATE SET cards = cards + 1;
+END;
+""".replace("OLD_DAY", _DUE_DAY.replace("ROW", "OLD")).replace("NEW_DAY", _DUE_DAY.replace("ROW", "NEW"))
+
+NOTE_FIELDS = (
+    "id", "word", "translation", "sentence", "sentence_translation",
+    "word_audio", "translation_audio", "sentence_audio",
+    "sentence_translation_audio", "created_at"
+)
+
+# Collection name -> table name
+TABLES = {
+    "learning_notes": "notes",
+    "cards": "cards",
+    "review_logs": "review_logs"
+}
+
+
+def _note_row(note: Dict[str, Any]) -> tuple:
+    return tuple(note.get(field) for field in NOTE_FIELDS)
+
+
+def _fsrs_columns(fsrs_card: Dict[str, Any]) -> tuple:
+    return (
+        fsrs_card["card_id"],
+        fsrs_card["state"],
+        fsrs_card.get("step"),
+        fsrs_card.get("stability"),
+        fsrs_card.get("difficulty"),
+        iso_to_us(fsrs_card["due"]),
+        iso_to_us(fsrs_card.get("last_review"))
+    )
+
+
+def _card_row(card: Dict[str, Any]) -> tuple:
+    return (card["id"], card["note_id"], card["direction"]) + _fsrs_columns(card["fsrs_card"])
+
+
+def _review_log_row(log: Dict[str, Any]) -> tuple:
+    return (
+        log["id"],
+        log["card_id"],
+        log["rating"],
+        iso_to_us(log["review_datetime"]),
+        log.get("review_duration"),
+        json.dumps(log["card"], ensure_ascii=False) if log.get("card") is not None else None
+    )
+
+
+def _note_from_row(row: sqlite3.Row) -> Dict[str, Any]:
+    return {field: row[field] for field in NOTE_FIELDS}
+
+
+def _card_from_row(row: sqlite3.Row) -> Dict[str, Any]:
+    return {
+        "id": row["id"],
+        "note_id": row["note_id"],
+        "direction": row["direction"],
+        "fsrs_card": {
+            "card_id": row["fsrs_card_id"],
+            "state": row["state"],
+            "step": row["step"],
+            "stability": row["stability"],
+            "difficulty": row["difficulty"],
+            "due": us_to_iso(row["due_us"]),
+            "last_review": us_to_iso(row["last_review_us"])
+        }
+    }
+
+
+def _review_log_from_row(row: sqlite3.Row, iso: bool = True) -> Dict[str, Any]:
+    return {
+        "id": row["id"],
+        "card_id": row["card_id"],
+        "card": json.loads(row["card"]) if row["card"] is not None else None,
+        "rating": row["rating"],
+        "review_datetime": us_to_iso(row["review_datetime_us"]) if iso else row["review_datetime_us"],
+        "review_duration": row["review_duration"]
+    }
+
+
+# PRAGMA synchronous value for each durability mode
+SYNCHRONOUS = {"fsync": "FULL", "batched": "NORMAL", "none": "OFF"}
+
+# IDs per "WHERE id IN (...)" query, below SQLite's bound parameter limit
+LOOKUP_BATCH_SIZE = 500
+
+
+class SQLiteStore:
+    """
+    Storage engine backed by an indexed SQLite database
+    """
+
+    def __init__(self, path: str, legacy_json_file: Optional[str] = None, durability: str = "fsync"):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"Unknown durability mode: {durability}. Must be one of {', '.join(DURABILITY_MODES)}.")
+        self.path = path
+        self.durability = durability
+        # database.json to import from the first time the SQLite file is created
+        self.legacy_json_file = legacy_json_file
+        # Reentrant, so callbacks run under it (submit_answer's pick) can read the store
+        self._lock = RLock()
+        self._conn = None
+        # Incremented with every write through this store and whenever another
+        # connection committed (PRAGMA data_version changed)
+        self.version = 0
+        self._data_version = None
+
+    def _connect(self) -> sqlite3.Connection:
+        """
+        Opens the shared connection and creates the schema. Caller must hold the lock.
+        """
+        if self._conn is None:
+            is_new = not os.path.exists(self.path)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"PRAGMA synchronous={SYNCHRONOUS[self.durability]}")
+            has_due_days = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'due_days'").fetchone() is not None
+            conn.executescript(SCHEMA + DUE_DAYS_SCHEMA)
+            self._conn = conn
+            with conn:
+                self._seed_sequences()
+                if not has_due_days:
+                    # Database created before the forecast: count its cards once
+                    conn.execute(
+                        f"INSERT INTO due_days (day, cards) "
+                        f"SELECT {_DUE_DAY.replace('ROW', 'cards')} AS day, COUNT(*) FROM cards GROUP BY day"
+                    )
+
+            if is_new and self.legacy_json_file and os.path.exists(self.legacy_json_file):
+                # One-shot migration from the existing JSON database, streamed
+                # so a large collection is never held in memory as one document
+                self._import_items(JSONStore(self.legacy_json_file).iter_items())
+
+        return self._conn
+
+    def _replace_all(self, data: Dict[str, Any]):
+        """
+        Replaces every table with the contents of a database document. Caller must hold the lock.
+        """
+        self._import_items(json_stream.document_items(data, TABLES))
+
+    def _import_items(self, items: Iterator[Tuple[str, Any]], batch_size: int = 1000) -> Dict[str, int]:
+        """
+        Replaces every table with a streamed database document (see json_stream.iter_document),
+        inserting batch_size rows at a time. Caller must hold the lock.
+
+        Returns:
+            Row counts per collection
+        """
+        inserts = {
+            "learning_notes": (f"INSERT INTO notes ({', '.join(NOTE_FIELDS)}) VALUES ({', '.join('?' * len(NOTE_FIELDS))})", _note_row),
+            "cards": ("INSERT INTO cards VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", _card_row),
+            "review_logs": ("INSERT INTO review_logs VALUES (?, ?, ?, ?, ?, ?)", _review_log_row)
+        }
+        batches = {key: [] for key in inserts}
+        counts = {key: 0 for key in inserts}
+        sequences = {}
+
+        conn = self._conn
+        with conn:
+            conn.execute("DELETE FROM review_logs")
+            conn.execute("DELETE FROM cards")
+            conn.execute("DELETE FROM notes")
+            conn.execute("DELETE FROM settings")
+
+            for key, value in items:
+                if key in inserts:
+                    batch = batches[key]
+                    batch.append(inserts[key][1](value))
+                    counts[key] += 1
+                    if len(batch) >= batch_size:
+                        conn.executemany(inserts[key][0], batch)
+                        batch.clear()
+                elif key == "sequences":
+                    sequences = value
+                elif key in SETTINGS and value is not None:
+                    conn.execute("INSERT INTO settings (name, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+            for key, batch in batches.items():
+                if batch:
+                    conn.executemany(inserts[key][0], batch)
+
+            for key, value in sequences.items():
+                if key in TABLES:
+                    self._bump_sequence(key, value)
+            self._seed_sequences()
+
+        return counts
+
+    def _bump_sequence(self, key: str, value: int):
+        """
+        Raises a sequence to at least value. Caller must hold the lock and a transaction.
+        """
+        self._conn.execute(
+            "INSERT INTO sequences (name, value) VALUES (?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET value = MAX(value, excluded.value)",
+            (key, value)
+        )
+
+    def _seed_sequences(self):
+        """
+        Raises every sequence to at least the highest ID in its table. Caller must hold the lock and a transaction.
+        """
+        for key, table in TABLES.items():
+            highest = self._conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]
+            self._bump_sequence(key, highest)
+
+    def _allocate_id(self, key: str) -> int:
+        """
+        Reserves the next ID of a sequence. Caller must hold the lock and a transaction.
+        """
+        return self._conn.execute(
+            "UPDATE sequences SET value = value + 1 WHERE name = ? RETURNING value", (key,)
+        ).fetchone()[0]
+
+    def _query(self, sql: str, params: tuple = ()) -> List[sqlite3.Row]:
+        with self._lock:
+            return self._connect().execute(sql, params).fetchall()
+
+    def initialize(self):
+        """
+        Creates the database file and schema if they don't exist
+        """
+        with self._lock:
+            self._connect()
+
+    def start_background_tasks(self):
+        """
+        Opens the database; SQLite writes are already incremental so nothing runs in the background
+        """
+        self.initialize()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def read_data(self) -> Dict[str, Any]:
+        """
+        Reads the whole database
+        Returns a dictionary with learning_notes, cards, and review_logs
+        (ID counters and settings are not included, see allocate_id and get_setting)
+        """
+        return {
+            "learning_notes": self.get_notes(),
+            "cards": self.get_cards(),
+            "review_logs": self.get_review_logs()
+        }
+
+    def write_data(self, data: Dict[str, Any]):
+        """
+        Replaces the whole database; settings that data doesn't set keep their stored values
+        """
+        with self._lock:
+            conn = self._connect()
+            settings = {row["name"]: json.loads(row["value"]) for row in conn.execute("SELECT * FROM settings")}
+            self._replace_all({**settings, **data})
+            self.version += 1
+
+    def import_items(self, items: Iterator[Tuple[str, Any]]) -> Dict[str, int]:
+        """
+        Replaces the whole database with a streamed document, e.g. JSONStore.iter_items()
+
+        Returns:
+            Row counts per collection
+        """
+        with self._lock:
+            self._connect()
+            counts = self._import_items(items)
+            self.version += 1
+            return counts
+
+    def get_version(self) -> int:
+        """
+        Returns a number that goes up by one with every write made through this
+        store (and whenever another connection committed)
+        """
+        with self._lock:
+            data_version = self._connect().execute("PRAGMA data_version").fetchone()[0]
+            if data_version != self._data_version:
+                if self._data_version is not None:
+                    self.version += 1
+                self._data_version = data_version
+            return self.version
+
+    def get_notes(self) -> List[Dict[str, Any]]:
+        return [_note_from_row(r) for r in self._query("SELECT * FROM notes ORDER BY id")]
+
+    def get_note(self, note_id: int) -> Optional[Dict[str, Any]]:
+        rows = self._query("SELECT * FROM notes WHERE id = ?", (note_id,))
+        return _note_from_row(rows[0]) if rows else None
+
+    def get_notes_by_id(self, note_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+        notes = {}
+        note_ids = list(set(note_ids))
+        for start in range(0, len(note_ids), LOOKUP_BATCH_SIZE):
+            batch = tuple(note_ids[start:start + LOOKUP_BATCH_SIZE])
+            placeholders = ", ".join("?" * len(batch))
+            for row in self._query(f"SELECT * FROM notes WHERE id IN ({placeholders})", batch):
+                notes[row["id"]] = _note_from_row(row)
+        return notes
+
+    def get_cards(self) -> List[Dict[str, Any]]:
+        return [_card_from_row(r) for r in self._query("SELECT * FROM cards ORDER BY id")]
+
+    def get_card_columns(self) -> Dict[str, array]:
+        """
+        Returns the scheduling columns of every card, see JSONStore.get_card_columns
+        """
+        columns = {
+            "id": array('q'),
+            "note_id": array('q'),
+            "state": array('b'),
+            "stability": array('d'),
+            "difficulty": array('d'),
+            "due_us": array('q'),
+            "last_review_us": array('q')
+        }
+        rows = self._query("SELECT id, note_id, state, stability, difficulty, due_us, last_review_us FROM cards ORDER BY id")
+        for row in rows:
+            columns["id"].append(row[0])
+            columns["note_id"].append(row[1])
+            columns["state"].append(row[2])
+            columns["stability"].append(math.nan if row[3] is None else row[3])
+            columns["difficulty"].append(math.nan if row[4] is None else row[4])
+            columns["due_us"].append(row[5])
+            columns["last_review_us"].append(NULL_INT if row[6] is None else row[6])
+        return columns
+
+    def get_card(self, card_id: int) -> Optional[Dict[str, Any]]:
+        rows = self._query("SELECT * FROM cards WHERE id = ?", (card_id,))
+        return _card_from_row(rows[0]) if rows else None
+
+    def get_cards_for_note(self, note_id: int) -> List[Dict[str, Any]]:
+        rows = self._query("SELECT * FROM cards WHERE note_id = ? ORDER BY id", (note_id,))
+        return [_card_from_row(r) for r in rows]
+
+    def get_due_cards(self, now: datetime, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Returns cards whose FSRS due date is <= now, earliest first
+        """
+        sql = "SELECT * FROM cards WHERE due_us <= ? ORDER BY due_us"
+        params = (datetime_to_us(now),)
+        if limit is not None:
+            sql += " LIMIT ?"
+            params += (limit,)
+        return [_card_from_row(r) for r in self._query(sql, params)]
+
+    def get_due_forecast(self, first_day: int, days: int) -> Tuple[int, List[int]]:
+        """
+        Returns (cards due before first_day, [cards due on each of the days from first_day]),
+        days counted by timestamps.study_day; read from the due_days table
+        """
+        with self._lock:
+            conn = self._connect()
+            before = conn.execute("SELECT COALESCE(SUM(cards), 0) FROM due_days WHERE day < ?", (first_day,)).fetchone()[0]
+            counts = dict(conn.execute(
+                "SELECT day, cards FROM due_days WHERE day >= ? AND day < ?", (first_day, first_day + days)
+            ).fetchall())
+        return before, [counts.get(day, 0) for day in range(first_day, first_day + days)]
+
+    def get_review_logs(self) -> List[Dict[str, Any]]:
+        return [_review_log_from_row(r) for r in self._query("SELECT * FROM review_logs ORDER BY id")]
+
+    def iter_review_logs(self, iso: bool = True, part: Optional[Tuple[int, int]] = None,
+                         batch_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        """
+        Streams every review log in id order, batch_size rows per query
+        (review_datetime in epoch microseconds if iso is False). With
+        part=(index, count) only the index-th of count equal id ranges is read.
+        """
+        index, count = part or (0, 1)
+        first, last = self._query("SELECT MIN(id), MAX(id) FROM review_logs")[0]
+        if first is None:
+            return
+        span = last - first + 1
+        last_id = first + span * index // count - 1
+        end = first + span * (index + 1) // count
+        while True:
+            rows = self._query(
+                "SELECT * FROM review_logs WHERE id > ? AND id < ? ORDER BY id LIMIT ?", (last_id, end, batch_size)
+            )
+            for row in rows:
+                yield _review_log_from_row(row, iso)
+            if len(rows) < batch_size:
+                return
+            last_id = rows[-1]["id"]
+
+    def count_review_logs(self) -> int:
+        return self._query("SELECT COUNT(*) FROM review_logs")[0][0]
+
+    def allocate_id(self, key: str) -> int:
+        """
+        Reserves and returns the next ID for a collection
+        """
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                return self._allocate_id(key)
+
+    def get_setting(self, name: str) -> Any:
+        """
+        Returns a setting stored with the collection (one of json_store.SETTINGS), or None
+        """
+        rows = self._query("SELECT value FROM settings WHERE name = ?", (name,))
+        return json.loads(rows[0]["value"]) if rows else None
+
+    def set_setting(self, name: str, value: Any):
+        """
+        Stores a JSON-serializable setting (None removes it)
+        """
+        if name not in SETTINGS:
+            raise ValueError(f"Unknown setting: {name}")
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                if value is None:
+                    conn.execute("DELETE FROM settings WHERE name = ?", (name,))
+                else:
+                    conn.execute(
+                        "INSERT INTO settings (name, value) VALUES (?, ?) "
+                        "ON CONFLICT (name) DO UPDATE SET value = excluded.value",
+                        (name, json.dumps(value))
+                    )
+            self.version += 1
+
+    def submit_setting(self, name: str, value: Any) -> Future:
+        """
+        Same as set_setting; the returned future is already resolved since the transaction has committed
+        """
+        self.set_setting(name, value)
+        return completed_future()
+
+    def insert_note(self, note: Dict[str, Any], cards: List[Dict[str, Any]]):
+        """
+        Adds a note together with its cards in a single transaction
+        """
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    f"INSERT INTO notes ({', '.join(NOTE_FIELDS)}) VALUES ({', '.join('?' * len(NOTE_FIELDS))})",
+                    _note_row(note)
+                )
+                conn.executemany(
+                    "INSERT INTO cards VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (_card_row(c) for c in cards)
+                )
+                self._bump_sequence("learning_notes", note["id"])
+                self._bump_sequence("cards", max(c["id"] for c in cards))
+            self.version += 1
+
+    def submit_note(self, note: Dict[str, Any], cards: List[Dict[str, Any]]) -> Future:
+        """
+        Same as insert_note; the returned future is already resolved since the transaction has committed
+        """
+        self.insert_note(note, cards)
+        return completed_future()
+
+    def submit_review(self, card_id: int, fsrs_card: Dict[str, Any], review_log: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Future]:
+        """
+        Same as record_review; the returned future is already resolved since the transaction has committed
+        """
+        return self.record_review(card_id, fsrs_card, review_log), completed_future()
+
+    def record_review(self, card_id: int, fsrs_card: Dict[str, Any], review_log: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Stores a card's new FSRS state and appends its review log in a single transaction
+
+        Returns:
+            The stored review log entry, or None if the card does not exist
+        """
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                review_log_entry = self._record_review(conn, card_id, fsrs_card, review_log)
+            if review_log_entry is not None:
+                self.version += 1
+            return review_log_entry
+
+    def _record_review(self, conn: sqlite3.Connection, card_id: int, fsrs_card: Dict[str, Any],
+                       review_log: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Updates a card and appends its review log. Caller must hold the lock and a transaction.
+        """
+        cursor = conn.execute(
+            """
+            UPDATE cards
+            SET fsrs_card_id = ?, state = ?, step = ?, stability = ?, difficulty = ?,
+                due_us = ?, last_review_us = ?
+            WHERE id = ?
+            """,
+            _fsrs_columns(fsrs_card) + (card_id,)
+        )
+        if cursor.rowcount == 0:
+            return None
+
+        review_log_entry = {
+            "id": self._allocate_id("review_logs"),
+            "card_id": card_id,
+            **review_log
+        }
+        conn.execute("INSERT INTO review_logs VALUES (?, ?, ?, ?, ?, ?)", _review_log_row(review_log_entry))
+        return review_log_entry
+
+    def submit_reviews(self, answers: List[Tuple[int, Any]],
+                       review: Callable[[Dict[str, Any], Any], Optional[Tuple[Dict[str, Any], Dict[str, Any]]]]) -> Tuple[List[Optional[Dict[str, Any]]], Future]:
+        """
+        Reviews a batch of cards in order in one transaction, see JSONStore.submit_reviews
+        """
+        results = []
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                for card_id, payload in answers:
+                    rows = conn.execute("SELECT * FROM cards WHERE id = ?", (card_id,)).fetchall()
+                    reviewed = review(_card_from_row(rows[0])["fsrs_card"], payload) if rows else None
+                    if reviewed is None:
+                        results.append(None)
+                        continue
+                    fsrs_card, review_log = reviewed
+                    results.append(self._record_review(conn, card_id, fsrs_card, review_log))
+            if any(entry is not None for entry in results):
+                self.version += 1
+        return results, completed_future()
+
+    def submit_card_states(self, updates: List[Tuple[int, Any]],
+                           update: Callable[[Dict[str, Any], Any], Optional[Dict[str, Any]]]) -> Tuple[int, Future]:
+        """
+        Replaces the FSRS state of a batch of cards in one transaction, see JSONStore.submit_card_states
+        """
+        changed = 0
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                for card_id, payload in updates:
+                    rows = conn.execute("SELECT * FROM cards WHERE id = ?", (card_id,)).fetchall()
+                    fsrs_card = update(_card_from_row(rows[0])["fsrs_card"], payload) if rows else None
+                    if fsrs_card is None:
+                        continue
+                    conn.execute(
+                        """
+                        UPDATE cards
+                        SET fsrs_card_id = ?, state = ?, step = ?, stability = ?, difficulty = ?,
+                            due_us = ?, last_review_us = ?
+                        WHERE id = ?
+                        """,
+                        _fsrs_columns(fsrs_card) + (card_id,)
+                    )
+                    changed += 1
+            if changed:
+                self.version += 1
+        return changed, completed_future()
+
+    def submit_answer(self, card_id: int, review: Callable[[Dict[str, Any]], Tuple[Dict[str, Any], Dict[str, Any]]],
+                      pick: Optional[Callable[[Dict[str, Any]], Any]] = None) -> Tuple[Optional[Dict[str, Any]], Any, Future]:
+        """
+        Reviews a card in one transaction and picks what to show next before
+        releasing the lock, see JSONStore.submit_answer
+        """
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                rows = conn.execute("SELECT * FROM cards WHERE id = ?", (card_id,)).fetchall()
+                if not rows:
+                    return None, None, completed_future()
+
+                fsrs_card, review_log = review(_card_from_row(rows[0])["fsrs_card"])
+                review_log_entry = self._record_review(conn, card_id, fsrs_card, review_log)
+            self.version += 1
+            return review_log_entry, pick(fsrs_card) if pick is not None else None, completed_future()
+
+
+
+def migrate_from_json(json_file: str, sqlite_file: str) -> Dict[str, int]:
+    """
+    Imports a JSON engine database (database.json or database.msgpack, with its
+    journal, notes file and review log segments) into a SQLite database,
+    replacing its contents. Records are streamed one at a time.
+
+    Returns:
+        Row counts per collection
+    """
+    source = JSONStore(json_file, snapshot_format=snapshot_formats.format_for_path(json_file))
+
+    store = SQLiteStore(sqlite_file)
+    try:
+        return store.import_items(source.iter_items())
+    finally:
+        store.close()
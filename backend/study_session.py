@@ -0,0 +1,313 @@
+"""
+Daily study session queues.
+
+/study/next used to ask the store for the earliest due card on every call,
+and nothing remembered what the user had just seen, so the forward and
+reverse cards of a note were often shown back to back. A StudySession
+builds the day's review queue once, at session start and again after the
+day rolls over (DAY_START_HOUR, UTC), and is then kept up to date with the
+answers and notes recorded through the API, so serving the next card only
+looks at the front of the queue.
+
+- Cards due by the end of the study day are loaded once through the store's
+  due index (no scan of the collection).
+- Cards of the same note are spread at least SIBLING_SPACING cards apart in
+  the queue, and a card isn't served right after one of its siblings was
+  answered while another card is waiting.
+- An answered card leaves the queue; it comes back later the same day if
+  its new due date is still today (learning and relearning steps). Its old
+  entry is dropped lazily: from the front as the queue is served, and by a
+  compaction once dead entries outnumber live ones, so serving doesn't
+  slow down with the number of cards answered that day.
+
+Each write through the store raises its version by one (see
+database.get_version). The session checks the version before serving and
+after applying a write of its own; any other change (another process, a
+restore, a bulk import) makes it rebuild the queue from the store.
+
+All methods must be called from the event loop thread.
+"""
+
+import heapq
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, List, NamedTuple, Optional, Tuple
+
+import database
+from timestamps import DAY_START_HOUR, datetime_to_us, iso_to_us
+
+# Cards of one note are kept at least this many cards apart
+SIBLING_SPACING = 5
+
+
+class QueuedCard(NamedTuple):
+    card_id: int
+    note_id: int
+    due_us: int
+
+
+def study_day_end(now: datetime) -> datetime:
+    """
+    Returns when the study day containing now ends
+    """
+    if now.tzinfo is None:
+        now = now.replace(tzinfo=timezone.utc)
+    start = now.astimezone(timezone.utc).replace(hour=DAY_START_HOUR, minute=0, second=0, microsecond=0)
+    if start > now:
+        start -= timedelta(days=1)
+    return start + timedelta(days=1)
+
+
+def interleave_siblings(entries: List[QueuedCard], spacing: int = SIBLING_SPACING) -> List[QueuedCard]:
+    """
+    Orders cards so that cards of the same note are at least spacing cards apart
+
+    Args:
+        entries: Cards in the order they should be studied (earliest due first)
+        spacing: Cards to put between two cards of one note
+
+    Returns:
+        The same cards, each one moved back only as far as needed to keep it
+        away from a sibling; when too few other cards are left, siblings end
+        up closer together
+    """
+    result = []
+    # Cards held back because a sibling was placed too recently, in order
+    held = []
+    last_position = {}
+
+    def far_enough(entry):
+        position = last_position.get(entry.note_id)
+        return position is None or len(result) - position > spacing
+
+    def place(entry):
+        last_position[entry.note_id] = len(result)
+        result.append(entry)
+
+    def place_held():
+        # Held cards were due before the next card, so they go first once they may
+        while held:
+            index = next((i for i, entry in enumerate(held) if far_enough(entry)), None)
+            if index is None:
+                return
+            place(held.pop(index))
+
+    for entry in entries:
+        place_held()
+        if far_enough(entry):
+            place(entry)
+        else:
+            held.append(entry)
+
+    while held:
+        place_held()
+        if held:
+            place(held.pop(0))
+    return result
+
+
+class StudySession:
+    """
+    The study queue of one shard for the current study day
+    """
+
+    def __init__(self, shard: Optional[str] = None, spacing: int = SIBLING_SPACING):
+        self.shard = shard
+        self.spacing = spacing
+        # Store version the queue reflects; None until built (or after a change made elsewhere)
+        self.version = None
+        self.day_end = None
+        self._day_end_us = None
+        # card_id -> its live queue entry; entries of _ready/_later not in here were answered
+        self._queued = {}
+        # Cards due now, in serving order
+        self._ready = deque()
+        # Cards due later today as a heap of (due_us, card_id, entry)
+        self._later = []
+        # Notes of the most recently answered cards
+        self._recent_notes = deque(maxlen=spacing)
+        # Entries of _ready and _later that are no longer live
+        self._dead = 0
+
+    def _build(self, now: datetime):
+        """
+        Loads the cards due by the end of the study day from the store
+        """
+        self.version = database.get_version(shard=self.shard)
+        self.day_end = study_day_end(now)
+        self._day_end_us = datetime_to_us(self.day_end)
+        now_us = datetime_to_us(now)
+
+        entries = [
+            QueuedCard(card["id"], card["note_id"], iso_to_us(card["fsrs_card"]["due"]))
+            for card in database.get_due_cards(self.day_end - timedelta(microseconds=1), shard=self.shard)
+        ]
+        self._queued = {entry.card_id: entry for entry in entries}
+        self._ready = deque(interleave_siblings([entry for entry in entries if entry.due_us <= now_us], self.spacing))
+        self._later = [(entry.due_us, entry.card_id, entry) for entry in entries if entry.due_us > now_us]
+        heapq.heapify(self._later)
+        self._dead = 0
+
+    def _refresh(self, now: datetime):
+        """
+        Rebuilds the queue on a new study day or if the store changed behind
+        the session's back, then moves cards that came due into the ready queue
+        """
+        if self.version is None or now >= self.day_end or database.get_version(shard=self.shard) != self.version:
+            self._build(now)
+
+        if self._dead > len(self._queued):
+            self._compact()
+
+        now_us = datetime_to_us(now)
+        while self._later and self._later[0][0] <= now_us:
+            entry = heapq.heappop(self._later)[2]
+            if self._live(entry):
+                self._ready.append(entry)
+            else:
+                self._dead -= 1
+
+    def _compact(self):
+        """
+        Drops the entries of answered cards from _ready and _later
+        """
+        self._ready = deque(entry for entry in self._ready if self._live(entry))
+        self._later = [item for item in self._later if self._live(item[2])]
+        heapq.heapify(self._later)
+        self._dead = 0
+
+    def _live(self, entry: QueuedCard) -> bool:
+        return self._queued.get(entry.card_id) is entry
+
+    def _serving_order(self):
+        """
+        Yields the live ready cards in the order they would be served
+        """
+        while self._ready and not self._live(self._ready[0]):
+            self._ready.popleft()
+            self._dead -= 1
+
+        # A card whose sibling was just answered waits until another card has been served
+        deferred = []
+        for entry in self._ready:
+            if not self._live(entry):
+                continue
+            if entry.note_id in self._recent_notes:
+                deferred.append(entry)
+            else:
+                yield entry
+        yield from deferred
+
+    def next_card(self, now: datetime) -> Optional[Dict[str, Any]]:
+        """
+        Returns the card to study next, or None if nothing is due
+        """
+        return next(iter(self.upcoming(now, 1)), None)
+
+    def upcoming(self, now: datetime, n: int) -> List[Dict[str, Any]]:
+        """
+        Returns the next n cards in serving order (due now, siblings kept apart)
+        """
+        self._refresh(now)
+        cards = []
+        for entry in self._serving_order():
+            card = database.get_card(entry.card_id, shard=self.shard)
+            if card is None:
+                continue
+            cards.append(card)
+            if len(cards) >= n:
+                break
+        return cards
+
+    def _apply_write(self) -> bool:
+        """
+        Checks that the store saw exactly one write since the queue was last
+        in sync, i.e. the write being applied. Otherwise the queue is rebuilt
+        before it is used next.
+        """
+        version = database.get_version(shard=self.shard)
+        if self.version is None or version != self.version + 1:
+            self.version = None
+            return False
+        self.version = version
+        return True
+
+    def _enqueue(self, card_id: int, note_id: int, fsrs_card: Dict[str, Any]):
+        """
+        Queues a card (replacing its entry) if it is due before the study day ends
+        """
+        if self._queued.pop(card_id, None) is not None:
+            self._dead += 1
+        due_us = iso_to_us(fsrs_card.get("due"))
+        if due_us is not None and due_us < self._day_end_us:
+            entry = QueuedCard(card_id, note_id, due_us)
+            self._queued[card_id] = entry
+            heapq.heappush(self._later, (due_us, card_id, entry))
+
+    def cards_answered(self, reviews: List[Tuple[int, Dict[str, Any]]]):
+        """
+        Updates the queue after reviews were stored with one write
+
+        Args:
+            reviews: (card_id, new FSRS state) of each stored review, in the order they were applied
+        """
+        if not reviews or not self._apply_write():
+            return
+        for card_id, fsrs_card in reviews:
+            entry = self._queued.get(card_id)
+            if entry is not None:
+                note_id = entry.note_id
+            else:
+                card = database.get_card(card_id, shard=self.shard)
+                if card is None:
+                    continue
+                note_id = card["note_id"]
+            self._recent_notes.append(note_id)
+            self._enqueue(card_id, note_id, fsrs_card)
+
+    def card_answered(self, card_id: int, fsrs_card: Dict[str, Any]):
+        """
+        Updates the queue after a single review was stored
+        """
+        self.cards_answered([(card_id, fsrs_card)])
+
+    def cards_added(self, cards: List[Dict[str, Any]]):
+        """
+        Updates the queue after a note's new cards were stored with one write
+        """
+        if not cards or not self._apply_write():
+            return
+        for card in cards:
+            self._enqueue(card["id"], card["note_id"], card["fsrs_card"])
+
+
+# One session per shard, like the stores in database.py
+_sessions = {}
+
+
+def get_session(shard: Optional[str] = None) -> StudySession:
+    """
+    Returns the study session of a shard, creating it on first use
+    """
+    key = shard or database.DEFAULT_SHARD
+    session = _sessions.get(key)
+    if session is None:
+        session = _sessions[key] = StudySession(shard)
+    return session
+
+
+def drop_session(shard: str):
+    """
+    Forgets a shard's session (its store was closed, see database.on_shard_closed)
+    """
+    _sessions.pop(shard, None)
+
+
+def reset_sessions():
+    """
+    Forgets every session (they are rebuilt from the stores on next use)
+    """
+    _sessions.clear()
+
+
+database.on_shard_closed(drop_session)
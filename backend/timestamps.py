@@ -0,0 +1,69 @@
+"""
+Conversions between ISO 8601 timestamps and integer epoch microseconds.
+
+The storage engines keep scheduling timestamps (card due / last_review and
+review_datetime) as integers so they can be compared and indexed without
+parsing; microseconds keep the round trip to ISO strings exact.
+"""
+
+from datetime import datetime, timezone, timedelta
+from typing import Optional
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+US_PER_DAY = 86_400_000_000
+
+# Hour (UTC) at which a new study day starts
+DAY_START_HOUR = 4
+
+_DAY_START_US = DAY_START_HOUR * 3_600_000_000
+
+
+def datetime_to_us(dt: datetime) -> int:
+    """
+    Converts a datetime to integer epoch microseconds (naive datetimes are treated as UTC)
+    """
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    delta = dt - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+def us_to_datetime(value: int) -> datetime:
+    """
+    Converts integer epoch microseconds to a UTC datetime
+    """
+    return EPOCH + timedelta(microseconds=value)
+
+
+def iso_to_us(value: Optional[str]) -> Optional[int]:
+    """
+    Converts an ISO 8601 timestamp to integer epoch microseconds
+    """
+    if not value:
+        return None
+    return datetime_to_us(datetime.fromisoformat(value.replace('Z', '+00:00')))
+
+
+def us_to_iso(value: Optional[int]) -> Optional[str]:
+    """
+    Converts integer epoch microseconds back to an ISO 8601 UTC timestamp
+    """
+    if value is None:
+        return None
+    return us_to_datetime(value).isoformat()
+
+
+def study_day(value: int) -> int:
+    """
+    Returns the number of the study day (starting at DAY_START_HOUR UTC,
+    counted from the epoch) containing epoch microseconds
+    """
+    return (value - _DAY_START_US) // US_PER_DAY
+
+
+def study_day_start_us(day: int) -> int:
+    """
+    Returns when a study day (see study_day) starts, in epoch microseconds
+    """
+    return day * US_PER_DAY + _DAY_START_US
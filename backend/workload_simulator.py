@@ -0,0 +1,255 @@
+"""
+Workload vs retention simulator for /workload-retention.
+
+The Stats page plots how many reviews a day the collection would need at
+each desired retention in RETENTION_LEVELS. The curve comes from a Monte
+Carlo simulation of SIMULATION_DAYS of future reviews of every card under
+the shard's scheduler: its weights, learning and relearning steps and
+maximum interval.
+
+- Every card starts from its stored stability, difficulty, due date and
+  last review; cards never reviewed get their first review on their due day.
+- Each day, every due card is recalled with the probability the memory
+  model predicts and rated with the FSRS simulator's default rating
+  distributions. Its stability and difficulty are updated with the same
+  vectorized model the optimizer fits (fsrs_optimizer.next_states), and its
+  next interval is computed from the retention being simulated.
+- Learning and relearning steps are same-day reviews rated Good; they
+  count towards the workload.
+- The card state is one flat (retentions x cards) array per field, so the
+  whole retention grid advances together. Every retention uses the same
+  random draws for a card on a given day (common random numbers), so the
+  curve is smooth and the results don't depend on how the grid is split.
+
+The grid is split across the background_jobs process pool. The result is
+cached per shard, keyed on the store version (database.get_version), the
+scheduler settings and the study day. The Stats page gets it instantly
+until a card changes, its scheduler configuration changes or the day rolls over.
+
+workload_curve must be called from the event loop thread.
+"""
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, List, Optional, Sequence
+
+import numpy as np
+
+import background_jobs
+import database
+import fsrs_controller
+import fsrs_optimizer
+from columnar import NULL_INT
+from fsrs_controller import DECAY, FACTOR
+from study_session import study_day_end
+from timestamps import US_PER_DAY, datetime_to_us
+
+RETENTION_LEVELS = (0.70, 0.75, 0.80, 0.85, 0.90, 0.92, 0.94, 0.95, 0.96, 0.97, 0.98, 0.99)
+
+# Days of future reviews simulated; the workload is their average
+SIMULATION_DAYS = 365
+
+# Simulated reviews happen at this fraction of the study day
+REVIEW_TIME = 0.5
+
+SEED = 2024
+
+# Probabilities of Again, Hard, Good, Easy for a card's first review, and of
+# Hard, Good, Easy when a card is recalled (defaults of the FSRS simulator)
+FIRST_RATING_PROBABILITIES = (0.24, 0.094, 0.495, 0.171)
+RECALL_RATING_PROBABILITIES = (0.3, 0.6, 0.1)
+
+_FIRST_RATING_THRESHOLDS = np.cumsum(FIRST_RATING_PROBABILITIES)[:-1]
+_RECALL_RATING_THRESHOLDS = np.cumsum(RECALL_RATING_PROBABILITIES)[:-1]
+
+# shard -> (cache key, future of the data points)
+_cache: Dict[Optional[str], tuple] = {}
+
+
+def random_draws(seed: int, day: int, cards: int):
+    """
+    Uniform draws deciding the recall and the rating of every card on a day
+    """
+    rng = np.random.default_rng([seed, day])
+    return rng.random(cards), rng.random(cards)
+
+
+def first_ratings(draws: np.ndarray) -> np.ndarray:
+    return np.searchsorted(_FIRST_RATING_THRESHOLDS, draws, side="right") + 1
+
+
+def review_ratings(recalled: np.ndarray, draws: np.ndarray) -> np.ndarray:
+    return np.where(recalled, np.searchsorted(_RECALL_RATING_THRESHOLDS, draws, side="right") + 2, 1)
+
+
+def simulate_workload(parameters: Sequence[float], learning_steps: int, relearning_steps: int,
+                      maximum_interval: int, stability: np.ndarray, difficulty: np.ndarray,
+                      due_day: np.ndarray, last_review_day: np.ndarray, retentions: Sequence[float],
+                      days: int = SIMULATION_DAYS, seed: int = SEED) -> List[float]:
+    """
+    Simulates the reviews of every card at several desired retentions
+
+    Args:
+        parameters: Scheduler weights
+        learning_steps, relearning_steps: Number of same-day steps of the scheduler
+        maximum_interval: Longest interval in days
+        stability, difficulty: Memory state of each card, NaN if never reviewed
+        due_day: Study day each card is due, counted from today (0); overdue cards are due today
+        last_review_day: Day of each card's last review in fractional days since the start of today, NaN if never
+        retentions: Desired retentions to simulate
+        days: Days to simulate
+        seed: Seed of the random draws
+
+    Returns:
+        Average reviews per day at each retention
+    """
+    weights = np.asarray(parameters[:fsrs_optimizer.MODEL_WEIGHTS], dtype=np.float64)[None, :]
+    levels = len(retentions)
+    cards = len(due_day)
+    interval_factor = (np.asarray(retentions, dtype=np.float64) ** (1 / DECAY) - 1) / FACTOR
+
+    # Flat (levels * cards) state, level-major
+    stability = np.tile(np.asarray(stability, dtype=np.float64), levels)
+    difficulty = np.tile(np.asarray(difficulty, dtype=np.float64), levels)
+    due_day = np.tile(np.asarray(due_day, dtype=np.int32), levels)
+    last_review_day = np.tile(np.asarray(last_review_day, dtype=np.float64), levels)
+    reviews = np.zeros(levels, dtype=np.int64)
+
+    for day in range(days):
+        due = np.flatnonzero(due_day == day)
+        if not len(due):
+            continue
+        levels_due, cards_due = np.divmod(due, cards)
+        recall_draws, rating_draws = random_draws(seed, day, cards)
+        now = day + REVIEW_TIME
+        s = stability[due]
+        d = difficulty[due]
+        ratings = np.empty(len(due), dtype=np.int64)
+        extra_reviews = np.zeros(len(due), dtype=np.int64)
+
+        never_reviewed = np.isnan(s)
+        new = np.flatnonzero(never_reviewed)
+        known = np.flatnonzero(~never_reviewed)
+        if len(new):
+            ratings[new] = first_ratings(rating_draws[cards_due[new]])
+            first_stability, first_difficulty = fsrs_optimizer.initial_states(weights, ratings[new])
+            s[new] = first_stability[0]
+            d[new] = first_difficulty[0]
+            # Again and Hard go through every learning step, Good skips the first
+            extra_reviews[new] = np.where(ratings[new] == 4, 0, learning_steps - (ratings[new] == 3))
+
+        if len(known):
+            elapsed_days = np.maximum(np.floor(now - last_review_day[due[known]]), 0)
+            retrievability = (1 + FACTOR * elapsed_days / s[known]) ** DECAY
+            ratings[known] = review_ratings(recall_draws[cards_due[known]] < retrievability, rating_draws[cards_due[known]])
+            _, next_stability, next_difficulty = fsrs_optimizer.next_states(
+                weights, s[known][None, :], d[known][None, :], ratings[known], elapsed_days
+            )
+            s[known] = next_stability[0]
+            d[known] = next_difficulty[0]
+            extra_reviews[known] = np.where(ratings[known] == 1, relearning_steps, 0)
+
+        # Same-day steps until the card graduates, each rated Good
+        np.maximum(extra_reviews, 0, out=extra_reviews)
+        for step in range(int(extra_reviews.max())):
+            stepping = np.flatnonzero(extra_reviews > step)
+            _, step_stability, step_difficulty = fsrs_optimizer.next_states(
+                weights, s[stepping][None, :], d[stepping][None, :], 3, 0.0
+            )
+            s[stepping] = step_stability[0]
+            d[stepping] = step_difficulty[0]
+
+        intervals = np.clip(np.round(s * interval_factor[levels_due]), 1, maximum_interval)
+        stability[due] = s
+        difficulty[due] = d
+        due_day[due] = day + intervals
+        last_review_day[due] = now
+        reviews += np.bincount(levels_due, weights=1 + extra_reviews, minlength=levels).astype(np.int64)
+
+    return (reviews / days).tolist()
+
+
+def card_days(columns: Dict[str, Any], day_start_us: int) -> Dict[str, np.ndarray]:
+    """
+    Converts stored card columns to the simulator's inputs, with days counted from day_start_us
+
+    Returns:
+        stability, difficulty, due_day and last_review_day arrays (see simulate_workload)
+    """
+    stability = np.frombuffer(columns["stability"], dtype=np.float64)
+    difficulty = np.frombuffer(columns["difficulty"], dtype=np.float64)
+    due_us = np.frombuffer(columns["due_us"], dtype=np.int64)
+    last_review_us = np.frombuffer(columns["last_review_us"], dtype=np.int64)
+
+    reviewed = (last_review_us != NULL_INT) & ~np.isnan(stability) & ~np.isnan(difficulty)
+    due_day = np.maximum((due_us - day_start_us) // US_PER_DAY, 0)
+    # Cards whose state is kept outside the columns are never due
+    due_day[due_us == NULL_INT] = -1
+    return {
+        "stability": np.where(reviewed, stability, np.nan),
+        "difficulty": np.where(reviewed, difficulty, np.nan),
+        "due_day": due_day,
+        "last_review_day": np.where(reviewed, (last_review_us - day_start_us) / US_PER_DAY, np.nan)
+    }
+
+
+async def _simulate(shard: Optional[str], day_start_us: int, settings: tuple) -> List[Dict[str, float]]:
+    columns = database.get_card_columns(shard=shard)
+    if not len(columns["id"]):
+        return []
+    inputs = card_days(columns, day_start_us)
+    chunks = [chunk.tolist() for chunk in np.array_split(RETENTION_LEVELS, background_jobs.MAX_WORKERS) if len(chunk)]
+    futures = [
+        asyncio.wrap_future(background_jobs.jobs.run(simulate_workload, *settings, *inputs.values(), chunk))
+        for chunk in chunks
+    ]
+    workloads = [workload for chunk in await asyncio.gather(*futures) for workload in chunk]
+    return [
+        {"retention": retention, "workload": round(workload, 2)}
+        for retention, workload in zip(RETENTION_LEVELS, workloads)
+    ]
+
+
+async def workload_curve(shard: Optional[str] = None, now: Optional[datetime] = None) -> List[Dict[str, float]]:
+    """
+    Returns the simulated workload at each level of RETENTION_LEVELS, from
+    the cache while the collection, scheduler and study day are unchanged
+
+    Returns:
+        [{"retention": 0.9, "workload": reviews per day}, ...], empty without cards
+    """
+    day_start_us = datetime_to_us(study_day_end(now or datetime.now(timezone.utc)) - timedelta(days=1))
+    scheduler = fsrs_controller.get_scheduler(shard)
+    settings = (
+        tuple(scheduler.parameters), len(scheduler.learning_steps),
+        len(scheduler.relearning_steps), scheduler.maximum_interval
+    )
+    key = (database.get_version(shard=shard), settings, day_start_us)
+
+    cached = _cache.get(shard)
+    if cached is None or cached[0] != key:
+        future = asyncio.ensure_future(_simulate(shard, day_start_us, settings))
+        cached = _cache[shard] = (key, future)
+    try:
+        return await asyncio.shield(cached[1])
+    except Exception:
+        if _cache.get(shard) is cached:
+            del _cache[shard]
+        raise
+
+
+def drop_cache(shard: str):
+    """
+    Forgets a shard's cached curve (its store was closed, see database.on_shard_closed)
+    """
+    _cache.pop(shard, None)
+
+
+def reset_cache():
+    """
+    Forgets every cached curve (shutdown, tests)
+    """
+    _cache.clear()
+
+
+database.on_shard_closed(drop_cache)
@@ -12,10 +12,12 @@ function Stats() {
   const [optimizeMessage, setOptimizeMessage] = useState('')
   const [workloadData, setWorkloadData] = useState([])
   const [loadingWorkload, setLoadingWorkload] = useState(false)
+  const [forecast, setForecast] = useState(null)
 
   useEffect(() => {
     fetchStats()
     fetchWorkloadData()
+    fetchForecast()
   }, [])
 
   const fetchStats = async () => {
@@ -31,6 +33,17 @@ function Stats() {
     }
   }
 
+  const fetchForecast = async () => {
+    try {
+      const api = await getApi()
+      const response = await api.get('/forecast', { params: { days: 30 } })
+      setForecast(response.data)
+    } catch (error) {
+      console.error('Error fetching forecast:', error)
+      setForecast(null)
+    }
+  }
+
   const fetchWorkloadData = async () => {
     try {
       setLoadingWorkload(true)
@@ -51,7 +64,24 @@ function Stats() {
       setOptimizeMessage('Optimizing FSRS parameters...')
       const api = await getApi()
       const response = await api.post('/optimize-fsrs')
-      setOptimizeMessage(response.data.message || 'Parameters optimized successfully!')
+      setOptimizeMessage(response.data.message || 'Optimizing FSRS parameters...')
+
+      // The fit runs in the background; follow it until it finishes
+      let job = response.data.job
+      while (job && job.status !== 'completed' && job.status !== 'failed') {
+        await new Promise(resolve => setTimeout(resolve, 1000))
+        job = (await api.get('/optimize-fsrs/status')).data
+        setOptimizeMessage(`Optimizing FSRS parameters (${job.phase || job.status})... ${Math.round(job.progress * 100)}%`)
+      }
+
+      if (job?.status === 'failed') {
+        setOptimizeMessage(`Optimization failed: ${job.error}`)
+      } else if (job?.result) {
+        const { applied, log_loss_before, log_loss_after, training_reviews } = job.result
+        setOptimizeMessage(applied
+          ? `Parameters optimized on ${training_reviews} reviews (log loss ${log_loss_before.toFixed(3)} → ${log_loss_after.toFixed(3)}).`
+          : `Current parameters already fit your ${training_reviews} reviews best; kept them.`)
+      }
       setTimeout(() => setOptimizeMessage(''), 5000)
       await fetchStats()
     } catch (error) {
@@ -62,14 +92,18 @@ function Stats() {
     }
   }
 
+  // Overdue cards plus the cards due later today, from the server's due histogram
   const calculateDueCards = () => {
-    if (!stats || !stats.cards) return 0
-    
-    const now = new Date()
-    return stats.cards.filter(card => {
-      const dueDate = new Date(card.fsrs_card.due)
-      return dueDate <= now
-    }).length
+    if (!forecast || forecast.days.length === 0) return 0
+    return forecast.overdue + forecast.days[0].due
+  }
+
+  // Cards due per day, with the overdue ones counted today
+  const getForecastBars = () => {
+    if (!forecast) return []
+    return forecast.days.map((day, index) => (
+      index === 0 ? { ...day, due: day.due + forecast.overdue } : day
+    ))
   }
 
   const calculateReviewsToday = () => {
@@ -343,6 +377,31 @@ function Stats() {
         </div>
       </div>
 
+      {/* Review Forecast */}
+      {forecast && (
+        <div className="card mb-8">
+          <h2 className="text-2xl font-bold text-gray-900 mb-2">Review Forecast</h2>
+          <p className="text-gray-600 mb-6">Cards due on each of the next {forecast.days.length} days</p>
+          <div className="flex items-end h-40 gap-1">
+            {getForecastBars().map((day, index, bars) => {
+              const maxDue = Math.max(...bars.map(bar => bar.due), 1)
+              return (
+                <div
+                  key={day.date}
+                  className="flex-1 bg-hearsay-blue rounded-t"
+                  style={{ height: `${(day.due / maxDue) * 100}%`, minHeight: day.due > 0 ? '2px' : '0' }}
+                  title={`${day.date}: ${day.due} cards`}
+                ></div>
+              )
+            })}
+          </div>
+          <div className="flex justify-between text-xs text-gray-500 mt-2">
+            <span>Today</span>
+            <span>{forecast.days[forecast.days.length - 1].date}</span>
+          </div>
+        </div>
+      )}
+
       <div className="grid grid-cols-1 lg:grid-cols-2 gap-8 mb-8">
         {/* Card States */}
         <div className="card">
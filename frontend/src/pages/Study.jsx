@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react'
+import { useState, useEffect, useRef } from 'react'
 import { getApi, getBackendUrl } from '../api/backend'
 
 function Study() {
@@ -13,9 +13,31 @@ function Study() {
     initializeBackend()
   }, [])
 
-  // Poll for hardware actions
+  // Latest values for the hardware handlers, which outlive individual renders
+  const hardwareContext = useRef({})
+
+  const handleHardwareAction = async (action) => {
+    const { showAnswer, currentCard, handleAnswer } = hardwareContext.current
+    if (action.action === 'show_card') {
+      // Show the answer
+      setShowAnswer(true)
+    } else if (action.action === 'submit_rating') {
+      // Submit the rating if answer is shown
+      if (showAnswer && currentCard && handleAnswer) {
+        await handleAnswer(action.rating)
+      }
+    }
+  }
+
+  // Receive hardware actions: pushed over a WebSocket, or polled every 200ms
+  // while the socket is down (older backends, proxies without WebSockets)
   useEffect(() => {
-    let pollInterval
+    if (!backendUrl) return
+
+    let socket = null
+    let pollInterval = null
+    let reconnectTimer = null
+    let stopped = false
 
     const pollHardware = async () => {
       try {
@@ -25,15 +47,7 @@ function Study() {
         if (response.data.actions && response.data.actions.length > 0) {
           // Process each action
           for (const action of response.data.actions) {
-            if (action.action === 'show_card') {
-              // Show the answer
-              setShowAnswer(true)
-            } else if (action.action === 'submit_rating') {
-              // Submit the rating if answer is shown
-              if (showAnswer && currentCard) {
-                await handleAnswer(action.rating)
-              }
-            }
+            await handleHardwareAction(action)
           }
         }
       } catch (error) {
@@ -42,15 +56,48 @@ function Study() {
       }
     }
 
-    // Poll every 200ms for responsive hardware interaction
-    pollInterval = setInterval(pollHardware, 200)
+    const startPolling = () => {
+      if (!pollInterval) {
+        pollInterval = setInterval(pollHardware, 200)
+      }
+    }
 
-    return () => {
+    const stopPolling = () => {
       if (pollInterval) {
         clearInterval(pollInterval)
+        pollInterval = null
+      }
+    }
+
+    const connect = () => {
+      socket = new WebSocket(`${backendUrl.replace(/^http/, 'ws')}/hardware/ws`)
+      socket.onopen = () => stopPolling()
+      socket.onmessage = (message) => {
+        const event = JSON.parse(message.data)
+        if (event.type === 'action') {
+          handleHardwareAction(event)
+        }
+      }
+      socket.onclose = () => {
+        socket = null
+        if (stopped) return
+        startPolling()
+        reconnectTimer = setTimeout(connect, 5000)
       }
     }
-  }, [showAnswer, currentCard]) // Re-create interval when these change
+
+    startPolling()
+    connect()
+
+    return () => {
+      stopped = true
+      stopPolling()
+      clearTimeout(reconnectTimer)
+      if (socket) {
+        socket.close()
+      }
+    }
+  }, [backendUrl])
 
   const initializeBackend = async () => {
     try {
@@ -137,13 +184,21 @@ function Study() {
     try {
       setLoading(true)
       const api = await getApi()
-      await api.post('/study/answer', {
+      // Record the rating and get the next card in one request
+      const response = await api.post('/study/answer-next', {
         card_id: currentCard.id,
         rating: rating
       })
       
-      // Fetch next card
-      await fetchNextCard()
+      setShowAnswer(false)
+      if (response.data.next_card) {
+        setCurrentCard(response.data.next_card)
+        setMessage('')
+      } else {
+        setCurrentCard(null)
+        setMessage('No cards due')
+      }
+      setLoading(false)
     } catch (error) {
       console.error('Error submitting answer:', error)
       setMessage('Error submitting answer')
@@ -151,6 +206,8 @@ function Study() {
     }
   }
 
+  hardwareContext.current = { showAnswer, currentCard, handleAnswer }
+
   const playAudio = (filename) => {
     if (!filename || !backendUrl) return
     const audio = new Audio(`${backendUrl}/audio/${filename}`)
@@ -10,7 +10,9 @@ Both sensors trigger "show card" action when detected.
 
 import serial
 import requests
+import json
 import time
+import threading
 from collections import deque
 from config import (
     BACKEND_URL, 
@@ -39,8 +41,35 @@ sensor_y_buffer = deque(maxlen=SENSOR_WINDOW_SIZE)
 sensor_x_state = 'idle'
 sensor_y_state = 'idle'
 
+# Card state pushed by the backend's /hardware/events stream (None while not connected)
+pushed_card_state = None
+
+def follow_card_state():
+    """Keep pushed_card_state up to date from the backend's event stream, reconnecting as needed"""
+    global pushed_card_state
+    while True:
+        try:
+            # The backend sends a keepalive every 15s, so a longer read timeout means the stream is dead
+            with requests.get(f"{BACKEND_URL}/hardware/events", stream=True, timeout=(2, 30)) as response:
+                response.raise_for_status()
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith("data:"):
+                        continue
+                    event = json.loads(line[len("data:"):])
+                    if event.get("type") == "state":
+                        pushed_card_state = event.get("card_state")
+                    elif event.get("type") == "card_state":
+                        pushed_card_state = event.get("state")
+        except (requests.exceptions.RequestException, ValueError):
+            pass
+        pushed_card_state = None
+        time.sleep(2)
+
 def get_card_state():
     """Get card state from backend (question_showing or answer_showing)"""
+    # Use the pushed state when the event stream is connected, saving a request per gesture
+    if pushed_card_state in ["question_showing", "answer_showing"]:
+        return pushed_card_state
     try:
         response = requests.get(f"{BACKEND_URL}/hardware/card-state", timeout=1)
         if response.status_code == 200:
@@ -159,6 +188,9 @@ def process_sensor_data(distance_x, distance_y):
             sensor_y_state = 'idle'
             sensor_y_buffer.clear()
 
+# Follow card state changes in the background; get_card_state() falls back to HTTP without it
+threading.Thread(target=follow_card_state, daemon=True).start()
+
 try:
     # Establish Arduino connection
     arduino = serial.Serial(ARDUINO_PORT, BAUD_RATE, timeout=1)